@@ -0,0 +1,445 @@
+"""Setup #4 deflection dial, read on a background thread.
+
+The dial streams its readings in mm as little-endian float32 values, over a
+serial port or a TCP socket, at up to several thousand a second.
+``DialAcquisition`` reads them on its own thread into a ``RingBuffer`` (a
+preallocated NumPy array holding the last ``BUFFER_SECONDS``) and hands the
+screen only a decimated view: ``updated`` is emitted at most ``UI_RATE``
+times a second, however fast samples arrive. The readings saved with the
+session are worked out from the buffer with whole-array operations:
+
+* zero - the mean of the last ``ZERO_SECONDS`` when the dial is zeroed
+* peak - the reading furthest from the zero after that
+* settled - the mean of the first ``SETTLE_SECONDS`` after the peak whose
+  readings stay within ``SETTLE_TOLERANCE`` (standard deviation)
+
+The dial is picked with ``PPT_DIAL_SOURCE``:
+
+* ``simulator`` (default) - ``SimulatedDial``, in process
+* ``serial:/dev/ttyUSB0`` or ``serial:COM3@115200`` - needs pyserial
+* ``tcp:127.0.0.1:5025`` - e.g. the simulator served by this module:
+
+    python acquisition.py simulate --port 5025 [--rate 5000]
+    python acquisition.py measure --source tcp:127.0.0.1:5025 --seconds 10
+
+``Acquisition`` is the part shared with the lift's motion sensor (see
+``motion.py``): the thread, the ring buffer, and recording every reading to
+a ``.npy`` sidecar file (``TraceWriter``) that ``load_trace`` memory-maps.
+"""
+import argparse
+import math
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+
+import numpy as np
+from PySide6.QtCore import QObject, Signal
+
+DEFAULT_SOURCE = "simulator"
+SAMPLE_RATE = 2000  # Readings per second sent by the simulator
+MAX_RATE = 20000  # Readings per second the ring buffer is sized for
+BUFFER_SECONDS = 60  # Readings kept, at MAX_RATE
+UI_RATE = 20  # Most updates per second handed to the screen
+ZERO_SECONDS = 0.5
+SETTLE_SECONDS = 0.25
+SETTLE_TOLERANCE = 0.005  # mm
+DECIMALS = 3  # The dial reads to 0.001 mm
+READ_BYTES = 1 << 14  # Most bytes taken from a serial port or socket at a time
+SAMPLE = np.dtype("<f4")
+
+
+class AcquisitionError(Exception):
+    """Raised when the dial cannot be opened or stops sending."""
+
+
+class RingBuffer:
+    """The last ``capacity`` samples in a preallocated array, for one writer thread and any readers."""
+
+    def __init__(self, capacity, dtype=np.float32):
+        self.capacity = capacity
+        self.samples = np.zeros(capacity, dtype)
+        self.total = 0  # Samples written so far, which is also the index of the next one
+        self.lock = threading.Lock()
+
+    def extend(self, chunk):
+        """Append ``chunk``, overwriting the oldest samples."""
+        total = self.total + len(chunk)
+        chunk = chunk[-self.capacity:]
+        start = (total - len(chunk)) % self.capacity
+        first = min(len(chunk), self.capacity - start)
+        with self.lock:
+            self.samples[start:start + first] = chunk[:first]
+            self.samples[:len(chunk) - first] = chunk[first:]
+            self.total = total
+
+    def since(self, index):
+        """Return the index of the first sample still held from ``index`` on, and a copy of them."""
+        with self.lock:
+            index = max(index, self.total - self.capacity, 0)
+            count = self.total - index
+            start = index % self.capacity
+            if start + count <= self.capacity:
+                samples = self.samples[start:start + count].copy()
+            else:
+                samples = np.concatenate((self.samples[start:], self.samples[:start + count - self.capacity]))
+        return index, samples
+
+    def latest(self, count):
+        """A copy of the last ``count`` samples (fewer if not as many were written)."""
+        return self.since(self.total - count)[1]
+
+
+def rounded(value):
+    """``value`` rounded to the dial's ``DECIMALS``; None if it is None or not finite (a garbled frame)."""
+    return round(value, DECIMALS) if value is not None and math.isfinite(value) else None
+
+
+def zero_reading(samples):
+    """The dial's zero: the mean of ``samples``."""
+    return float(samples.mean(dtype=np.float64))
+
+
+def deflection(samples, zero, rate, settle_seconds=SETTLE_SECONDS, tolerance=SETTLE_TOLERANCE):
+    """Peak and settled deflection of ``samples`` from ``zero``; either is None if not found.
+
+    The peak keeps its sign. The settled deflection is the mean of the first
+    window of ``settle_seconds`` after the peak whose standard deviation is
+    within ``tolerance``, found for every window at once from running sums.
+    """
+    if not len(samples):
+        return None, None
+    offsets = samples.astype(np.float64) - zero
+    peak_at = int(np.argmax(np.abs(offsets)))
+    peak = float(offsets[peak_at])
+    window = max(1, int(settle_seconds * rate))
+    after = offsets[peak_at:]
+    if len(after) < window:
+        return peak, None
+    sums = np.concatenate(([0.0], np.cumsum(after)))
+    squares = np.concatenate(([0.0], np.cumsum(after * after)))
+    means = (sums[window:] - sums[:-window]) / window
+    variances = (squares[window:] - squares[:-window]) / window - means * means
+    settled = np.flatnonzero(variances <= tolerance * tolerance)
+    return peak, float(means[settled[0]]) if len(settled) else None
+
+
+class SimulatedDial:
+    """Stands in for the dial: a unit loaded and unloaded again every ``PERIOD`` seconds.
+
+    At rest the dial reads ``OFFSET`` with some noise. Loaded, it rings
+    around ``DEFLECTION`` more, settles, and is unloaded after ``HOLD``
+    seconds. Readings are made as time passes, ``rate`` a second.
+    """
+
+    PERIOD = 8.0
+    REST = 2.0  # Seconds at rest before the load
+    HOLD = 5.0  # Seconds under load
+    OFFSET = 0.137
+    DEFLECTION = 0.5
+    NOISE = 0.001
+    RING_HZ = 6.0
+    DAMPING = 0.12  # Seconds for the ringing to fall to 1/e
+
+    def __init__(self, rate=SAMPLE_RATE, seed=None):
+        self.rate = rate
+        self.random = np.random.default_rng(seed)
+        self.started = time.monotonic()
+        self.sent = 0
+
+    @classmethod
+    def profile(cls, seconds):
+        """Noise-free readings at ``seconds`` (an array) since the dial started."""
+        loaded = seconds % cls.PERIOD - cls.REST
+        held = np.clip(loaded, 0.0, None)
+        ringing = cls.DEFLECTION * (1 - np.exp(-held / cls.DAMPING) * np.cos(2 * np.pi * cls.RING_HZ * held))
+        unloaded = cls.DEFLECTION * np.exp(-np.clip(loaded - cls.HOLD, 0.0, None) / cls.DAMPING)
+        return cls.OFFSET + np.where(loaded < 0, 0.0, np.where(loaded < cls.HOLD, ringing, unloaded))
+
+    def read(self):
+        """The readings due since the last call, waiting for at least one."""
+        while True:
+            due = int((time.monotonic() - self.started) * self.rate)
+            if due > self.sent:
+                break
+            time.sleep(max(1 / self.rate, 0.001))
+        seconds = np.arange(self.sent, due) / self.rate
+        self.sent = due
+        noise = self.random.normal(0.0, self.NOISE, len(seconds))
+        return (self.profile(seconds) + noise).astype(SAMPLE)
+
+    def close(self):
+        pass
+
+
+class StreamSource:
+    """A device sending float32 readings over a byte stream (a serial port or a socket).
+
+    ``read_bytes(n)`` returns up to ``n`` bytes, or none if nothing came in
+    time; it raises ``AcquisitionError`` once the stream is closed.
+    """
+
+    rate = None  # Measured as readings arrive
+
+    def __init__(self, read_bytes, close):
+        self.read_bytes = read_bytes
+        self.close = close
+        self.partial = b""  # The start of a reading split across reads
+
+    def read(self):
+        data = self.partial + self.read_bytes(READ_BYTES)
+        whole = len(data) - len(data) % SAMPLE.itemsize
+        self.partial = data[whole:]
+        return np.frombuffer(data[:whole], SAMPLE)
+
+
+def open_source(source, simulator, device="dial"):
+    """Open the device named by ``source``, with ``simulator()`` for "simulator"; see the module docstring."""
+    kind, _, address = source.partition(":")
+    if kind == "simulator":
+        return simulator()
+    if kind == "serial":
+        try:
+            import serial
+        except ImportError:
+            raise AcquisitionError(f"reading the {device} over a serial port needs pyserial") from None
+        port, _, baudrate = address.partition("@")
+        connection = serial.Serial(port, int(baudrate or 115200), timeout=0.1)
+        return StreamSource(lambda size: connection.read(min(size, max(connection.in_waiting, SAMPLE.itemsize))),
+                            connection.close)
+    if kind == "tcp":
+        host, _, port = address.rpartition(":")
+        connection = socket.create_connection((host or "127.0.0.1", int(port)), timeout=5.0)
+        connection.settimeout(0.1)  # So a stopped acquisition is noticed
+
+        def read_bytes(size):
+            try:
+                data = connection.recv(size)
+            except socket.timeout:
+                return b""
+            if not data:
+                raise AcquisitionError(f"the {device} at {address} closed the connection")
+            return data
+
+        return StreamSource(read_bytes, connection.close)
+    raise AcquisitionError(f"unknown {device} source {source!r}; use simulator, serial:PORT[@BAUD] or tcp:HOST:PORT")
+
+
+def open_dial(source=None):
+    """Open the dial named by ``source`` (default ``PPT_DIAL_SOURCE``)."""
+    return open_source(source or os.environ.get("PPT_DIAL_SOURCE", DEFAULT_SOURCE), SimulatedDial)
+
+
+class TraceWriter:
+    """Full-resolution readings written to a ``.npy`` file as they arrive.
+
+    The header is written first with room for any length and filled in by
+    ``close``, so the file is a plain NumPy array that ``load_trace`` can
+    memory-map, however long the recording.
+    """
+
+    HEADER_BYTES = 128  # Magic, length and the header dict, padded
+
+    def __init__(self, path):
+        self.path = path
+        self.samples = 0
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "wb")
+        self._write_header()
+
+    def _write_header(self):
+        header = repr({"descr": SAMPLE.str, "fortran_order": False, "shape": (self.samples,)})
+        length = self.HEADER_BYTES - len(np.lib.format.magic(1, 0)) - 2
+        self.file.seek(0)
+        self.file.write(np.lib.format.magic(1, 0) + length.to_bytes(2, "little")
+                        + (header.ljust(length - 1) + "\n").encode("latin1"))
+
+    def append(self, chunk):
+        self.file.write(chunk.astype(SAMPLE, copy=False).tobytes())
+        self.samples += len(chunk)
+
+    def close(self):
+        """Finish the file; returns the number of readings in it."""
+        self._write_header()
+        self.file.close()
+        return self.samples
+
+
+def load_trace(path):
+    """A recorded trace as a read-only memory-mapped array, read from disk only where it is used."""
+    return np.load(path, mmap_mode="r")
+
+
+class Acquisition(QObject):
+    """A device read on a background thread into a ``RingBuffer``, optionally recorded to a trace file."""
+
+    updated = Signal(float, float)  # Latest reading, readings per second; at most UI_RATE times a second
+    failed = Signal(str)  # Error message; the device is no longer read
+
+    def __init__(self, source=None, capacity=BUFFER_SECONDS * MAX_RATE):
+        super().__init__()
+        self.source = source  # Name for open_device, or a device object
+        self.buffer = RingBuffer(capacity)
+        self.rate = None  # Readings per second, once known
+        self.error = None  # Why the device stopped being read, as also sent with failed
+        self.stopping = threading.Event()
+        self.thread = None
+        self.trace = None  # TraceWriter while recording
+        self.trace_lock = threading.Lock()
+
+    def open_device(self):
+        raise NotImplementedError
+
+    def start(self):
+        """Start reading the device, if it is not being read already."""
+        if self.thread is not None:
+            if not self.stopping.is_set() and self.thread.is_alive():
+                return
+            self.thread.join()  # Stopped, but maybe still finishing its last read
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._run, name=type(self).__name__, daemon=True)
+        self.thread.start()
+
+    def stop(self, wait=True):
+        """Stop reading the device; the buffered readings are kept."""
+        self.stopping.set()
+        if wait and self.thread is not None:
+            self.thread.join()
+
+    def record(self, path):
+        """Start writing every reading from now on to ``path`` (see ``TraceWriter``)."""
+        trace = TraceWriter(path)
+        with self.trace_lock:
+            previous, self.trace = self.trace, trace
+        if previous is not None:
+            previous.close()
+
+    def stop_recording(self):
+        """Stop recording; returns the number of readings written, or None if not recording."""
+        with self.trace_lock:
+            trace, self.trace = self.trace, None
+        return None if trace is None else trace.close()
+
+    def _run(self):
+        self.error = None
+        try:
+            device = self.source if hasattr(self.source, "read") else self.open_device()
+        except (AcquisitionError, OSError, ValueError) as e:
+            self.error = str(e)
+            self.failed.emit(self.error)
+            return
+        first = started = None
+        next_update = 0.0
+        try:
+            while not self.stopping.is_set():
+                chunk = device.read()
+                if not len(chunk):
+                    continue
+                self.buffer.extend(chunk)
+                with self.trace_lock:
+                    if self.trace is not None:
+                        self.trace.append(chunk)
+                now = time.monotonic()
+                if device.rate:
+                    self.rate = device.rate
+                elif started is None:
+                    first, started = self.buffer.total, now  # Counting from the end of the first read
+                elif now > started:
+                    self.rate = (self.buffer.total - first) / (now - started)
+                if now >= next_update:
+                    next_update = now + 1 / UI_RATE
+                    self.updated.emit(float(chunk.mean(dtype=np.float64)), self.rate or 0.0)
+        except (AcquisitionError, OSError) as e:
+            self.error = str(e)
+            self.failed.emit(self.error)
+        finally:
+            device.close()
+
+    def mark(self):
+        """Index of the next reading."""
+        return self.buffer.total
+
+
+class DialAcquisition(Acquisition):
+    """The Setup #4 deflection dial."""
+
+    def open_device(self):
+        return open_dial(self.source)
+
+    def zero(self):
+        """The zero reading over the last ``ZERO_SECONDS``, or None if the dial has not been read (or read garbage)."""
+        samples = self.buffer.latest(int(ZERO_SECONDS * (self.rate or SAMPLE_RATE)))
+        return rounded(zero_reading(samples)) if len(samples) else None
+
+    def measure(self, start, zero):
+        """Peak and settled deflection from ``zero`` of the readings since ``start`` (see ``mark``).
+
+        Either is None if not found, or not finite (a garbled frame read as NaN).
+        """
+        peak, settled = deflection(self.buffer.since(start)[1], zero, self.rate or SAMPLE_RATE)
+        return rounded(peak), rounded(settled)
+
+
+class SimulatorHandler(socketserver.BaseRequestHandler):
+    """Send one connection a simulated device's readings until it hangs up."""
+
+    def handle(self):
+        device = self.server.simulator(self.server.rate)
+        try:
+            while True:
+                self.request.sendall(device.read().tobytes())
+        except OSError:
+            pass
+
+
+class SimulatorServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    simulate = commands.add_parser("simulate", help="serve a simulated dial or lift on a local TCP port")
+    simulate.add_argument("--device", choices=("dial", "lift"), default="dial")
+    simulate.add_argument("--port", type=int, default=5025)
+    simulate.add_argument("--rate", type=int, help="readings per second (default: the simulator's own)")
+    measure = commands.add_parser("measure", help="read a dial and print its zero, peak and settled readings")
+    measure.add_argument("--source", help="dial to read (default: PPT_DIAL_SOURCE or simulator)")
+    measure.add_argument("--seconds", type=float, default=10.0, help="seconds to read after zeroing")
+    args = parser.parse_args()
+
+    if args.command == "simulate":
+        if args.device == "lift":
+            from motion import LIFT_RATE, SimulatedLift
+
+            simulator, rate = SimulatedLift, args.rate or LIFT_RATE
+        else:
+            simulator, rate = SimulatedDial, args.rate or SAMPLE_RATE
+        server = SimulatorServer(("127.0.0.1", args.port), SimulatorHandler)
+        server.simulator, server.rate = simulator, rate
+        print(f"Simulated {args.device} on 127.0.0.1:{args.port}, {rate} readings/s", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        return
+
+    acquisition = DialAcquisition(args.source)  # Without an event loop; its signals go nowhere
+    acquisition.start()
+    time.sleep(ZERO_SECONDS * 2)
+    zero, start = acquisition.zero(), acquisition.mark()
+    time.sleep(args.seconds)
+    acquisition.stop()
+    if acquisition.error or zero is None:
+        sys.exit(f"Could not read the dial: {acquisition.error or 'no readings'}")
+    peak, settled = acquisition.measure(start, zero)
+    print(f"zero {zero} mm, peak {peak} mm, settled {settled} mm, {acquisition.rate:.0f} readings/s")
+
+
+if __name__ == "__main__":
+    main()
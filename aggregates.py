@@ -0,0 +1,306 @@
+"""Materialized session, setup and failure counts for the supervisors' dashboard.
+
+``user_details.aggregates.db`` (SQLite) holds two tables:
+
+* ``facts`` - one row per session: device serial, operator, day (as
+  YYYY-MM-DD) and what the session counts for, as ``facts`` reads it from
+  the record: the setups done (a bit per setup number, for each setup with
+  results saved) and the failures (reach markers missed).
+* ``totals`` - the sums of those rows per ``(dimension, key)``: everything
+  (``"all"``, key ""), each operator, each device and each day. Sessions,
+  sessions completed (Setups #2 to #4 all done), setups done and failures.
+
+They are kept up to date as sessions are saved rather than recomputed:
+``apply_batch`` takes each batch the store has just written (``StoreWriter``
+calls ``AggregateUpdater`` after every batch, ``HeadlessEngine`` after every
+batch of units), takes the session's old facts row out of the totals and
+puts its new one in. Applying the same record twice changes nothing, so a
+batch seen twice, or read again by ``sync``, is harmless. ``sync`` catches up
+with sessions written elsewhere (another station, the migration) from the
+store's change token, as ``SessionTable.sync`` does, and ``check`` rebuilds
+the totals from a scan of the store and lists where the tables differ.
+
+A dashboard query reads one ``totals`` row by its primary key, or the most
+recent days in key order, whatever the size of the history.
+
+    python aggregates.py show operator line-3
+    python aggregates.py check
+    python aggregates.py rebuild
+"""
+import json
+import sqlite3
+import sys
+import threading
+
+from session_record import SessionRecord
+from storage import changes_to_sync
+from workflow import MARKER_SETUPS, MOTION_SETUPS
+
+AGGREGATES_PATH = "user_details.aggregates.db"
+DIMENSIONS = ("all", "operator", "device", "day")
+COUNTS = ("sessions", "completed", "setups", "failures")
+COMPLETION_SETUPS = (2, 3, 4)  # Setups a session must have done to count as completed
+ZERO = dict.fromkeys(COUNTS, 0)
+FACTS_VERSION = 2  # How ``facts`` reads a record; tables counted another way are rescanned by ``sync``
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS facts (
+    session_id TEXT PRIMARY KEY,
+    device_sn TEXT NOT NULL,
+    operator TEXT NOT NULL,
+    day TEXT NOT NULL,
+    setups INTEGER NOT NULL,
+    failures INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS totals (
+    dimension TEXT NOT NULL,
+    key TEXT NOT NULL,
+    sessions INTEGER NOT NULL,
+    completed INTEGER NOT NULL,
+    setups INTEGER NOT NULL,
+    failures INTEGER NOT NULL,
+    PRIMARY KEY (dimension, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+GET_FACTS_SQL = "SELECT device_sn, operator, day, setups, failures FROM facts WHERE session_id = ?"
+PUT_FACTS_SQL = "INSERT OR REPLACE INTO facts VALUES (?, ?, ?, ?, ?, ?)"
+ADD_SQL = ("INSERT INTO totals VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(dimension, key) DO UPDATE SET "
+           "sessions = sessions + excluded.sessions, completed = completed + excluded.completed, "
+           "setups = setups + excluded.setups, failures = failures + excluded.failures")
+GET_TOTALS_SQL = "SELECT sessions, completed, setups, failures FROM totals WHERE dimension = ? AND key = ?"
+GET_META_SQL = "SELECT value FROM meta WHERE key = ?"
+SET_META_SQL = "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)"
+
+
+def facts(record):
+    """What a stored session counts for: ``(device_sn, operator, day, setups, failures)``.
+
+    ``setups`` has bit ``1 << n`` set for each Setup #n with its results
+    saved. "Completed Setups" is not trusted: it is what the main screen
+    showed, and does not say the results made it to the store.
+    """
+    typed = SessionRecord.from_dict(record)
+    done = set()
+    for setup in MARKER_SETUPS:
+        if getattr(typed, f"setup{setup}_reached") is not None:
+            done.add(setup)
+    if typed.setup4_zeroed and typed.setup4_recorded:
+        done.add(4)
+    for setup in MOTION_SETUPS:
+        if record.get(f"Setup{setup} - Motion Trace"):
+            done.add(setup)
+    failures = sum(getattr(typed, f"setup{setup}_reached") is False for setup in MARKER_SETUPS)
+    return (typed.device_sn, typed.operator, typed.date.isoformat() if typed.date else "",
+            sum(1 << setup for setup in done), failures)
+
+
+def counts(row):
+    """The counts one facts row adds to each of its totals."""
+    setups = row[3]
+    completed = all(setups & 1 << setup for setup in COMPLETION_SETUPS)
+    return (1, int(completed), bin(setups).count("1"), row[4])
+
+
+def keys(row):
+    """The ``(dimension, key)`` totals a facts row counts towards."""
+    device_sn, operator, day = row[:3]
+    return (("all", ""), ("operator", operator), ("device", device_sn), ("day", day))
+
+
+def scan(store):
+    """Facts of every session in ``store`` and the totals they add up to, built in memory."""
+    rows, totals = {}, {}
+    for session_id, record in store.iter_sessions():
+        row = rows[session_id] = facts(record)
+        added = counts(row)
+        for key in keys(row):
+            found = totals.setdefault(key, [0, 0, 0, 0])
+            for i, value in enumerate(added):
+                found[i] += value
+    return rows, totals
+
+
+class Aggregates:
+    """The aggregate tables; safe to share between threads (one write at a time)."""
+
+    def __init__(self, path=AGGREGATES_PATH):
+        self.path = path
+        # The automated line applies batches from whichever connection thread saved them
+        self.conn = sqlite3.connect(path, timeout=30.0, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    def _meta(self, key):
+        found = self.conn.execute(GET_META_SQL, (key,)).fetchone()
+        return json.loads(found[0]) if found else None
+
+    def _add(self, row, sign):
+        added = [sign * value for value in counts(row)]
+        self.conn.executemany(ADD_SQL, [(*key, *added) for key in keys(row)])
+
+    def _apply(self, session_id, record):
+        """Count ``record`` as the session's current state, in place of what it was counted as before."""
+        row = facts(record)
+        old = self.conn.execute(GET_FACTS_SQL, (session_id,)).fetchone()
+        if old == row:
+            return
+        if old is not None:
+            self._add(old, -1)
+        self._add(row, 1)
+        self.conn.execute(PUT_FACTS_SQL, (session_id, *row))
+
+    def apply_batch(self, store, operations):
+        """Count a batch of ``(op, session_id, data)`` operations ``store`` has just written.
+
+        An update carries only the setup's results, so the session is read
+        back from ``store`` in full.
+        """
+        with self.lock, self.conn:
+            for op, session_id, data in operations:
+                if op == "update":
+                    try:
+                        data = store.get_session(session_id)
+                    except KeyError:
+                        continue
+                self._apply(session_id, data)
+
+    def sync(self, store):
+        """Catch up with ``store``; return how many sessions were (re)read."""
+        with self.lock:
+            # Facts counted by an older build are counted again from every session
+            source = self._meta("source") if self._meta("facts") == FACTS_VERSION else None
+            source, token, changed = changes_to_sync(store, source, self._meta("token"))
+            if changed == []:
+                return 0
+            if changed is None:
+                rows, totals = scan(store)
+                with self.conn:
+                    self._replace(rows, totals)
+                    self._set_token(source, token)
+                return len(rows)
+            with self.conn:
+                for session_id in changed:
+                    try:
+                        self._apply(session_id, store.get_session(session_id))
+                    except KeyError:
+                        continue
+                self._set_token(source, token)
+            return len(changed)
+
+    def _set_token(self, source, token):
+        self.conn.execute(SET_META_SQL, ("source", json.dumps(source)))
+        self.conn.execute(SET_META_SQL, ("token", json.dumps(token)))
+        self.conn.execute(SET_META_SQL, ("facts", json.dumps(FACTS_VERSION)))
+
+    def _replace(self, rows, totals):
+        self.conn.execute("DELETE FROM facts")
+        self.conn.execute("DELETE FROM totals")
+        self.conn.executemany(PUT_FACTS_SQL, ((session_id, *row) for session_id, row in rows.items()))
+        self.conn.executemany("INSERT INTO totals VALUES (?, ?, ?, ?, ?, ?)",
+                              ((*key, *values) for key, values in totals.items()))
+
+    def rebuild(self, store):
+        """Recount everything from a scan of ``store``; return the number of sessions."""
+        token = store.change_token()
+        rows, totals = scan(store)
+        with self.lock, self.conn:
+            self._replace(rows, totals)
+            self._set_token(type(store).__name__, token)
+        return len(rows)
+
+    def check(self, store):
+        """Rebuild the totals from ``store`` in memory and diff them against the tables.
+
+        Returns ``(dimension, key, count, stored, expected)`` for each count
+        that differs; a total missing from the table counts as zeros. Saves
+        still queued for ``store`` show up as differences, so flush first.
+        """
+        _, expected = scan(store)
+        with self.lock:
+            stored = {(dimension, key): values for dimension, key, *values in self.conn.execute(
+                "SELECT dimension, key, sessions, completed, setups, failures FROM totals")}
+        differences = []
+        for key in sorted(expected.keys() | stored.keys()):
+            for count, have, want in zip(COUNTS, stored.get(key, ZERO.values()), expected.get(key, ZERO.values())):
+                if have != want:
+                    differences.append((*key, count, have, want))
+        return differences
+
+    def totals(self, dimension, key=""):
+        """The counts of one operator, device or day (or of everything), as a dict."""
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"No totals by {dimension}")
+        found = self.conn.execute(GET_TOTALS_SQL, (dimension, key)).fetchone()
+        return dict(zip(COUNTS, found)) if found else dict(ZERO)
+
+    def rows(self, dimension, descending=False, limit=None):
+        """``(key, counts)`` of each total of ``dimension`` in key order, at most ``limit`` of them.
+
+        Walks the primary key, so the most recent ``limit`` days cost the
+        same however many days there are.
+        """
+        if dimension not in DIMENSIONS:
+            raise ValueError(f"No totals by {dimension}")
+        sql = ("SELECT key, sessions, completed, setups, failures FROM totals WHERE dimension = ? "
+               f"ORDER BY key {'DESC' if descending else 'ASC'} LIMIT ?")
+        return [(key, dict(zip(COUNTS, values)))
+                for key, *values in self.conn.execute(sql, (dimension, -1 if limit is None else limit))]
+
+    def close(self):
+        self.conn.close()
+
+
+class AggregateUpdater:
+    """``StoreWriter``'s ``after_write``: counts each written batch in the aggregates.
+
+    The tables are opened on the first batch, on the writer's thread, so
+    start-up does not wait for them.
+    """
+
+    def __init__(self, path=AGGREGATES_PATH):
+        self.path = path
+        self.aggregates = None
+
+    def __call__(self, store, batch):
+        if self.aggregates is None:
+            self.aggregates = Aggregates(self.path)
+        self.aggregates.apply_batch(store, batch)
+
+
+def main():
+    from storage import open_store
+
+    command = sys.argv[1] if len(sys.argv) > 1 else "check"
+    store = open_store()
+    aggregates = Aggregates()
+    try:
+        if command == "show" and len(sys.argv) >= 3:
+            dimension, key = sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else ""
+            aggregates.sync(store)
+            print(json.dumps(aggregates.totals(dimension, key)))
+        elif command == "rebuild":
+            print(f"Counted {aggregates.rebuild(store)} sessions")
+        elif command == "check":
+            aggregates.sync(store)
+            differences = aggregates.check(store)
+            for dimension, key, count, stored, expected in differences:
+                print(f"{dimension} {key!r} {count}: stored {stored}, expected {expected}")
+            print(f"{len(differences)} differences")
+            if differences:
+                sys.exit(1)
+        else:
+            sys.exit("usage: python aggregates.py show <dimension> [key] | check | rebuild")
+    finally:
+        aggregates.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Generated sessions shared by the benchmarks.
+
+Forty operators, about three sessions per serial and a thousand sessions a
+day from ``FIRST_DAY``. Every seventh session misses Setup #2's marker and
+every fifth leaves Setup #3 and #4 out; the rest miss Setup #3's marker
+every eleventh time and read Setup #4 by the dial. Heights and dial
+readings are seeded by the session's number, so a session is the same
+every time it is generated.
+"""
+import datetime
+import random
+
+from workflow import deflection_result, marker_result, new_session
+
+FIRST_DAY = datetime.date(2022, 1, 3)
+
+
+def generated_session(i):
+    """The ``i``-th session."""
+    readings = random.Random(i)
+    day = FIRST_DAY + datetime.timedelta(days=i // 1000)
+    record = new_session(f"SN{i // 3:08d}", f"operator-{i % 40}", day.isoformat())
+    record.update(marker_result(2, "Yes" if i % 7 else "No", "" if i % 7 else f"{readings.gauss(480, 2):.1f}"))
+    if i % 5:
+        record.update(marker_result(3, "Yes" if i % 11 else "No", "" if i % 11 else f"{readings.gauss(610, 3):.1f}"))
+        settled = readings.gauss(0.5, 0.03)
+        record.update(deflection_result(0.137, settled + abs(readings.gauss(0.1, 0.02)), settled))
+    return record
+
+
+class GeneratedStore:
+    """Just enough of a store for the caches built from it, without writing ``sessions`` sessions anywhere.
+
+    Raise ``sessions`` to add new ones as stations would; sessions written
+    through ``write_batch`` are kept in a dict on top.
+    """
+
+    def __init__(self, sessions):
+        self.sessions = sessions
+        self.written = {}
+
+    def change_token(self):
+        return self.sessions
+
+    def changes_since(self, token):
+        return None if token is None else [f"s{i}" for i in range(token, self.sessions)]
+
+    def iter_sessions(self):
+        for i in range(self.sessions):
+            yield f"s{i}", generated_session(i)
+        yield from self.written.items()
+
+    def iter_records(self):
+        for _, record in self.iter_sessions():
+            yield record
+
+    def get_session(self, session_id):
+        if session_id in self.written:
+            return self.written[session_id]
+        return generated_session(int(session_id[1:]))
+
+    def write_batch(self, operations):
+        for op, session_id, data in operations:
+            if op == "create":
+                self.written[session_id] = dict(data)
+            else:
+                self.written[session_id].update(data)
@@ -0,0 +1,94 @@
+"""Benchmark the Setup #4 dial acquisition.
+
+Times ``RingBuffer.extend`` for small and large reads and the vectorized
+zero/peak/settled analysis over a full buffer of readings, then reads the
+bundled simulator over a local TCP socket at each ``--rates`` for
+``--seconds`` and reports the readings kept against those sent, the
+updates the screen would have been sent, and the CPU time the process used
+(the simulator serving the readings included).
+
+    python benchmarks/bench_acquisition.py
+    python benchmarks/bench_acquisition.py --rates 2000 20000 --seconds 10
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+from PySide6.QtCore import QCoreApplication
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import acquisition  # noqa: E402
+from acquisition import (DialAcquisition, RingBuffer, SimulatedDial, SimulatorHandler,  # noqa: E402
+                         SimulatorServer, deflection)
+
+
+def best(run, repeat=5):
+    """Best of ``repeat`` timings of ``run()``, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rates", type=int, nargs="+", default=[2000, 10000, 20000], help="readings per second")
+    parser.add_argument("--seconds", type=float, default=5.0, help="seconds to read at each rate")
+    args = parser.parse_args()
+
+    capacity = acquisition.BUFFER_SECONDS * acquisition.MAX_RATE
+    for size in (20, 1000):
+        ring = RingBuffer(capacity)
+        chunk = np.ones(size, np.float32)
+        chunks = capacity // size
+        seconds = best(lambda: [ring.extend(chunk) for _ in range(chunks)], repeat=3)
+        print(f"extend {size:5d} readings at a time  {chunks * size / seconds / 1e6:8.1f} M readings/s")
+
+    for rate in (2000, 20000):
+        readings = (SimulatedDial.profile(np.arange(int(SimulatedDial.PERIOD * rate)) / rate)
+                    + np.random.default_rng(1).normal(0, SimulatedDial.NOISE, int(SimulatedDial.PERIOD * rate)))
+        readings = readings.astype(np.float32)
+        peak, settled = deflection(readings, SimulatedDial.OFFSET, rate)
+        assert abs(settled - SimulatedDial.DEFLECTION) < 0.005, settled
+        seconds = best(lambda: deflection(readings, SimulatedDial.OFFSET, rate))
+        print(f"analyse {len(readings):7d} readings ({rate} Hz)  {seconds * 1e3:8.2f} ms, "
+              f"peak {peak:.3f} mm, settled {settled:.3f} mm")
+
+    app = QCoreApplication.instance() or QCoreApplication([])
+    server = SimulatorServer(("127.0.0.1", 0), SimulatorHandler)
+    server.simulator = SimulatedDial
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+    try:
+        for rate in args.rates:
+            server.rate = rate
+            dial = DialAcquisition(f"tcp:127.0.0.1:{port}")
+            updates = []
+            dial.updated.connect(lambda reading, measured: updates.append(reading))
+            cpu, started = time.process_time(), time.perf_counter()
+            dial.start()
+            while time.perf_counter() - started < args.seconds:
+                app.processEvents()  # Delivers the updates, as the screen's event loop would
+                time.sleep(0.005)
+            dial.stop()
+            app.processEvents()
+            elapsed = time.perf_counter() - started
+            cpu = time.process_time() - cpu
+            assert dial.error is None, dial.error
+            print(f"tcp {rate:6d} Hz: {dial.buffer.total} readings kept in {elapsed:.1f} s "
+                  f"(about {rate * elapsed:.0f} sent), measured {dial.rate:.0f}/s, "
+                  f"{len(updates) / elapsed:.0f} updates/s, CPU {cpu / elapsed * 100:.1f}%")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Benchmark the dashboard's materialized aggregates against the size of the history.
+
+For each of ``--sessions`` builds the aggregate tables from that many
+generated sessions (40 operators, a thousand sessions a day) and times:
+rebuilding them from a scan of the store, a dashboard refresh (today's
+totals, everything's, one device's, the operators and the last 90 days),
+counting one saved batch as ``StoreWriter`` does (a new session, then a
+setup's results for it) and the consistency check. A refresh and a saved
+batch should cost the same at every size; a rebuild and a check grow with
+the history. Checks that the totals kept up to date match a rebuild.
+
+    python benchmarks/bench_aggregates.py
+    python benchmarks/bench_aggregates.py --sessions 1000 100000
+"""
+import argparse
+import datetime
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from aggregates import Aggregates  # noqa: E402
+from dashboard import DAY_ROWS, OPERATOR_ROWS  # noqa: E402
+from workflow import marker_result, new_session  # noqa: E402
+
+from _fixtures import FIRST_DAY, GeneratedStore  # noqa: E402
+
+WRITES = 200  # Batches counted per size
+
+
+def refresh(aggregates, today, device_sn):
+    """What ``DashboardScreen.refresh`` reads."""
+    return (aggregates.totals("day", today), aggregates.totals("all"), aggregates.totals("device", device_sn),
+            aggregates.rows("operator", limit=OPERATOR_ROWS),
+            aggregates.rows("day", descending=True, limit=DAY_ROWS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[10_000, 100_000, 1_000_000],
+                        help="sessions in the history")
+    args = parser.parse_args()
+
+    print(f"{'sessions':>10} {'rebuild s':>10} {'refresh ms':>11} {'batch ms':>9} {'check s':>9}")
+    for sessions in args.sessions:
+        with tempfile.TemporaryDirectory() as workdir:
+            store = GeneratedStore(sessions)
+            aggregates = Aggregates(os.path.join(workdir, "aggregates.db"))
+            started = time.perf_counter()
+            aggregates.rebuild(store)
+            rebuild = time.perf_counter() - started
+
+            today = (FIRST_DAY + datetime.timedelta(days=(sessions - 1) // 1000)).isoformat()
+            timings = []
+            for _ in range(WRITES):
+                started = time.perf_counter()
+                refresh(aggregates, today, "SN00000001")
+                timings.append((time.perf_counter() - started) * 1e3)
+            query = statistics.median(timings)
+
+            timings = []
+            for i in range(WRITES):
+                session_id = f"new{i}"
+                record = new_session(f"NEW{i}", "operator-1", today)
+                for batch in ([("create", session_id, record)], [("update", session_id, marker_result(2, "No", "1"))]):
+                    store.write_batch(batch)
+                    started = time.perf_counter()
+                    aggregates.apply_batch(store, batch)
+                    timings.append((time.perf_counter() - started) * 1e3)
+            write = statistics.median(timings)
+
+            started = time.perf_counter()
+            differences = aggregates.check(store)
+            check = time.perf_counter() - started
+            assert not differences, differences[:5]
+            aggregates.close()
+        print(f"{sessions:>10} {rebuild:>10.2f} {query:>11.3f} {write:>9.3f} {check:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
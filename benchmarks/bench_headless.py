@@ -0,0 +1,59 @@
+"""Benchmark headless throughput in sessions per second.
+
+Feeds ``--units`` generated units (details plus every setup) through
+``HeadlessEngine.run_stream``, as ``python headless.py stdin`` does, into an
+empty store of each backend, with one unit per store write and with the
+default batch size.
+
+    python benchmarks/bench_headless.py
+    python benchmarks/bench_headless.py --units 50000 --backends log sqlite
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from headless import BATCH_SIZE, HeadlessEngine  # noqa: E402
+from storage import open_store  # noqa: E402
+
+
+def units(count):
+    for i in range(count):
+        missed = i % 3 == 0
+        yield json.dumps({
+            "device_sn": f"SN{i:07d}",
+            "operator": f"line-{i % 4}",
+            "date": f"2024-05-{1 + i % 28:02d}",
+            "setup2": {"marker": "No" if missed else "Yes", "measured_max_height": str(40 + i % 7) if missed else ""},
+            "setup3": {"marker": "Yes"},
+            "setup4": True,
+        }) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--units", type=int, default=20000, help="Units per run")
+    parser.add_argument("--backends", nargs="+", default=["log", "sqlite", "segments"], help="Store backends to try")
+    args = parser.parse_args()
+
+    lines = list(units(args.units))
+    print(f"{'backend':>8} {'batch':>6} {'seconds':>8} {'sessions/s':>11}")
+    for backend in args.backends:
+        for batch_size in (1, BATCH_SIZE):
+            with tempfile.TemporaryDirectory() as workdir:
+                os.chdir(workdir)
+                store = open_store(backend)  # Empty directory, so nothing to import
+                engine = HeadlessEngine(store, batch_size)
+                saved, rejected, seconds = engine.run_stream(lines, lambda text: None)
+                store.close()
+                os.chdir(ROOT)
+            assert saved == args.units and not rejected
+            print(f"{backend:>8} {batch_size:6d} {seconds:8.3f} {saved / seconds:11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark history index lookups at a million sessions.
+
+Builds the device serial and operator index for ``--sessions`` generated
+sessions (about three per serial), adds a few thousand more through the
+delta as stations would, then times ``count`` for known and unknown serials
+and ``complete`` for short prefixes. For comparison it also times one scan
+of the records in memory, the least that answering "tested before?" costs
+without an index.
+
+    python benchmarks/bench_history_index.py
+    python benchmarks/bench_history_index.py --sessions 100000 --lookups 5000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from history_index import HistoryIndex  # noqa: E402
+
+from _fixtures import GeneratedStore  # noqa: E402
+
+DELTA_SESSIONS = 5000
+
+
+def timed(lookup, arguments):
+    """Microseconds per call of ``lookup`` for each of ``arguments``."""
+    timings = []
+    for argument in arguments:
+        started = time.perf_counter()
+        lookup(*argument)
+        timings.append((time.perf_counter() - started) * 1e6)
+    timings.sort()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=1_000_000, help="Sessions in the index")
+    parser.add_argument("--lookups", type=int, default=20000, help="Lookups of each kind")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        index = HistoryIndex()
+        started = time.perf_counter()
+        index.rebuild(GeneratedStore(args.sessions))
+        print(f"rebuilt from {args.sessions} sessions in {time.perf_counter() - started:.2f}s")
+        index.add([{"device_sn": f"NEW{i:06d}", "operator": "operator-new"} for i in range(DELTA_SESSIONS)])
+
+        serials = args.sessions // 3
+        known = [("device_sn", f"SN{random.randrange(serials):08d}") for _ in range(args.lookups)]
+        unknown = [("device_sn", f"XX{random.randrange(serials):08d}") for _ in range(args.lookups)]
+        delta = [("device_sn", f"NEW{random.randrange(DELTA_SESSIONS):06d}") for _ in range(args.lookups)]
+        prefixes = [("device_sn", f"SN{random.randrange(serials):08d}"[:random.randint(3, 8)])
+                    for _ in range(args.lookups)]
+        operators = [("operator", f"operator-{random.randrange(40)}"[:random.randint(1, 11)])
+                     for _ in range(args.lookups)]
+        results = [
+            ("count, known serial", timed(index.count, known)),
+            ("count, unknown serial", timed(index.count, unknown)),
+            ("count, serial in delta", timed(index.count, delta)),
+            ("complete serial prefix", timed(index.complete, prefixes)),
+            ("complete operator", timed(index.complete, operators)),
+        ]
+        assert index.count("device_sn", "SN00000000") == 3
+        assert index.total() == args.sessions + DELTA_SESSIONS
+        os.chdir(ROOT)
+
+    records = [{"device_sn": record["device_sn"], "operator": record["operator"]}
+               for record in GeneratedStore(args.sessions).iter_records()]
+    started = time.perf_counter()
+    sum(1 for record in records if record["device_sn"] == "SN00000001")
+    scan = (time.perf_counter() - started) * 1e6
+
+    print(f"{'lookup':<24} {'median us':>10} {'p99 us':>8} {'max us':>8}")
+    for name, timings in results:
+        p99 = timings[int(len(timings) * 0.99) - 1]
+        print(f"{name:<24} {statistics.median(timings):10.1f} {p99:8.1f} {timings[-1]:8.1f}")
+    print(f"{'scan of the records':<24} {scan:10.0f}")
+
+
+if __name__ == "__main__":
+    main()
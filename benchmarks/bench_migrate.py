@@ -0,0 +1,141 @@
+"""Benchmark migrating a legacy ``user_details.json`` into each backend.
+
+Writes a legacy file of ``--records`` sessions as the older builds saved
+them (``QDate.toString()`` and ISO dates, heights with a decimal comma or
+"mm", Setup #4 flags left ``False``, keys missing, the odd non-record item),
+then for each backend migrates it once straight through and once stopped
+halfway and resumed, checking that the resumed run stored every session
+exactly once. Reports records/s and MB/s, and the peak memory the stopped
+and resumed runs allocated (traced separately, as tracing slows them down).
+Reading the source keeps that flat; what grows with the file is the log and
+segments stores' own index of session ids.
+
+    python benchmarks/bench_migrate.py
+    python benchmarks/bench_migrate.py --records 1000000 --backends sqlite
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from migrate import Migration  # noqa: E402
+from storage import open_store  # noqa: E402
+
+DAYS = ("Mon Jan 1 2024", "Tue Feb 6 2024", "2024-03-05", "Wed Apr 3 2024")
+
+
+def legacy_record(i):
+    """A session as one of the older builds may have saved it."""
+    record = {"device_sn": f"SN{i:08d}", "operator": f"operator-{i % 40}", "date": DAYS[i % len(DAYS)]}
+    if i % 10 == 0:
+        return record  # Saved before any setup was done, by a build without the placeholders
+    record["Setup2 - Unit Reach Marker"] = "Yes" if i % 7 else "No"
+    record["Setup2 - Measured Max Height"] = f"{10 + i % 50},5 mm" if i % 3 == 0 else f"{10 + i % 50}"
+    record["Setup3 - Unit Reach Marker"] = "Yes"
+    record["Setup3 - Measured Max Height"] = "n/a" if i % 97 == 0 else None
+    record["Setup4 - Click to Zero Vertical Position Dial"] = "Yes"
+    record["Setup4 - Click to record vertical deflection"] = False if i % 5 == 0 else "Yes"
+    return record
+
+
+def write_legacy(path, records):
+    """Write the list the way ``json.dump(..., indent=4)`` did, without holding it in memory."""
+    with open(path, "w") as f:
+        f.write("[\n")
+        for i in range(records):
+            item = "not a session" if i % 1000 == 999 else legacy_record(i)
+            text = json.dumps(item, indent=4)
+            f.write(("    " + text.replace("\n", "\n    ")) + (",\n" if i < records - 1 else "\n"))
+        f.write("]")
+
+
+def clean(workdir):
+    """Remove everything but the source: stores, checkpoint and anomaly log."""
+    for name in os.listdir(workdir):
+        path = os.path.join(workdir, name)
+        if name == "user_details.json":
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+class Stop(Exception):
+    pass
+
+
+def migrate(source, backend, stop_at=None, trace=False):
+    """Run a migration, stopping once ``stop_at`` records are read; returns (state, seconds, peak bytes)."""
+    store = open_store(backend, legacy_path="")
+
+    def progress(state, rate):
+        if stop_at is not None and state["records"] >= stop_at:
+            raise Stop
+
+    try:
+        migration = Migration(source, store, backend)
+        if trace:
+            tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            state = migration.run(progress)
+        except Stop:
+            state = migration.state
+        seconds = time.perf_counter() - started
+        peak = tracemalloc.get_traced_memory()[1] if trace else None
+        tracemalloc.stop()
+    finally:
+        store.close()
+    return state, seconds, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=200_000, help="Sessions in the legacy file")
+    parser.add_argument("--backends", nargs="+", default=["log", "segments", "sqlite"])
+    args = parser.parse_args()
+
+    import migrate as migrate_module
+
+    migrate_module.REPORT_EVERY = 0  # Call progress after every batch, so the run can be stopped halfway
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)  # The stores live in the working directory
+        source = os.path.join(workdir, "user_details.json")
+        write_legacy(source, args.records)
+        size = os.path.getsize(source)
+        expected = args.records - args.records // 1000
+        print(f"{args.records} records, {size / 1e6:.1f} MB")
+        for backend in args.backends:
+            clean(workdir)
+            state, seconds, _ = migrate(source, backend)
+            assert state["done"] and state["migrated"] == expected
+
+            clean(workdir)
+            first, _, first_peak = migrate(source, backend, stop_at=args.records // 2, trace=True)
+            assert not first["done"]
+            resumed, _, resumed_peak = migrate(source, backend, trace=True)
+            assert resumed["done"] and resumed["migrated"] == expected
+            store = open_store(backend, legacy_path="")
+            try:
+                stored = sum(1 for _ in store.iter_sessions())
+            finally:
+                store.close()
+            assert stored == expected, (stored, expected)  # Each session once
+
+            print(f"{backend}:")
+            print(f"  migrate  {args.records / seconds:10.0f} records/s, {size / seconds / 1e6:.1f} MB/s, "
+                  f"{state['anomalies']} anomalies")
+            print(f"  resumed  {first['records']} + {resumed['records'] - first['records']} records, "
+                  f"{stored} sessions stored, {max(first_peak, resumed_peak) / 1e6:.1f} MB peak")
+
+
+if __name__ == "__main__":
+    main()
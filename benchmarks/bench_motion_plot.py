@@ -0,0 +1,89 @@
+"""Benchmark redrawing the lift motion plot against the sample rate.
+
+For each ``--rates`` fills a ring buffer with ``WINDOW_SECONDS`` of the
+simulated lift's readings and times one frame of ``MotionPlot`` (the
+decimated envelope, two points per pixel column) painted into an image
+``--width`` pixels wide, against a naive frame that draws every reading in
+the window as one polyline. Reports milliseconds per frame and the frame
+rate each could keep up, next to the ``FPS`` the screen asks for.
+
+    python benchmarks/bench_motion_plot.py
+    python benchmarks/bench_motion_plot.py --rates 1000 100000 --width 1920
+"""
+import argparse
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PySide6.QtGui import QImage, QPainter, QPen  # noqa: E402
+from PySide6.QtWidgets import QApplication  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from acquisition import SAMPLE, RingBuffer  # noqa: E402
+from motion import BACKGROUND, FPS, TRACE_COLOR, WINDOW_SECONDS, MotionPlot, SimulatedLift, polyline  # noqa: E402
+
+
+def best(run, repeat=5):
+    """Best of ``repeat`` timings of ``run()``, in seconds."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def lift_buffer(rate):
+    """A ring buffer holding a window and a half of simulated lift readings at ``rate``."""
+    count = int(WINDOW_SECONDS * rate * 1.5)
+    readings = (SimulatedLift.profile(np.arange(count) / rate)
+                + np.random.default_rng(1).normal(0, SimulatedLift.NOISE, count))
+    buffer = RingBuffer(int(WINDOW_SECONDS * rate * 2))
+    buffer.extend(readings.astype(SAMPLE))
+    return buffer
+
+
+def paint_naive(image, buffer, window):
+    """Every reading in the window, one point each, as the plot would without decimating."""
+    samples = buffer.latest(window).astype(np.float64)
+    low, high = float(samples.min()), float(samples.max())
+    scale = (image.height() - 1) / max(high - low, 1e-9)
+    xs = np.linspace(0, image.width() - 1, len(samples))
+    painter = QPainter(image)
+    painter.fillRect(image.rect(), BACKGROUND)
+    painter.setPen(QPen(TRACE_COLOR, 1))
+    painter.drawPolyline(polyline(xs, (high - samples) * scale))
+    painter.end()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rates", type=int, nargs="+", default=[1000, 10000, 50000, 100000],
+                        help="readings per second")
+    parser.add_argument("--width", type=int, default=1200, help="plot width in pixels")
+    parser.add_argument("--height", type=int, default=400, help="plot height in pixels")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication([])  # noqa: F841 (widgets need one)
+    image = QImage(args.width, args.height, QImage.Format_ARGB32_Premultiplied)
+    print(f"{args.width}x{args.height} px, {WINDOW_SECONDS:.0f} s window, {FPS} fps asked for")
+    for rate in args.rates:
+        acquisition = SimpleNamespace(buffer=lift_buffer(rate), rate=rate)
+        plot = MotionPlot(acquisition)
+        plot.resize(args.width, args.height)
+        window = int(WINDOW_SECONDS * rate)
+        decimated = best(lambda: plot.render(image), repeat=20)
+        naive = best(lambda: paint_naive(image, acquisition.buffer, window), repeat=3)
+        print(f"{rate:7d} Hz ({window:7d} readings):  decimated {decimated * 1e3:7.2f} ms "
+              f"({1 / decimated:6.0f} fps),  naive {naive * 1e3:8.2f} ms ({1 / naive:6.0f} fps)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Benchmark switching between the main screen and the setup screens.
+
+Opens every setup screen and goes back to the main screen ``--rounds`` times
+through the window's router, and reports the latency from the request to the
+first paint of the new page against the one-frame budget. For comparison it
+also times the old way of switching: hiding one top-level window and showing
+another.
+
+    python benchmarks/bench_navigation.py
+    python benchmarks/bench_navigation.py --rounds 50 --module main_layout_file
+"""
+import argparse
+import importlib
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ["PPT_WARM_SCREENS"] = "0"
+
+from PySide6.QtCore import QEvent, QObject  # noqa: E402
+from PySide6.QtWidgets import QApplication  # noqa: E402
+
+from navigation import FRAME_MS  # noqa: E402
+
+
+class PaintWatcher(QObject):
+    """Record when a widget is next painted."""
+
+    def __init__(self):
+        super().__init__()
+        self.painted = None
+
+    def eventFilter(self, obj, event):
+        if event.type() == QEvent.Paint and self.painted is None:
+            self.painted = time.perf_counter()
+        return False
+
+
+def wait_for(app, condition):
+    while not condition():
+        app.processEvents()
+
+
+def router_switches(app, window, rounds):
+    """Latencies (ms) of router switches, as measured by the router itself."""
+    router = window.router
+    for setup_text in router.factories:  # Build every page once, outside the timing
+        window.screen(setup_text)
+    latencies = []
+    router.switched.connect(lambda name, latency: latencies.append(latency))
+    for _ in range(rounds):
+        for setup_text in list(router.factories):
+            for switch in (lambda: window.redirect_to_screen(setup_text), router.back):
+                count = len(latencies)
+                switch()
+                wait_for(app, lambda: len(latencies) > count)
+    return latencies
+
+
+def toplevel_switches(app, window, module, rounds):
+    """Latencies (ms) of hiding the main window and showing a top-level screen, and back."""
+    screen = module.SetupScreen5(window)
+    screen.setParent(None)  # A separate top-level window, as screens used to be
+    latencies = []
+    for _ in range(rounds):
+        for hidden, shown in ((window, screen), (screen, window)):
+            watcher = PaintWatcher()
+            shown.installEventFilter(watcher)
+            started = time.perf_counter()
+            hidden.hide()
+            shown.show()
+            wait_for(app, lambda: watcher.painted is not None)
+            shown.removeEventFilter(watcher)
+            latencies.append((watcher.painted - started) * 1000)
+    return latencies
+
+
+def summary(name, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    within = sum(latency <= FRAME_MS for latency in latencies) / len(latencies)
+    print(f"{name:>9} {statistics.median(latencies):10.2f} {p95:8.2f} {latencies[-1]:8.2f} {within:11.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20, help="Visits to every setup screen")
+    parser.add_argument("--module", default="main", help="Module defining MainWindow")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in os.listdir(ROOT):
+            if name.endswith(".png"):
+                shutil.copy(os.path.join(ROOT, name), workdir)
+        os.chdir(workdir)
+        app = QApplication([])
+        module = importlib.import_module(args.module)
+        window = module.MainWindow()
+        window.show()
+        wait_for(app, window.isVisible)
+
+        routed = router_switches(app, window, args.rounds)
+        toplevel = toplevel_switches(app, window, module, args.rounds)
+        window.writer.close()
+
+    print(f"{'switch':>9} {'median ms':>10} {'p95 ms':>8} {'max ms':>8} {'<= 1 frame':>11}")
+    summary("router", routed)
+    summary("top-level", toplevel)
+    print(f"frame budget {FRAME_MS:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
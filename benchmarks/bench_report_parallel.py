@@ -0,0 +1,87 @@
+"""Benchmark full CSV report rebuilds with 1 to 16 encoding workers.
+
+Builds a synthetic history per size (record log or SQLite) in a temporary
+directory,
+rebuilds the report with each worker count and checks the output is
+byte-identical to the single-process report.
+
+    python benchmarks/bench_report_parallel.py
+    python benchmarks/bench_report_parallel.py --sessions 100000 1000000 10000000
+    python benchmarks/bench_report_parallel.py --backend sqlite
+"""
+import argparse
+import filecmp
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from record_log import RecordLog  # noqa: E402
+from reports import write_csv_report  # noqa: E402
+from sqlite_store import SqliteBackend  # noqa: E402
+
+BATCH = 50000  # Sessions appended per write while building a history
+
+
+def synthetic_session(rng, i):
+    marker = rng.choice(["Yes", "No"])
+    return {
+        "device_sn": f"SN{rng.randrange(100000):05d}",
+        "operator": f"op{rng.randrange(40)}",
+        "date": f"2024-{1 + i % 12:02d}-{1 + i % 28:02d}",
+        "Setup2 - Unit Reach Marker": marker,
+        "Setup2 - Measured Max Height": None if marker == "Yes" else str(rng.randrange(1, 40)),
+        "Setup3 - Unit Reach Marker": "Yes",
+        "Setup3 - Measured Max Height": None,
+        "Setup4 - Click to Zero Vertical Position Dial": "Yes",
+        "Setup4 - Click to record vertical deflection": "Yes",
+    }
+
+
+def build_history(directory, sessions, backend="log"):
+    rng = random.Random(sessions)
+    if backend == "sqlite":
+        store = SqliteBackend(os.path.join(directory, "h.db"))
+    else:
+        store = RecordLog(os.path.join(directory, "h.ndjson"), os.path.join(directory, "h.idx"),
+                          os.path.join(directory, "h.offsets"))
+    for start in range(0, sessions, BATCH):
+        store.create_sessions([synthetic_session(rng, i) for i in range(start, min(start + BATCH, sessions))])
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[100000, 1000000])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--backend", choices=["log", "sqlite"], default="log")
+    args = parser.parse_args()
+
+    print(f"{os.cpu_count()} CPUs available, {args.backend} backend")
+    print(f"{'sessions':>10} {'workers':>7} {'seconds':>8} {'rows/s':>10} {'speedup':>7}")
+    for sessions in args.sessions:
+        with tempfile.TemporaryDirectory() as directory:
+            store = build_history(directory, sessions, args.backend)
+            baseline_path = os.path.join(directory, "w1.csv")
+            baseline = None
+            for workers in args.workers:
+                path = os.path.join(directory, f"w{workers}.csv")
+                started = time.perf_counter()
+                write_csv_report(store, path, workers=workers)
+                seconds = time.perf_counter() - started
+                if baseline is None:
+                    baseline = seconds
+                    if workers != 1:
+                        write_csv_report(store, baseline_path, workers=1)
+                identical = filecmp.cmp(path, baseline_path, shallow=False)
+                print(f"{sessions:>10} {workers:>7} {seconds:>8.2f} {sessions / seconds:>10,.0f} "
+                      f"{baseline / seconds:>6.2f}x{'' if identical else '  OUTPUT DIFFERS'}")
+                if path != baseline_path:
+                    os.remove(path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""Benchmark picking up a session in progress from the journal, against the size of the history.
+
+For each of ``--sessions`` fills a store (the configured backend) with that
+many sessions in a temporary directory, journals a session in progress
+(details, Setups #2 and #3 saved and completed, Setup #4 at its last step)
+as the screens do, and times ``MainWindow.restore_session``: replaying the
+journal and putting the form, the setup buttons and Setup #4's step back.
+Also times writing one journal event (it is fsynced before the click
+returns) and the writer thread's own catch-up of the restored session,
+which checks the store and so may grow with the history but never holds up
+the window. The restore should cost the same at every size.
+
+Then checks, for every backend, that a session already saved before the
+crash is not saved again when the app restarts twice from its journal
+(the json store, which forgets session ids, does not pick it up at all).
+
+    python benchmarks/bench_resume.py
+    python benchmarks/bench_resume.py --sessions 0 100000 --module main_layout_file
+"""
+import argparse
+import importlib
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ["PPT_WARM_SCREENS"] = "0"
+
+from PySide6.QtWidgets import QApplication  # noqa: E402
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from journal import SessionJournal  # noqa: E402
+from storage import open_store  # noqa: E402
+from workflow import completed_result, marker_result, new_session  # noqa: E402
+
+REPEAT = 50  # Restores timed per size
+BATCH = 10000  # Sessions per store write while filling the store
+
+
+def fill(store, sessions):
+    """Write ``sessions`` generated sessions to ``store``."""
+    for start in range(0, sessions, BATCH):
+        store.write_batch([("create", f"s{i}", new_session(f"SN{i}", f"operator-{i % 40}", "2024-05-01"))
+                           for i in range(start, min(start + BATCH, sessions))])
+
+
+def journal_session(journal):
+    """Journal a session as the screens would; return the time of each event in ms."""
+    timings = []
+    events = [lambda: journal.start("in-progress", new_session("SN-NOW", "operator-1", "2024-05-01")),
+              lambda: journal.save(marker_result(2, "Yes")), lambda: journal.save(completed_result((2,))),
+              lambda: journal.save(marker_result(3, "No", "41")), lambda: journal.save(completed_result((2, 3))),
+              lambda: journal.step(4, 1), lambda: journal.step(4, 2, 0.137)]
+    for event in events:
+        started = time.perf_counter()
+        event()
+        timings.append((time.perf_counter() - started) * 1e3)
+    return timings
+
+
+def check_restart(module, backend):
+    """Restart twice from the journal of a session saved before the crash; return the sessions stored."""
+    counts = []
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)
+        try:
+            store = open_store(backend)
+            record = new_session("SN-NOW", "operator-1", "2024-05-01")
+            store.create_session(record, "in-progress")
+            store.close()
+            SessionJournal().start("in-progress", record)
+            for _ in range(2):
+                window = module.MainWindow()  # A crash: its writer closes, but the journal is kept
+                window.writer.close()
+                counts.append(window.store.count())
+                window.deleteLater()
+        finally:
+            os.chdir(cwd)
+    assert counts == [1, 1], (backend, counts)
+    return counts[-1]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, nargs="+", default=[0, 10_000, 100_000],
+                        help="sessions in the history")
+    parser.add_argument("--module", default="main", help="main or main_layout_file")
+    parser.add_argument("--backends", nargs="+", default=["log", "sqlite", "segments", "json"],
+                        help="Store backends to restart on")
+    args = parser.parse_args()
+
+    app = QApplication.instance() or QApplication([])  # noqa: F841 (widgets need one)
+    module = importlib.import_module(args.module)
+    cwd = os.getcwd()
+    print(f"{'sessions':>10} {'event ms':>9} {'restore ms':>11} {'writer catch-up ms':>19}")
+    for sessions in args.sessions:
+        with tempfile.TemporaryDirectory() as workdir:
+            os.chdir(workdir)
+            try:
+                store = open_store(legacy_path="")
+                fill(store, sessions)
+                store.close()
+                events = journal_session(SessionJournal())
+                window = module.MainWindow()  # Restores the session once itself
+                assert window.session_id == "in-progress" and len(window.completed_setups) == 2
+                window.writer.flush()
+                timings = []
+                for _ in range(REPEAT):
+                    window.completed_setups.clear()
+                    started = time.perf_counter()
+                    window.restore_session()
+                    timings.append((time.perf_counter() - started) * 1e3)
+                started = time.perf_counter()
+                window.writer.flush()
+                catch_up = (time.perf_counter() - started) * 1e3
+                window.writer.close()
+                window.deleteLater()
+            finally:
+                os.chdir(cwd)
+        print(f"{sessions:>10} {statistics.median(events):>9.3f} {statistics.median(timings):>11.3f} "
+              f"{catch_up:>19.1f}")
+    for backend in args.backends:
+        os.environ["PPT_STORE_BACKEND"] = backend
+        print(f"restarted twice on {backend}: {check_restart(module, backend)} session stored")
+
+
+if __name__ == "__main__":
+    main()
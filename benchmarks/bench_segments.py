@@ -0,0 +1,122 @@
+"""Benchmark the segmented store: rotation, sealing, compaction and lookups.
+
+Writes ``--sessions`` sessions the way the UI does (a create with the
+placeholders, then one update per setup) over ``--days`` days, so the store
+rotates into daily segments, for each compression. Then times sealing,
+reading one recent and one old session, a full scan, and the same after
+``compact`` has folded each session into one record.
+
+    python benchmarks/bench_segments.py
+    python benchmarks/bench_segments.py --sessions 20000 --days 10 --compression gzip lzma
+"""
+import argparse
+import datetime
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+import segment_store  # noqa: E402
+from segment_store import SegmentStore  # noqa: E402
+from workflow import deflection_result, marker_result, new_session  # noqa: E402
+
+BATCH = 100  # Sessions per write_batch, as the headless engine would send them
+
+
+class Calendar(datetime.date):
+    """``datetime.date`` whose today() the benchmark moves forward."""
+
+    current = datetime.date(2024, 1, 1)
+
+    @classmethod
+    def today(cls):
+        return cls.current
+
+
+def operations(first, count):
+    """Creates and per-setup updates for ``count`` sessions from ``first``."""
+    ops = []
+    for i in range(first, first + count):
+        session_id = f"s{i:08d}"
+        ops.append(("create", session_id, new_session(f"SN{i:08d}", f"operator-{i % 40}", "2024-01-01")))
+        ops.append(("update", session_id, marker_result(2, "Yes")))
+        ops.append(("update", session_id, marker_result(3, "No", "12.5")))
+        ops.append(("update", session_id, deflection_result()))
+    return ops
+
+
+def lookups(store, session_ids):
+    """Median microseconds of ``get_session`` over ``session_ids``."""
+    timings = []
+    for session_id in session_ids:
+        started = time.perf_counter()
+        store.get_session(session_id)
+        timings.append((time.perf_counter() - started) * 1e6)
+    return statistics.median(timings)
+
+
+def scan(store):
+    started = time.perf_counter()
+    sessions = sum(1 for _ in store.iter_sessions())
+    return sessions, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=100_000, help="Sessions to write")
+    parser.add_argument("--days", type=int, default=30, help="Days they are spread over")
+    parser.add_argument("--compression", nargs="+", default=["none", "gzip", "lzma"])
+    args = parser.parse_args()
+    segment_store.datetime = type("datetime", (), {"date": Calendar})
+
+    per_day = args.sessions // args.days
+    for compression in args.compression:
+        compression = None if compression == "none" else compression
+        Calendar.current = datetime.date(2024, 1, 1)
+        with tempfile.TemporaryDirectory() as workdir:
+            store = SegmentStore(os.path.join(workdir, "segments"), compression=compression)
+            started = time.perf_counter()
+            for first in range(0, args.sessions, BATCH):
+                Calendar.current = datetime.date(2024, 1, 1) + datetime.timedelta(days=first // per_day)
+                store.write_batch(operations(first, min(BATCH, args.sessions - first)))
+            written = time.perf_counter() - started
+            if store.sealing is not None:
+                store.sealing.join()
+            started = time.perf_counter()
+            store.seal()  # Whatever the background thread had not reached
+            sealed = time.perf_counter() - started
+            segments, active_size = store.stats()
+            raw = sum(size for _, _, size, _ in segments) + active_size
+            disk = sum(disk_size for _, _, _, disk_size in segments) + active_size
+
+            ids = [f"s{i:08d}" for i in range(args.sessions)]
+            recent = lookups(store, random.sample(ids[-per_day:], 200))
+            old = lookups(store, random.sample(ids[:per_day], 20))
+            sessions, scanned = scan(store)
+            assert sessions == args.sessions
+
+            started = time.perf_counter()
+            before, after = store.compact()
+            compacted = time.perf_counter() - started
+            compacted_disk = sum(disk_size for _, _, _, disk_size in store.stats()[0]) + active_size
+            old_compacted = lookups(store, random.sample(ids[:per_day], 20))
+            sessions, scanned_compacted = scan(store)
+            assert sessions == args.sessions
+            assert store.get_session(ids[0])["Setup3 - Measured Max Height"] == "12.5"
+
+        print(f"compression {compression or 'none'}: {args.sessions} sessions in {len(segments)} segments")
+        print(f"  write        {args.sessions / written:10.0f} sessions/s")
+        print(f"  seal         {sealed:10.2f} s after the background thread, {raw / 1e6:.1f} MB -> {disk / 1e6:.1f} MB")
+        print(f"  get recent   {recent:10.0f} us")
+        print(f"  get old      {old:10.0f} us, {old_compacted:.0f} us compacted")
+        print(f"  scan         {scanned:10.2f} s, {scanned_compacted:.2f} s compacted")
+        print(f"  compact      {compacted:10.2f} s, {before} -> {after} segments, {compacted_disk / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark typed session records against the stored dicts.
+
+For ``--records`` generated sessions, compares memory held per record (as
+``json.loads`` gives the stored dict, and as a ``SessionRecord``) and the
+time to parse them from NDJSON lines: stored dicts, stored dicts normalized
+through ``SessionRecord.from_dict``, and ``to_row`` rows read back with
+``from_row``.
+
+    python benchmarks/bench_session_record.py
+    python benchmarks/bench_session_record.py --records 1000000
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from session_record import SessionRecord  # noqa: E402
+from workflow import deflection_result, marker_result, new_session  # noqa: E402
+
+
+def stored_record(i):
+    record = new_session(f"SN{i:08d}", f"operator-{i % 40}", f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}")
+    record.update(marker_result(2, "Yes" if i % 7 else "No", f"{10 + i % 50}"))
+    record.update(marker_result(3, "No", f"{i % 30}.5"))
+    record.update(deflection_result())
+    return record
+
+
+def held(build):
+    """Bytes allocated by ``build()`` that are still held afterwards, and what it returned."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return after - before, result
+
+
+def timed(parse, lines, repeat=3):
+    """Microseconds per line to ``parse`` ``lines``, best of ``repeat`` passes."""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for line in lines:
+            parse(line)
+        best = min(best, time.perf_counter() - started)
+    return best / len(lines) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=200_000, help="Records to generate")
+    args = parser.parse_args()
+
+    dict_lines = [json.dumps(stored_record(i)) for i in range(args.records)]
+    row_lines = [json.dumps(SessionRecord.from_dict(json.loads(line)).to_row()) for line in dict_lines]
+    for dict_line, row_line in zip(dict_lines[:1000], row_lines):
+        record = json.loads(dict_line)
+        assert SessionRecord.from_dict(record).to_dict() == record
+        assert SessionRecord.from_row(json.loads(row_line)) == SessionRecord.from_dict(record)
+
+    dict_bytes, dicts = held(lambda: [json.loads(line) for line in dict_lines])
+    typed_bytes, typed = held(lambda: [SessionRecord.from_row(json.loads(line)) for line in row_lines])
+    assert len(dicts) == len(typed)
+    del dicts, typed
+
+    results = [
+        ("stored dict", timed(json.loads, dict_lines)),
+        ("stored dict -> SessionRecord", timed(lambda line: SessionRecord.from_dict(json.loads(line)), dict_lines)),
+        ("row -> SessionRecord", timed(lambda line: SessionRecord.from_row(json.loads(line)), row_lines)),
+    ]
+    line_bytes = sum(map(len, dict_lines)) / args.records
+    row_bytes = sum(map(len, row_lines)) / args.records
+    print(f"{args.records} records")
+    print(f"{'':<30} {'held B':>8} {'line B':>8}")
+    print(f"{'stored dict':<30} {dict_bytes / args.records:8.0f} {line_bytes:8.0f}")
+    print(f"{'SessionRecord':<30} {typed_bytes / args.records:8.0f} {row_bytes:8.0f}")
+    print(f"{'parse':<30} {'us/record':>10}")
+    for name, micros in results:
+        print(f"{name:<30} {micros:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
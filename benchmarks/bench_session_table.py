@@ -0,0 +1,94 @@
+"""Benchmark history browsing at a million sessions.
+
+Builds the browse table from ``--sessions`` generated sessions, then times
+what the history page asks of it: the first page and pages deep into a long
+scroll in each sort order, the first page and count under each filter, and
+catching up after a few new sessions.
+
+    python benchmarks/bench_session_table.py
+    python benchmarks/bench_session_table.py --sessions 100000 --pages 200
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from session_table import SessionTable  # noqa: E402
+
+from _fixtures import GeneratedStore  # noqa: E402
+
+NEW_SESSIONS = 50
+
+
+def timed(action, repeat):
+    """Milliseconds per call of ``action`` over ``repeat`` calls."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        action()
+        timings.append((time.perf_counter() - started) * 1e3)
+    return timings
+
+
+def scroll(table, filters, sort, descending, pages):
+    """Milliseconds per page over ``pages`` consecutive pages."""
+    timings, after = [], None
+    for _ in range(pages):
+        started = time.perf_counter()
+        rows = table.page(filters, sort, descending, after)
+        timings.append((time.perf_counter() - started) * 1e3)
+        if not rows:
+            break
+        after = rows[-1][0]
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=1_000_000, help="Sessions in the table")
+    parser.add_argument("--pages", type=int, default=500, help="Pages scrolled in each order")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        table = SessionTable(os.path.join(workdir, "browse.db"))
+        store = GeneratedStore(args.sessions)
+        started = time.perf_counter()
+        table.sync(store)
+        print(f"built from {args.sessions} sessions in {time.perf_counter() - started:.1f}s")
+
+        results = []
+        for sort in ("seq", "device_sn", "operator", "date", "outcome"):
+            results.append((f"scroll by {sort}", scroll(table, {}, sort, sort == "seq", args.pages)))
+        for filters, sort in (({"device_sn": "S"}, "seq"), ({"device_sn": "SN0012"}, "date"),
+                              ({"operator": "operator-7"}, "date")):
+            name = ", ".join(f"{key}={value}" for key, value in filters.items())
+            results.append((f"scroll by {sort}, {name}", scroll(table, filters, sort, False, args.pages // 10)))
+        for filters in ({"device_sn": "SN0012"}, {"operator": "operator-7"},
+                        {"date": "2024-03-03"}, {"outcome": "marker missed"}):
+            name = ", ".join(f"{key}={value}" for key, value in filters.items())
+            results.append((f"first page, {name}", timed(lambda: table.page(filters, "seq", True), 20)))
+            results.append((f"count, {name}", timed(lambda: table.count(filters), 20)))
+        assert table.count({"device_sn": "SN00000000"}) == 3
+        dates = [key[0] for key, _, _ in table.page({"operator": "operator-1"}, "date")]
+        assert dates == sorted(dates)
+
+        store.sessions += NEW_SESSIONS
+        started = time.perf_counter()
+        assert table.sync(store) == NEW_SESSIONS
+        catch_up = (time.perf_counter() - started) * 1e3
+        assert table.count() == store.sessions
+        table.close()
+
+    print(f"{'query':<40} {'median ms':>10} {'max ms':>8}")
+    for name, timings in results:
+        print(f"{name:<40} {statistics.median(timings):10.2f} {max(timings):8.2f}")
+    print(f"{f'sync after {NEW_SESSIONS} new sessions':<40} {catch_up:10.2f}")
+
+
+if __name__ == "__main__":
+    main()
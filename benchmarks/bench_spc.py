@@ -0,0 +1,127 @@
+"""Benchmark the SPC statistics over years of sessions.
+
+Reads ``--sessions`` generated sessions (40 operators, a thousand sessions
+a day, so about three years at the default; Setup #4 read by the dial) into
+columns once, then times what opening
+the SPC page and saving results cost: loading the cached columns and
+catching them up after a few new sessions, building the per-operator and
+per-day statistics from the columns against the same in a Python loop over
+the records, the X-bar/R chart of a measurement, and one result added to
+the running statistics. Checks that the running statistics end up where a
+fresh build from the columns does.
+
+    python benchmarks/bench_spc.py
+    python benchmarks/bench_spc.py --sessions 100000
+"""
+import argparse
+import math
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from session_record import SessionRecord  # noqa: E402
+from spc import METRICS, Columns, SpcStats, load_columns, xbar_r  # noqa: E402
+
+from _fixtures import GeneratedStore, generated_session  # noqa: E402
+
+NEW_SESSIONS = 50
+
+
+def looped_stats(records):
+    """Per-operator count, mean and standard deviation of each measurement, one record at a time."""
+    sums = {}
+    for record in records:
+        typed = SessionRecord.from_dict(record)
+        for slot in METRICS:
+            value = getattr(typed, slot)
+            if value is not None:
+                found = sums.setdefault((typed.operator, slot), [0, 0.0, 0.0])
+                found[0] += 1
+                found[1] += value
+                found[2] += value * value
+    return {key: (count, total / count, math.sqrt(max(squares - total * total / count, 0.0) / max(count - 1, 1)))
+            for key, (count, total, squares) in sums.items()}
+
+
+def timed(action, repeat):
+    """Milliseconds per call of ``action``, best of ``repeat``."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = action()
+        timings.append((time.perf_counter() - started) * 1e3)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=1_000_000, help="Sessions in the history")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "spc.npz")
+        store = GeneratedStore(args.sessions)
+        started = time.perf_counter()
+        columns = load_columns(store, path)
+        print(f"columns of {args.sessions} sessions read from the store in {time.perf_counter() - started:.1f}s, "
+              f"cached in {os.path.getsize(path) / 1e6:.1f} MB")
+
+        results = []
+        load, columns = timed(lambda: load_columns(store, path), 5)
+        results.append(("load cached columns", load))
+        build, stats = timed(lambda: SpcStats.from_columns(columns), 5)
+        results.append(("statistics from the columns", build))
+        for slot in METRICS:
+            chart_ms, chart = timed(lambda: xbar_r(columns[slot]), 5)
+            results.append((f"X-bar/R of {slot} ({len(chart.means)} subgroups)", chart_ms))
+
+        sample = min(args.sessions, 100_000)
+        records = [generated_session(i) for i in range(sample)]
+        loop_ms, looped = timed(lambda: looped_stats(records), 1)
+        results.append((f"Python loop over {sample} records (per operator)", loop_ms))
+        sample_stats = SpcStats.from_columns(load_columns(GeneratedStore(sample), os.path.join(workdir, "s.npz")))
+        for (operator, slot), (count, mean, std) in looped.items():
+            metric = sample_stats.group("operator", operator).metrics[slot]
+            assert metric.count == count and math.isclose(metric.mean, mean) and math.isclose(metric.std, std,
+                                                                                                rel_tol=1e-6)
+
+        store.sessions += NEW_SESSIONS
+        live = stats
+        new = [generated_session(i) for i in range(args.sessions, store.sessions)]
+        timings = []
+        for i, record in enumerate(new, args.sessions):
+            started = time.perf_counter()
+            live.add_session(record)
+            live.add_results(f"s{i}", record, record)
+            timings.append((time.perf_counter() - started) * 1e6)
+        for i in range(0, store.sessions, max(1, store.sessions // 100)):  # Setups submitted again
+            live.add_results(f"s{i}", generated_session(i), generated_session(i))
+        sync_ms, columns = timed(lambda: load_columns(store, path), 1)
+        results.append((f"catch up after {NEW_SESSIONS} new sessions", sync_ms))
+        assert Columns.load(path).token == store.sessions
+
+        fresh = SpcStats.from_columns(columns)
+        for key, group in fresh.groups.items():
+            running = live.groups[key]
+            assert (running.sessions, running.markers, running.reached) == (group.sessions, group.markers,
+                                                                             group.reached), key
+            for slot, metric in group.metrics.items():
+                assert running.metrics[slot].count == metric.count
+                if metric.count:
+                    assert math.isclose(running.metrics[slot].mean, metric.mean, rel_tol=1e-9)
+                    assert math.isclose(running.metrics[slot].m2, metric.m2, rel_tol=1e-6, abs_tol=1e-9)
+
+    print(f"{'step':<52} {'ms':>9}")
+    for name, milliseconds in results:
+        print(f"{name:<52} {milliseconds:9.2f}")
+    print(f"{'one session and its results, running statistics':<52} {statistics.median(timings) / 1e3:9.3f}")
+    print(f"{len(stats.keys('operator'))} operators, {len(stats.keys('day'))} days")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+"""Benchmark cold start of the main window, with lazy versus eager setup screens.
+
+Every sample runs in a fresh interpreter (so no image or style caches carry
+over) in a temporary directory with an empty store, and measures the time
+from constructing ``MainWindow`` to its first paint. "eager" builds all
+setup screens up front, as the window used to; "lazy" leaves them to the
+first visit or to the idle-time warm-up.
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 20 --module main_layout_file
+"""
+import argparse
+import importlib
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+
+def measure(module_name, mode):
+    """Run in the child: print milliseconds from ``MainWindow()`` to first paint."""
+    from PySide6.QtCore import QEvent, QObject
+    from PySide6.QtWidgets import QApplication
+
+    module = importlib.import_module(module_name)
+    app = QApplication([])
+    painted = []
+
+    class PaintWatcher(QObject):
+        def eventFilter(self, obj, event):
+            if event.type() == QEvent.Paint and not painted:
+                painted.append(time.perf_counter())
+            return False
+
+    started = time.perf_counter()
+    window = module.MainWindow()
+    if mode == "eager":
+        for setup_text in window.router.factories:
+            window.screen(setup_text)
+    watcher = PaintWatcher()
+    window.installEventFilter(watcher)
+    window.show()
+    while not painted:
+        app.processEvents()
+    print(f"{(painted[0] - started) * 1000:.3f}")
+    window.writer.close()
+
+
+def sample(module_name, mode, workdir):
+    env = dict(os.environ, QT_QPA_PLATFORM=os.environ.get("QT_QPA_PLATFORM", "offscreen"),
+               PPT_WARM_SCREENS="0")
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--child", mode, "--module", module_name],
+        cwd=workdir, env=env, check=True, capture_output=True, text=True).stdout
+    return float(output.split()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10, help="Samples per mode")
+    parser.add_argument("--module", default="main", help="Module defining MainWindow")
+    parser.add_argument("--child", choices=["lazy", "eager"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        measure(args.module, args.child)
+        return
+
+    results = {}
+    for mode in ("eager", "lazy"):
+        samples = []
+        for _ in range(args.runs):
+            with tempfile.TemporaryDirectory() as workdir:
+                for name in os.listdir(ROOT):
+                    if name.endswith(".png"):
+                        shutil.copy(os.path.join(ROOT, name), workdir)
+                samples.append(sample(args.module, mode, workdir))
+        results[mode] = samples
+
+    print(f"{'mode':>6} {'median ms':>10} {'min ms':>8} {'max ms':>8}")
+    for mode, samples in results.items():
+        print(f"{mode:>6} {statistics.median(samples):10.1f} {min(samples):8.1f} {max(samples):8.1f}")
+    eager, lazy = statistics.median(results["eager"]), statistics.median(results["lazy"])
+    print(f"lazy start-up saves {eager - lazy:.1f} ms ({1 - lazy / eager:.0%})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""Count style recomputations caused by everyday interactions.
+
+Drives the main window through the interactions that change how widgets look
+(typing in the details form, submitting it, ticking and unticking a Setup #4
+step, moving to the next step, completing a setup) and counts, for each, the
+widgets whose style was recomputed, i.e. that received a ``StyleChange`` or
+``PaletteChange`` event, along with the time the interaction took.
+
+    python benchmarks/bench_styles.py
+    python benchmarks/bench_styles.py --repeat 200 --module main_layout_file
+"""
+import argparse
+import importlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+os.environ["PPT_WARM_SCREENS"] = "0"
+
+from PySide6.QtCore import QEvent, QObject  # noqa: E402
+from PySide6.QtWidgets import QApplication  # noqa: E402
+
+SETUP4 = "Test Setup #4:Deflection, vertical"
+
+
+class RestyleCounter(QObject):
+    """Collect the widgets whose style is recomputed."""
+
+    def __init__(self):
+        super().__init__()
+        self.widgets = set()
+
+    def eventFilter(self, obj, event):
+        if event.type() in (QEvent.StyleChange, QEvent.PaletteChange):
+            self.widgets.add(id(obj))
+        return False
+
+
+def measure(app, counter, action, repeat):
+    """Run ``action`` ``repeat`` times; return restyled widgets and microseconds per run."""
+    restyled, elapsed = 0, 0.0
+    for i in range(repeat):
+        app.processEvents()
+        counter.widgets.clear()
+        started = time.perf_counter()
+        action(i)
+        app.processEvents()
+        elapsed += time.perf_counter() - started
+        restyled += len(counter.widgets)
+    return restyled / repeat, elapsed / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=100, help="Runs of each repeatable interaction")
+    parser.add_argument("--module", default="main", help="Module defining MainWindow")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for name in os.listdir(ROOT):
+            if name.endswith(".png"):
+                shutil.copy(os.path.join(ROOT, name), workdir)
+        os.chdir(workdir)
+        app = QApplication([])
+        module = importlib.import_module(args.module)
+        module.MainWindow.show_popup = lambda self, message: None  # Modal; not part of the measurement
+        window = module.MainWindow()
+        window.show()
+        window.redirect_to_screen(SETUP4)
+        setup4 = window.screen(SETUP4)
+        window.router.back()
+        counter = RestyleCounter()
+        app.installEventFilter(counter)
+
+        window.operator.setText("operator")
+        results = [
+            ("type in the details form",
+             measure(app, counter, lambda i: window.device_sn.setText("SN" * (1 + i % 2)), args.repeat)),
+            ("clear a details field",
+             measure(app, counter, lambda i: (window.device_sn.setText(""), window.device_sn.setText("SN")),
+                     args.repeat)),
+            ("submit the details form", measure(app, counter, lambda i: window.submit_details(), 1)),
+            ("tick a Setup #4 step", measure(app, counter, lambda i: setup4.checkbox.setChecked(i % 2 == 0),
+                                             args.repeat)),
+        ]
+        setup4.checkbox.setChecked(True)
+        results.append(("next Setup #4 step", measure(app, counter, lambda i: setup4.next_step(), 1)))
+        results.append(("complete a setup", measure(
+            app, counter, lambda i: window.mark_setup_completed(list(window.setup_buttons)[i % 7]), 7)))
+        app.removeEventFilter(counter)
+        window.writer.close()
+
+    print(f"{'interaction':<26} {'restyled widgets':>16} {'us per run':>11}")
+    for name, (restyled, micros) in results:
+        print(f"{name:<26} {restyled:16.1f} {micros:11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Stress a store shared by several station processes writing at once.
+
+For each station count (1, 2, 4, ... up to ``--stations``) a fresh store is
+shared by that many processes, started together. Each station saves
+``--sessions`` sessions the way the GUI does (create, then one update per
+setup), and every station also bumps a counter in one shared session
+``--bumps`` times by read-modify-write with an optimistic version check,
+retrying on ``ConflictError``. Afterwards the store is checked: every session
+and every setup result must be there, and the counter must equal the number
+of bumps (a lost update would leave it short). Reports write latency per
+station count, so you can see how it scales.
+
+    python benchmarks/stress_shared_store.py
+    python benchmarks/stress_shared_store.py --stations 16 --sessions 200 --backends log json
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from storage import ConflictError, open_store  # noqa: E402
+from workflow import deflection_result, marker_result, new_session  # noqa: E402
+
+DATE = "2024-05-01"
+
+
+def station(number, backend, workdir, sessions, bumps, shared_id, barrier, results):
+    """Run in a child process: save sessions and bump the shared counter."""
+    sys.path.insert(0, ROOT)
+    os.chdir(workdir)
+    store = open_store(backend)
+    latencies, conflicts = [], 0
+
+    def timed(write, *args, **kwargs):
+        started = time.perf_counter()
+        result = write(*args, **kwargs)
+        latencies.append((time.perf_counter() - started) * 1000)
+        return result
+
+    barrier.wait()
+    bumped = 0
+    for i in range(sessions):
+        session_id = timed(store.create_session, new_session(f"SN{number}-{i}", f"station-{number}", DATE))
+        timed(store.update_session, session_id, marker_result(2, "No", str(i)))
+        timed(store.update_session, session_id, marker_result(3, "Yes"))
+        timed(store.update_session, session_id, deflection_result())
+        if shared_id is not None and bumped < bumps and i % max(1, sessions // bumps) == 0:
+            while True:
+                version = store.session_version(shared_id)
+                count = store.get_session(shared_id).get("bumps", 0)
+                try:
+                    timed(store.update_session, shared_id, {"bumps": count + 1}, expected_version=version)
+                    break
+                except ConflictError:
+                    conflicts += 1
+            bumped += 1
+    store.close()
+    results.put((latencies, conflicts, bumped))
+
+
+def verify(store, stations, sessions, shared_id, bumps):
+    """Return a list of problems found in the store after a run."""
+    problems = []
+    seen = set()
+    for session_id, record in store.iter_sessions():
+        if session_id == shared_id or record.get("device_sn") == "SHARED":
+            if record.get("bumps") != bumps:
+                problems.append(f"shared counter is {record.get('bumps')}, expected {bumps}")
+            continue
+        seen.add(record["device_sn"])
+        i = int(record["device_sn"].split("-")[1])
+        expected = {**new_session(record["device_sn"], record["operator"], DATE),
+                    **marker_result(2, "No", str(i)), **marker_result(3, "Yes"), **deflection_result()}
+        if record != expected:
+            problems.append(f"{record['device_sn']} is incomplete: {record}")
+    missing = stations * sessions - len(seen)
+    if missing:
+        problems.append(f"{missing} sessions missing")
+    return problems
+
+
+def run(backend, stations, sessions, bumps):
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as workdir:
+        os.chdir(workdir)
+        store = open_store(backend)
+        versioned = backend != "json"  # The legacy file keeps no versions
+        shared_id = store.create_session({"device_sn": "SHARED", "operator": "all", "date": DATE}) \
+            if versioned else None
+        barrier = context.Barrier(stations + 1)
+        results = context.Queue()
+        processes = [context.Process(target=station, args=(
+            number, backend, workdir, sessions, bumps, shared_id, barrier, results)) for number in range(stations)]
+        for process in processes:
+            process.start()
+        barrier.wait()
+        started = time.perf_counter()
+        outcomes = [results.get() for _ in processes]
+        seconds = time.perf_counter() - started
+        for process in processes:
+            process.join()
+        store.close()
+        store = open_store(backend)
+        problems = verify(store, stations, sessions, shared_id,
+                          sum(bumped for _, _, bumped in outcomes) if versioned else None)
+        store.close()
+        os.chdir(ROOT)
+
+    latencies = sorted(latency for station_latencies, _, _ in outcomes for latency in station_latencies)
+    conflicts = sum(conflicts for _, conflicts, _ in outcomes)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{backend:>8} {stations:8d} {len(latencies):7d} {len(latencies) / seconds:9.0f} "
+          f"{statistics.median(latencies):8.2f} {p95:8.2f} {latencies[-1]:8.1f} "
+          f"{conflicts if versioned else '-':>9} {'ok' if not problems else 'FAILED'}")
+    for problem in problems[:10]:
+        print(f"        {problem}")
+    return not problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stations", type=int, default=8, help="Most station processes at once")
+    parser.add_argument("--sessions", type=int, default=100, help="Sessions saved by each station")
+    parser.add_argument("--bumps", type=int, default=20, help="Shared counter bumps by each station")
+    parser.add_argument("--backends", nargs="+", default=["log", "sqlite", "segments", "json"], help="Store backends to try")
+    args = parser.parse_args()
+
+    counts = []
+    stations = 1
+    while stations < args.stations:
+        counts.append(stations)
+        stations *= 2
+    counts.append(args.stations)
+
+    print(f"{'backend':>8} {'stations':>8} {'writes':>7} {'writes/s':>9} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'max ms':>8} {'conflicts':>9} check")
+    ok = True
+    for backend in args.backends:
+        for stations in counts:
+            ok &= run(backend, stations, args.sessions, args.bumps)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""Supervisors' dashboard: sessions, setups and failures by operator, device and day.
+
+Every figure is read from the materialized totals in ``aggregates``, which
+the store writer keeps up to date as sessions are saved, so the page costs
+a few index lookups however long the history. ``AggregatesSync`` catches the
+tables up with sessions saved elsewhere (other stations, the automated
+line), as a ``store_job.StoreJob``, each time the page is shown.
+"""
+import datetime
+
+from PySide6.QtCore import QObject, Qt, QThreadPool, Signal
+from PySide6.QtWidgets import QComboBox, QHBoxLayout, QHeaderView, QLabel, QLineEdit, QTableWidget, \
+    QTableWidgetItem
+
+from aggregates import COUNTS, Aggregates
+from navigation import Page
+from store_job import StoreJob
+
+GROUPINGS = (("Operator", "operator"), ("Day", "day"))
+HEADER = ("Sessions", "Completed", "Setups", "Failures")
+DAY_ROWS = 90  # Most recent days listed
+OPERATOR_ROWS = 1000  # Operators listed; a station has a few dozen
+
+
+class AggregatesSyncSignals(QObject):
+    finished = Signal(int)  # Sessions read from the store
+    failed = Signal(str)  # Error message
+
+
+class AggregatesSync(StoreJob):
+    def __init__(self, open_store, writer=None):
+        super().__init__(open_store, writer)
+        self.signals = AggregatesSyncSignals()
+
+    def sync_aggregates(self, store):
+        aggregates = Aggregates()
+        try:
+            return aggregates.sync(store)
+        finally:
+            aggregates.close()
+
+    def run(self):
+        try:
+            count = self.read_store(self.sync_aggregates)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.finished.emit(count)
+
+
+def summary(counts):
+    return (f"{counts['sessions']:,} sessions, {counts['completed']:,} completed, "
+            f"{counts['setups']:,} setups, {counts['failures']:,} failures")
+
+
+class DashboardScreen(Page):
+    """Today's counts, a device's counts, and the counts per operator or per day."""
+
+    def __init__(self, parent, open_store):
+        super().__init__(parent)
+        self.open_store = open_store
+        self.setWindowTitle("Dashboard")
+        self.aggregates = None  # Opened once the first sync has finished
+        self.sync_job = None
+
+        layout = self.layout
+        title = QLabel("Dashboard")
+        title.setObjectName("screenTitle")
+        title.setAlignment(Qt.AlignCenter)
+        layout.addWidget(title)
+
+        self.today_label = QLabel()
+        self.today_label.setObjectName("fieldLabel")
+        layout.addWidget(self.today_label)
+        device_row = QHBoxLayout()
+        self.device_sn = QLineEdit()
+        self.device_sn.setPlaceholderText("Device SN")
+        self.device_label = QLabel()
+        self.device_label.setObjectName("fieldLabel")
+        device_row.addWidget(self.device_sn)
+        device_row.addWidget(self.device_label, 1)
+        layout.addLayout(device_row)
+
+        choice_row = QHBoxLayout()
+        self.grouping = QComboBox()
+        self.grouping.addItems([label for label, _ in GROUPINGS])
+        self.status_label = QLabel()
+        self.status_label.setObjectName("fieldLabel")
+        choice_row.addWidget(self.grouping)
+        choice_row.addWidget(self.status_label, 1)
+        layout.addLayout(choice_row)
+
+        self.table = QTableWidget(0, len(HEADER) + 1)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+
+        self.device_sn.textChanged.connect(self.show_device)
+        self.grouping.currentIndexChanged.connect(self.refresh)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()  # What was counted as it was saved, straight away
+        self.sync()
+
+    def sync(self):
+        """Catch the totals up with the store in the background."""
+        if self.sync_job is not None:
+            return
+        self.status_label.setText("Updating...")
+        self.sync_job = AggregatesSync(self.open_store, self.parent.writer)
+        self.sync_job.signals.finished.connect(self.on_synced)
+        self.sync_job.signals.failed.connect(self.on_sync_failed)
+        QThreadPool.globalInstance().start(self.sync_job)
+
+    def on_synced(self, count):
+        self.sync_job = None
+        if self.aggregates is None:
+            self.aggregates = Aggregates()
+        self.refresh()
+
+    def on_sync_failed(self, message):
+        self.sync_job = None
+        self.status_label.setText(f"Could not update the totals: {message}")
+
+    def refresh(self):
+        """Fill the page from the totals."""
+        label, by = GROUPINGS[self.grouping.currentIndex()]
+        self.table.setHorizontalHeaderLabels([label, *HEADER])
+        if self.aggregates is None:
+            self.table.setRowCount(0)
+            return
+        self.today_label.setText(
+            f"Today: {summary(self.aggregates.totals('day', datetime.date.today().isoformat()))}")
+        self.status_label.setText(f"All time: {summary(self.aggregates.totals('all'))}")
+        self.show_device(self.device_sn.text())
+        if by == "day":
+            rows = self.aggregates.rows("day", descending=True, limit=DAY_ROWS)
+        else:
+            rows = self.aggregates.rows("operator", limit=OPERATOR_ROWS)
+        self.table.setRowCount(len(rows))
+        for row, (key, counts) in enumerate(rows):
+            cells = (key or "(none)", *(str(counts[count]) for count in COUNTS))
+            for column, text in enumerate(cells):
+                self.table.setItem(row, column, QTableWidgetItem(text))
+
+    def show_device(self, device_sn):
+        if self.aggregates is None or not device_sn:
+            self.device_label.setText("")
+            return
+        self.device_label.setText(summary(self.aggregates.totals("device", device_sn)))
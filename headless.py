@@ -0,0 +1,317 @@
+"""Run test sessions without the GUI, for the automated line.
+
+Each unit under test is one JSON object::
+
+    {"device_sn": "SN1", "operator": "line-3", "date": "2024-05-01",
+     "setup2": {"marker": "No", "measured_max_height": "41"},
+     "setup3": {"marker": "Yes"},
+     "setup4": true}
+
+The setups are optional; any left out stay to be done, as when an operator
+runs only some of them. Where the line reads the Setup #4 dial itself,
+``"setup4"`` can give the readings in mm instead of ``true``:
+``{"zero": 0.002, "peak": 0.514, "settled": 0.497}`` (any may be left
+out). A unit with a ``session_id`` instead of the details adds its setups
+to a session saved earlier. Units are checked and turned into
+records by ``workflow`` (the same code behind the GUI's submit buttons) and
+saved to the configured store (``PPT_STORE_BACKEND``) with one ``write_batch``
+per batch of units. Every unit is answered, once its batch is written, with a
+JSON line: ``{"line": 1, "ok": true, "session_id": "..."}`` or
+``{"line": 1, "ok": false, "error": "..."}``.
+
+    python headless.py unit --device-sn SN1 --operator line-3 --setup2 No --setup2-height 41 --setup4
+    python headless.py stdin < units.jsonl > results.jsonl
+    python headless.py serve --socket /tmp/ppt.sock    # or --port 8765 (localhost TCP)
+
+A socket client sends JSONL and reads one result line per unit, on as many
+connections as it likes. Throughput in sessions per second is printed to
+stderr when the input (or a connection) ends.
+"""
+import argparse
+import json
+import os
+import queue
+import signal
+import socketserver
+import sys
+import threading
+import time
+import uuid
+
+from aggregates import Aggregates
+from history_index import open_history_index
+from storage import open_store
+from workflow import MARKER_CHOICES, MARKER_SETUPS, ValidationError, deflection_result, marker_result, new_session
+
+BATCH_SIZE = 500  # Most units saved with one store write
+UNIT_FIELDS = {"session_id", "device_sn", "operator", "date", "setup4",
+               *(f"setup{setup}" for setup in MARKER_SETUPS)}
+
+
+def setup_results(unit):
+    """Return the setup results given in ``unit``, checked, as one dict."""
+    data = {}
+    for setup in MARKER_SETUPS:
+        result = unit.get(f"setup{setup}")
+        if result is None:
+            continue
+        if not isinstance(result, dict):
+            raise ValidationError(f"setup{setup} must be an object with a marker")
+        height = result.get("measured_max_height", "")
+        if isinstance(height, (int, float)) and not isinstance(height, bool):
+            height = str(height)  # The screens save the field's text
+        elif not isinstance(height, str):
+            raise ValidationError(f"setup{setup} measured_max_height must be text or a number")
+        data.update(marker_result(setup, result.get("marker"), height))
+    if "setup4" in unit:
+        readings = unit["setup4"]
+        if readings is True:
+            readings = {}
+        elif not isinstance(readings, dict) or set(readings) - {"zero", "peak", "settled"}:
+            raise ValidationError("setup4 must be true, once every step has been confirmed, "
+                                  "or an object with the dial's zero, peak and settled readings")
+        data.update(deflection_result(**readings))
+    return data
+
+
+def read_batches(lines, batch_size=BATCH_SIZE):
+    """Group ``lines`` into batches without holding any back waiting for more.
+
+    A thread reads ahead, and a batch ends when it is full or when no more
+    input has arrived, so a lone unit is saved straight away and a burst is
+    saved together.
+    """
+    pending = queue.Queue(maxsize=batch_size * 4)
+
+    def read():
+        for line in lines:
+            pending.put(line)
+        pending.put(None)
+
+    threading.Thread(target=read, name="HeadlessReader", daemon=True).start()
+    while True:
+        batch = [pending.get()]
+        while len(batch) < batch_size and batch[-1] is not None:
+            try:
+                batch.append(pending.get_nowait())
+            except queue.Empty:
+                break
+        if batch[-1] is None:
+            if len(batch) > 1:
+                yield batch[:-1]
+            return
+        yield batch
+
+
+class HeadlessEngine:
+    """Check units and save them to ``store`` in batches.
+
+    New sessions are also added to ``history`` (a ``HistoryIndex``), if given,
+    so the GUI's suggestions include units tested on the line, and every
+    written batch is counted in ``aggregates`` (an ``Aggregates``), if given,
+    for the supervisors' dashboard.
+    """
+
+    def __init__(self, store, batch_size=BATCH_SIZE, history=None, aggregates=None):
+        self.store = store
+        self.batch_size = batch_size
+        self.history = history
+        self.aggregates = aggregates
+        self.lock = threading.Lock()  # One batch at a time reaches the store
+
+    def _operation(self, unit, created):
+        """Return the store operation that saves ``unit``."""
+        if not isinstance(unit, dict):
+            raise ValidationError("a unit must be a JSON object")
+        unknown = unit.keys() - UNIT_FIELDS
+        if unknown:
+            raise ValidationError(f"unknown fields: {', '.join(sorted(unknown))}")
+        data = setup_results(unit)
+        if "session_id" not in unit:
+            record = new_session(unit.get("device_sn"), unit.get("operator"), unit.get("date"))
+            record.update(data)
+            return "create", uuid.uuid4().hex, record
+        session_id = unit["session_id"]
+        if not isinstance(session_id, str):
+            raise ValidationError(f"session_id must be text, not {session_id!r}")
+        if not data:
+            raise ValidationError("no setup results to add to the session")
+        if session_id not in created:
+            try:
+                self.store.get_session(session_id)
+            except (KeyError, TypeError, ValueError):
+                raise ValidationError(f"unknown session_id: {session_id!r}") from None
+        return "update", session_id, data
+
+    def run_batch(self, units):
+        """Check and save ``units`` with one store write; return a result for each."""
+        results, operations, created = [], [], set()
+        with self.lock:
+            for unit in units:
+                try:
+                    operation = self._operation(unit, created)
+                except ValidationError as e:
+                    results.append({"ok": False, "error": str(e)})
+                    continue
+                except Exception as e:  # A unit nothing above expected must not end the stream
+                    results.append({"ok": False, "error": f"could not check the unit: {e!r}"})
+                    continue
+                operations.append(operation)
+                if operation[0] == "create":
+                    created.add(operation[1])
+                results.append({"ok": True, "session_id": operation[1]})
+            try:
+                self.store.write_batch(operations)
+            except Exception as e:
+                for result in results:
+                    if result["ok"]:
+                        result.update(ok=False, error=f"could not save: {e}")
+                        del result["session_id"]
+                return results
+            if self.history is not None:
+                self.history.add([data for op, _, data in operations if op == "create"])
+            if self.aggregates is not None:
+                try:
+                    self.aggregates.apply_batch(self.store, operations)
+                except Exception as e:  # The units are saved; aggregates.sync catches up later
+                    print(f"Could not update the aggregates: {e}", file=sys.stderr)
+        return results
+
+    def run_stream(self, lines, write):
+        """Save the JSONL units in ``lines``, passing each result line to ``write``.
+
+        Returns the number of sessions saved, units rejected and seconds taken.
+        """
+        saved = rejected = number = 0
+        started = None
+        for batch in read_batches(lines, self.batch_size):
+            if started is None:
+                started = time.perf_counter()  # Not counting the wait for the first unit
+            numbers, units, results = [], [], {}
+            for line in batch:
+                number += 1
+                if not line.strip():
+                    continue
+                try:
+                    units.append(json.loads(line))
+                    numbers.append(number)
+                except ValueError as e:
+                    results[number] = {"ok": False, "error": f"not JSON: {e}"}
+            results.update(zip(numbers, self.run_batch(units)))
+            write("".join(json.dumps({"line": line_number, **result}) + "\n"
+                          for line_number, result in sorted(results.items())))
+            for result in results.values():
+                if result["ok"]:
+                    saved += 1
+                else:
+                    rejected += 1
+        seconds = time.perf_counter() - started if started is not None else 0.0
+        return saved, rejected, seconds
+
+
+def report(saved, rejected, seconds, source):
+    rate = saved / seconds if seconds else 0.0
+    print(f"{source}: {saved} sessions saved, {rejected} rejected in {seconds:.3f}s "
+          f"({rate:.0f} sessions/s)", file=sys.stderr)
+
+
+class UnitHandler(socketserver.StreamRequestHandler):
+    """Serve one socket connection: JSONL units in, JSONL results out."""
+
+    def handle(self):
+        def write(text):
+            self.wfile.write(text.encode())
+
+        lines = (line.decode() for line in self.rfile)
+        saved, rejected, seconds = self.server.engine.run_stream(lines, write)
+        report(saved, rejected, seconds, f"connection {self.client_address or 'local'}")
+
+
+class UnixUnitServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class TcpUnitServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def serve(engine, socket_path=None, port=None):
+    """Save units sent to a local socket until interrupted."""
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # Left behind by a server that did not shut down cleanly
+        server = UnixUnitServer(socket_path, UnitHandler)
+    else:
+        server = TcpUnitServer(("127.0.0.1", port), UnitHandler)
+    server.engine = engine
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))  # Clean up the socket on kill too
+    print(f"Listening on {socket_path or f'127.0.0.1:{port}'}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if socket_path and os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="most units per store write")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    unit = commands.add_parser("unit", help="save one unit given on the command line")
+    unit.add_argument("--session-id", help="add the setups to this session instead of a new one")
+    unit.add_argument("--device-sn")
+    unit.add_argument("--operator")
+    unit.add_argument("--date", default=time.strftime("%Y-%m-%d"), help="YYYY-MM-DD (default today)")
+    for setup in MARKER_SETUPS:
+        unit.add_argument(f"--setup{setup}", choices=MARKER_CHOICES, help=f"Setup #{setup} reach marker")
+        unit.add_argument(f"--setup{setup}-height", default="", help="measured max height, if the marker was missed")
+    unit.add_argument("--setup4", action="store_true", help="every Setup #4 step was confirmed")
+
+    commands.add_parser("stdin", help="save JSONL units read from stdin")
+
+    server = commands.add_parser("serve", help="save JSONL units sent to a local socket")
+    address = server.add_mutually_exclusive_group(required=True)
+    address.add_argument("--socket", help="Unix domain socket path")
+    address.add_argument("--port", type=int, help="TCP port on 127.0.0.1")
+    args = parser.parse_args()
+
+    store = open_store()
+    aggregates = Aggregates()
+    engine = HeadlessEngine(store, args.batch_size, open_history_index(store), aggregates)
+    try:
+        if args.command == "unit":
+            given = {"session_id": args.session_id, "device_sn": args.device_sn, "operator": args.operator}
+            data = {name: value for name, value in given.items() if value is not None}
+            if args.session_id is None:
+                data["date"] = args.date
+            for setup in MARKER_SETUPS:
+                marker = getattr(args, f"setup{setup}")
+                if marker:
+                    data[f"setup{setup}"] = {"marker": marker,
+                                             "measured_max_height": getattr(args, f"setup{setup}_height")}
+            if args.setup4:
+                data["setup4"] = True
+            result = engine.run_batch([data])[0]
+            print(json.dumps(result))
+            if not result["ok"]:
+                sys.exit(1)
+        elif args.command == "stdin":
+            def write(text):
+                sys.stdout.write(text)
+                sys.stdout.flush()  # A producer may be waiting for the answer
+
+            report(*engine.run_stream(sys.stdin, write), "stdin")
+        else:
+            serve(engine, args.socket, args.port)
+    finally:
+        aggregates.close()
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
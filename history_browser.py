@@ -0,0 +1,213 @@
+"""Session history page: a lazily filled table over ``session_table``.
+
+``SessionTableModel`` starts empty and lets the view ask for more
+(``canFetchMore``/``fetchMore``) as it scrolls, one keyset page at a time, so
+only the rows scrolled past are ever read. Sorting (by clicking a sortable
+column header) and the filter fields start the model over with a new query,
+which the table's indexes answer. ``SessionTableSync`` brings the table up to
+date from the store, as a ``store_job.StoreJob``, each time the page is shown.
+"""
+import datetime
+
+from PySide6.QtCore import QAbstractTableModel, QModelIndex, QObject, Qt, QThreadPool, Signal
+from PySide6.QtWidgets import QComboBox, QHBoxLayout, QHeaderView, QLabel, QLineEdit, QTableView
+
+from navigation import Page
+from session_table import PAGE_ROWS, SessionTable
+from session_record import Outcome, SessionRecord
+from store_job import StoreJob
+
+COLUMNS = (  # Header, record key (or None for the outcome), sort column if sortable
+    ("Device SN", "device_sn", "device_sn"),
+    ("Operator", "operator", "operator"),
+    ("Date", "date", "date"),
+    ("Setup #2 marker", "Setup2 - Unit Reach Marker", None),
+    ("Setup #2 height", "Setup2 - Measured Max Height", None),
+    ("Setup #3 marker", "Setup3 - Unit Reach Marker", None),
+    ("Setup #3 height", "Setup3 - Measured Max Height", None),
+    ("Setup #4 deflection", "Setup4 - Click to record vertical deflection", None),
+    ("Outcome", None, "outcome"),
+)
+ROW_HEIGHT = 24  # Fixed, so the view never measures rows
+
+
+class SessionTableModel(QAbstractTableModel):
+    def __init__(self, table):
+        super().__init__()
+        self.table = table
+        self.filters = {}
+        self.sort_column = "seq"
+        self.descending = True  # Newest first until a column is sorted
+        self.rows = []  # (key, session_id, record) fetched so far
+        self.more = True
+
+    def query(self, filters=None, sort_column=None, descending=None):
+        """Start over with new filters and/or order; rows are fetched as the view needs them."""
+        self.beginResetModel()
+        if filters is not None:
+            self.filters = filters
+        if sort_column is not None:
+            self.sort_column, self.descending = sort_column, descending
+        self.rows = []
+        self.more = True
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(COLUMNS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        record = self.rows[index.row()][2]
+        key = COLUMNS[index.column()][1]
+        value = SessionRecord.from_dict(record).outcome.value if key is None else record.get(key)
+        return "" if value is None or value is False else str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return COLUMNS[section][0]
+        return None
+
+    def canFetchMore(self, parent=QModelIndex()):
+        return not parent.isValid() and self.more
+
+    def fetchMore(self, parent=QModelIndex()):
+        if parent.isValid():
+            return
+        after = self.rows[-1][0] if self.rows else None
+        page = self.table.page(self.filters, self.sort_column, self.descending, after, PAGE_ROWS)
+        self.more = len(page) == PAGE_ROWS
+        if page:
+            self.beginInsertRows(QModelIndex(), len(self.rows), len(self.rows) + len(page) - 1)
+            self.rows.extend(page)
+            self.endInsertRows()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        if column < 0:  # No sort column: newest first
+            self.query(sort_column="seq", descending=True)
+        elif COLUMNS[column][2] is not None:
+            self.query(sort_column=COLUMNS[column][2], descending=order == Qt.DescendingOrder)
+
+
+class SessionTableSyncSignals(QObject):
+    finished = Signal(int)  # Sessions read from the store
+    failed = Signal(str)  # Error message
+
+
+class SessionTableSync(StoreJob):
+    def __init__(self, open_store, writer=None):
+        super().__init__(open_store, writer)
+        self.signals = SessionTableSyncSignals()
+
+    def sync_table(self, store):
+        table = SessionTable()  # SQLite connections stay on the thread that made them
+        try:
+            return table.sync(store)
+        finally:
+            table.close()
+
+    def run(self):
+        try:
+            count = self.read_store(self.sync_table)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.finished.emit(count)
+
+
+class HistoryScreen(Page):
+    """Browse, sort and filter every saved session."""
+
+    def __init__(self, parent, open_store):
+        super().__init__(parent)
+        self.open_store = open_store
+        self.setWindowTitle("Session History")
+        self.table = None  # Opened on the first show, not when the page is built
+        self.sync_job = None
+
+        layout = self.layout
+        title = QLabel("Session History")
+        title.setObjectName("screenTitle")
+        title.setAlignment(Qt.AlignCenter)
+        layout.addWidget(title)
+
+        filter_row = QHBoxLayout()
+        self.device_sn = QLineEdit()
+        self.device_sn.setPlaceholderText("Device SN starts with")
+        self.operator = QLineEdit()
+        self.operator.setPlaceholderText("Operator")
+        self.date = QLineEdit()
+        self.date.setPlaceholderText("Date (YYYY-MM-DD)")
+        self.outcome = QComboBox()
+        self.outcome.addItems(["Any outcome", *(outcome.value for outcome in Outcome)])
+        self.count_label = QLabel()
+        for widget in (self.device_sn, self.operator, self.date, self.outcome, self.count_label):
+            filter_row.addWidget(widget)
+        layout.addLayout(filter_row)
+
+        self.view = QTableView()
+        self.view.setSortingEnabled(False)  # Enabled with the model, so it is not sorted on attach
+        self.view.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+        self.view.verticalHeader().setDefaultSectionSize(ROW_HEIGHT)
+        self.view.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.view.setSelectionBehavior(QTableView.SelectRows)
+        layout.addWidget(self.view)
+
+        for field in (self.device_sn, self.operator, self.date):
+            field.textChanged.connect(self.apply_filters)
+        self.outcome.currentIndexChanged.connect(self.apply_filters)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.sync()
+
+    def sync(self):
+        """Catch the table up with the store in the background."""
+        if self.sync_job is not None:
+            return
+        self.count_label.setText("Updating...")
+        self.sync_job = SessionTableSync(self.open_store, self.parent.writer)
+        self.sync_job.signals.finished.connect(self.on_synced)
+        self.sync_job.signals.failed.connect(self.on_sync_failed)
+        QThreadPool.globalInstance().start(self.sync_job)
+
+    def on_synced(self, count):
+        self.sync_job = None
+        if self.table is None:
+            self.table = SessionTable()
+            self.model = SessionTableModel(self.table)
+            self.view.setModel(self.model)
+            self.view.horizontalHeader().setSortIndicator(-1, Qt.AscendingOrder)  # Newest first
+            self.view.setSortingEnabled(True)
+            self.apply_filters()
+        elif count:
+            self.apply_filters()  # Show what changed, keeping the filters and order
+        else:
+            self.update_count(self.filters())
+
+    def on_sync_failed(self, message):
+        self.sync_job = None
+        self.count_label.setText(f"Could not read the history: {message}")
+
+    def filters(self):
+        """The filter fields as ``SessionTable`` filters; a date that is not YYYY-MM-DD is ignored."""
+        try:
+            date = datetime.date.fromisoformat(self.date.text()).isoformat()
+        except ValueError:
+            date = None
+        outcome = self.outcome.currentText() if self.outcome.currentIndex() > 0 else None
+        return {"device_sn": self.device_sn.text(), "operator": self.operator.text(), "date": date,
+                "outcome": outcome}
+
+    def apply_filters(self):
+        if self.table is None:
+            return
+        filters = self.filters()
+        self.model.query(filters)
+        self.update_count(filters)
+
+    def update_count(self, filters):
+        self.count_label.setText(f"{self.table.count(filters)} sessions")
@@ -0,0 +1,52 @@
+"""Suggestions from the history index for the details form.
+
+``HistoryIndexLoader`` opens (and if need be rebuilds) the index as a
+``store_job.StoreJob`` and hands it back through ``loaded``.
+``HistoryCompleter`` then offers earlier values of a field as the operator
+types, asking the index for the current prefix on every edit instead of
+loading every value into the completer's model.
+"""
+from PySide6.QtCore import QObject, QStringListModel, Signal
+from PySide6.QtWidgets import QCompleter
+
+from history_index import open_history_index
+from store_job import StoreJob
+
+
+class HistoryIndexLoaderSignals(QObject):
+    loaded = Signal(object)  # The opened HistoryIndex
+    failed = Signal(str)  # Error message
+
+
+class HistoryIndexLoader(StoreJob):
+    def __init__(self, open_store):
+        super().__init__(open_store)
+        self.signals = HistoryIndexLoaderSignals()
+
+    def run(self):
+        try:
+            index = self.read_store(open_history_index)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.loaded.emit(index)
+
+
+class HistoryCompleter(QCompleter):
+    """Complete ``line_edit`` with earlier values of ``field``."""
+
+    def __init__(self, line_edit, field, index):
+        super().__init__(line_edit)
+        self.field = field
+        self.index = index
+        self.suggestions = QStringListModel(self)
+        self.setModel(self.suggestions)
+        line_edit.setCompleter(self)
+        line_edit.textEdited.connect(self.update_suggestions)
+
+    def update_suggestions(self, text):
+        """Offer the index's values starting with what has been typed so far."""
+        if not text:
+            return
+        self.suggestions.setStringList([value for value, _ in self.index.complete(self.field, text)])
+        self.complete()
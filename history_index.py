@@ -0,0 +1,328 @@
+"""Persistent index of earlier device serials and operators.
+
+For each indexed field, ``user_details.<field>.sorted`` lists every value seen
+with the number of sessions that had it, one ``value<TAB>count`` line per
+value in byte order, after a ``#total<TAB>sessions`` header. The file is
+memory-mapped and binary-searched in place, so a lookup reads a few dozen
+lines whatever the history size and opening the index loads nothing.
+
+New sessions are appended to ``user_details.<field>.delta`` (one value per
+line) and kept in memory as a small sorted list. Once it holds
+``COMPACT_AT`` distinct values, a background thread merges it into a new
+sorted file. Stations sharing the store share the index too: writes, and the
+check for what other stations appended, happen under
+``user_details.<field>.lock``.
+
+    python history_index.py rebuild
+    python history_index.py count device_sn SN123
+    python history_index.py complete operator an
+"""
+import bisect
+import mmap
+import os
+import re
+import sys
+import threading
+
+from locking import FileLock
+
+INDEX_BASE = "user_details"
+FIELDS = ("device_sn", "operator")
+COMPACT_AT = 10000  # Distinct values in the delta before it is merged into the sorted file
+COMPLETIONS = 20  # Suggestions returned by ``complete``
+HEADER = b"#total\t"
+
+
+def encode(value):
+    """Turn a field value into its key: UTF-8 with tabs, newlines and backslashes escaped."""
+    if value is None:
+        return b""
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").encode()
+
+
+def decode(key):
+    return re.sub(r"\\(.)", lambda match: {"t": "\t", "n": "\n"}.get(match[1], match[1]), key.decode())
+
+
+class SortedIndex:
+    """Values of one field with how many sessions had each."""
+
+    def __init__(self, base):
+        self.path = base + ".sorted"
+        self.delta_path = base + ".delta"
+        self.lock = FileLock(base + ".lock")
+        self.file_id = None  # Identifies the sorted file that is mapped
+        self.map = None
+        self.data_start = 0  # Offset of the first value line, after the header
+        self.main_total = 0
+        self.delta = {}  # Key -> sessions, for the delta file read so far
+        self.delta_keys = []  # The same keys, sorted
+        self.delta_total = 0
+        self.delta_size = 0
+        self.compacting = False
+        with self.lock:
+            self._sync()
+
+    def _sync(self):
+        """Pick up a new sorted file and delta lines from other stations (lock held)."""
+        try:
+            stat = os.stat(self.path)
+            file_id = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            file_id = None
+        if file_id != self.file_id:
+            self._map(file_id)
+        try:
+            size = os.path.getsize(self.delta_path)
+        except FileNotFoundError:
+            size = 0
+        if size > self.delta_size:
+            with open(self.delta_path, "rb") as f:
+                f.seek(self.delta_size)
+                chunk = f.read(size - self.delta_size)
+            chunk = chunk[:chunk.rfind(b"\n") + 1]  # Leave a line still being written
+            self.delta_size += len(chunk)
+            for key in chunk.split(b"\n")[:-1]:
+                self._count(key)
+
+    def _map(self, file_id):
+        """Map the current sorted file; its delta starts afresh with it."""
+        # The old map is left to the garbage collector: a compaction may still be reading it
+        self.map, self.data_start, self.main_total = None, 0, 0
+        if file_id is not None and file_id[2] > 0:
+            with open(self.path, "rb") as f:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data_start = self.map.find(b"\n") + 1
+            self.main_total = int(self.map[len(HEADER):self.data_start - 1])
+        self.file_id = file_id
+        self.delta, self.delta_keys, self.delta_total, self.delta_size = {}, [], 0, 0
+
+    def _count(self, key):
+        self.delta_total += 1
+        if not key:
+            return  # A session without a value still counts towards the total
+        if key not in self.delta:
+            bisect.insort(self.delta_keys, key)
+            self.delta[key] = 0
+        self.delta[key] += 1
+
+    def _seek(self, key):
+        """Offset of the first line in the sorted file whose value is not below ``key``."""
+        lo, hi = self.data_start, len(self.map)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            newline = self.map.rfind(b"\n", lo, mid)
+            start = lo if newline < 0 else newline + 1
+            if self.map[start:self.map.find(b"\t", start)] < key:
+                lo = self.map.find(b"\n", start) + 1
+            else:
+                hi = start
+        return lo
+
+    @staticmethod
+    def _lines(source, position):
+        """Yield ``(key, count)`` from a mapped sorted file, from offset ``position`` on."""
+        end = len(source)
+        while position < end:
+            line_end = source.find(b"\n", position)
+            key, count = source[position:line_end].split(b"\t")
+            yield key, int(count)
+            position = line_end + 1
+
+    def total(self):
+        """Number of sessions indexed."""
+        with self.lock:
+            self._sync()
+            return self.main_total + self.delta_total
+
+    def add(self, values):
+        """Index one session per value; return True once the delta is due for compaction."""
+        keys = [encode(value) for value in values]
+        with self.lock:
+            self._sync()
+            data = b"".join(key + b"\n" for key in keys)
+            with open(self.delta_path, "ab") as f:
+                f.write(data)
+            self.delta_size += len(data)
+            for key in keys:
+                self._count(key)
+            return len(self.delta_keys) >= COMPACT_AT and not self.compacting
+
+    def count(self, value):
+        """How many sessions had ``value``."""
+        key = encode(value)
+        if not key:
+            return 0
+        with self.lock:
+            self._sync()
+            count = self.delta.get(key, 0)
+            if self.map is not None:
+                for value, main_count in self._lines(self.map, self._seek(key)):
+                    if value == key:
+                        count += main_count
+                    break
+            return count
+
+    def complete(self, prefix, limit=COMPLETIONS):
+        """Return up to ``limit`` ``(value, sessions)`` pairs starting with ``prefix``, in order."""
+        key = encode(prefix)
+        counts = {}
+        with self.lock:
+            self._sync()
+            if self.map is not None:
+                for value, count in self._lines(self.map, self._seek(key)):
+                    if not value.startswith(key) or len(counts) == limit:
+                        break
+                    counts[value] = count
+            position = bisect.bisect_left(self.delta_keys, key)
+            for value in self.delta_keys[position:position + limit]:
+                if not value.startswith(key):
+                    break
+                counts[value] = counts.get(value, 0) + self.delta[value]
+        # Main values past the first ``limit`` sort after all of these, so the merge is exact
+        return [(decode(value), counts[value]) for value in sorted(counts)[:limit]]
+
+    def _replace(self, items, total, file_id, delta_size):
+        """Write ``items`` as the sorted file, keeping delta lines past ``delta_size``.
+
+        Gives up (returning False) if another station replaced the sorted file
+        since ``file_id`` was read.
+        """
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(HEADER + str(total).encode() + b"\n")
+            f.writelines(key + b"\t" + str(count).encode() + b"\n" for key, count in items)
+        with self.lock:
+            self._sync()
+            if self.file_id != file_id:
+                os.remove(tmp_path)
+                return False
+            os.replace(tmp_path, self.path)
+            rest = b""
+            if os.path.exists(self.delta_path):
+                with open(self.delta_path, "rb") as f:
+                    f.seek(delta_size)
+                    rest = f.read()
+            with open(self.delta_path + ".tmp", "wb") as f:
+                f.write(rest)
+            os.replace(self.delta_path + ".tmp", self.delta_path)
+            self._sync()
+        return True
+
+    def compact(self):
+        """Merge the delta into a new sorted file."""
+        with self.lock:
+            self._sync()
+            if self.compacting:
+                return
+            self.compacting = True
+            file_id, delta_size = self.file_id, self.delta_size
+            delta, delta_keys = dict(self.delta), list(self.delta_keys)
+            total = self.main_total + self.delta_total
+            # Keeps reading this map even if another station replaces the file meanwhile
+            main = self._lines(self.map, self.data_start) if self.map is not None else ()
+        try:
+            self._replace(merge(main, ((key, delta[key]) for key in delta_keys)), total, file_id, delta_size)
+        finally:
+            self.compacting = False
+
+    def mark(self):
+        """Where the index is up to, ``(file_id, delta_size)``; take it for ``rebuild`` before reading the store."""
+        with self.lock:
+            self._sync()
+            return self.file_id, self.delta_size
+
+    def rebuild(self, counts, total, mark):
+        """Replace the index with ``counts`` (key -> sessions) out of ``total`` sessions.
+
+        ``counts`` covers the sessions indexed up to ``mark``; delta lines
+        added since (by another station while the store was read) are kept.
+        """
+        file_id, delta_size = mark
+        self._replace(sorted(counts.items()), total, file_id, delta_size)
+
+
+def merge(main, delta):
+    """Merge two sorted ``(key, count)`` streams, adding the counts of equal keys."""
+    main, delta = iter(main), iter(delta)
+    a, b = next(main, None), next(delta, None)
+    while a is not None and b is not None:
+        if a[0] < b[0]:
+            yield a
+            a = next(main, None)
+        elif b[0] < a[0]:
+            yield b
+            b = next(delta, None)
+        else:
+            yield a[0], a[1] + b[1]
+            a, b = next(main, None), next(delta, None)
+    while a is not None:
+        yield a
+        a = next(main, None)
+    while b is not None:
+        yield b
+        b = next(delta, None)
+
+
+class HistoryIndex:
+    """Earlier values of ``FIELDS``, for suggestions and "tested before" checks."""
+
+    def __init__(self, base=INDEX_BASE):
+        self.fields = {field: SortedIndex(f"{base}.{field}") for field in FIELDS}
+
+    def add(self, records):
+        """Index newly created session records."""
+        for field, index in self.fields.items():
+            if index.add([record.get(field) for record in records]):
+                threading.Thread(target=index.compact, name="HistoryIndexCompaction", daemon=True).start()
+
+    def count(self, field, value):
+        """How many sessions had ``value`` in ``field``."""
+        return self.fields[field].count(value)
+
+    def complete(self, field, prefix, limit=COMPLETIONS):
+        """Values of ``field`` starting with ``prefix``, with their session counts."""
+        return self.fields[field].complete(prefix, limit)
+
+    def total(self):
+        """Number of sessions indexed."""
+        return self.fields[FIELDS[0]].total()
+
+    def rebuild(self, store):
+        """Index every session in ``store`` from scratch."""
+        marks = {field: index.mark() for field, index in self.fields.items()}  # Before the scan
+        counts, total = {field: {} for field in self.fields}, 0
+        for record in store.iter_records():
+            total += 1
+            for field, field_counts in counts.items():
+                key = encode(record.get(field))
+                if key:
+                    field_counts[key] = field_counts.get(key, 0) + 1
+        for field, index in self.fields.items():
+            index.rebuild(counts[field], total, marks[field])
+
+
+def open_history_index(store, base=INDEX_BASE):
+    """Open the index, rebuilding it if it does not cover the sessions in ``store``."""
+    index = HistoryIndex(base)
+    if index.total() != store.count():
+        index.rebuild(store)
+    return index
+
+
+if __name__ == "__main__":
+    from storage import open_store
+    command = sys.argv[1] if len(sys.argv) > 1 else "rebuild"
+    store = open_store()
+    if command == "rebuild":
+        history = HistoryIndex()
+        history.rebuild(store)
+        print(f"Indexed {history.total()} sessions")
+    elif command == "count":
+        print(open_history_index(store).count(sys.argv[2], sys.argv[3]))
+    elif command == "complete":
+        for value, count in open_history_index(store).complete(sys.argv[2], sys.argv[3]):
+            print(f"{value}\t{count}")
+    else:
+        sys.exit(f"Unknown command: {command}")
+    store.close()
@@ -0,0 +1,111 @@
+"""Cache of decoded, pre-scaled step images.
+
+Decoding a PNG and smooth-scaling it takes long enough to make a screen
+stutter, so scaled pixmaps are kept in an LRU cache keyed by
+``(path, width, height, devicePixelRatio)`` and capped by size in bytes.
+``prefetch`` decodes and scales an image on a ``QThreadPool`` thread (as a
+``QImage``, which is safe off the UI thread) so it is ready before it is shown.
+"""
+from collections import OrderedDict
+
+from PySide6.QtCore import QObject, QRunnable, QSize, Qt, QThreadPool, Signal
+from PySide6.QtGui import QImage, QPixmap
+
+IMAGE_SIZE = QSize(1000, 1300)  # Size the setup screens show their images at
+MAX_BYTES = 64 * 1024 * 1024
+
+
+def scale_image(image, size, device_pixel_ratio):
+    """Scale ``image`` to fit ``size`` logical pixels on a screen with the given ratio."""
+    scaled = image.scaled(size * device_pixel_ratio, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+    scaled.setDevicePixelRatio(device_pixel_ratio)
+    return scaled
+
+
+class ImageLoaderSignals(QObject):
+    loaded = Signal(object, QImage)  # Cache key, scaled image
+
+
+class ImageLoader(QRunnable):
+    """Decode and scale one image on a worker thread."""
+
+    def __init__(self, key):
+        super().__init__()
+        self.setAutoDelete(False)  # The cache keeps the loader until it reports back
+        self.key = key
+        self.signals = ImageLoaderSignals()
+
+    def run(self):
+        path, width, height, device_pixel_ratio = self.key
+        image = QImage(path)
+        if not image.isNull():
+            image = scale_image(image, QSize(width, height), device_pixel_ratio)
+        self.signals.loaded.emit(self.key, image)
+
+
+class PixmapCache(QObject):
+    def __init__(self, max_bytes=MAX_BYTES):
+        super().__init__()
+        self.max_bytes = max_bytes
+        self.pixmaps = OrderedDict()  # key -> QPixmap, least recently used first
+        self.bytes = 0
+        self.pending = {}  # key -> ImageLoader still running
+
+    @staticmethod
+    def key(path, size, device_pixel_ratio):
+        return path, size.width(), size.height(), device_pixel_ratio
+
+    @staticmethod
+    def cost(pixmap):
+        return pixmap.width() * pixmap.height() * pixmap.depth() // 8
+
+    def get(self, path, size=IMAGE_SIZE, device_pixel_ratio=1.0):
+        """Return the scaled pixmap for ``path``, decoding it now on a miss."""
+        key = self.key(path, size, device_pixel_ratio)
+        pixmap = self.pixmaps.get(key)
+        if pixmap is not None:
+            self.pixmaps.move_to_end(key)
+            return pixmap
+        image = QImage(path)
+        if not image.isNull():
+            image = scale_image(image, size, device_pixel_ratio)
+        return self.put(key, image)
+
+    def prefetch(self, path, size=IMAGE_SIZE, device_pixel_ratio=1.0):
+        """Start decoding ``path`` in the background unless it is cached or loading."""
+        key = self.key(path, size, device_pixel_ratio)
+        if key in self.pixmaps or key in self.pending:
+            return
+        loader = ImageLoader(key)
+        loader.signals.loaded.connect(self.on_loaded)
+        self.pending[key] = loader
+        QThreadPool.globalInstance().start(loader)
+
+    def on_loaded(self, key, image):
+        """Turn a prefetched image into a pixmap (pixmaps live on the UI thread)."""
+        self.pending.pop(key, None)
+        if key not in self.pixmaps:
+            self.put(key, image)
+
+    def put(self, key, image):
+        """Cache ``image`` as a pixmap, evicting least recently used entries."""
+        pixmap = QPixmap.fromImage(image)
+        if key in self.pixmaps:
+            self.bytes -= self.cost(self.pixmaps.pop(key))
+        self.pixmaps[key] = pixmap
+        self.bytes += self.cost(pixmap)
+        while self.bytes > self.max_bytes and len(self.pixmaps) > 1:
+            _, evicted = self.pixmaps.popitem(last=False)
+            self.bytes -= self.cost(evicted)
+        return pixmap
+
+
+_cache = None
+
+
+def pixmap_cache():
+    """Return the application-wide pixmap cache."""
+    global _cache
+    if _cache is None:
+        _cache = PixmapCache()
+    return _cache
@@ -0,0 +1,106 @@
+"""Journal of the station's session in progress, to pick it up again after a crash.
+
+The current session lives in ``MainWindow`` memory and in ``StoreWriter``'s
+queue, so a crash or a kiosk reboot mid-session used to lose it.
+``user_details.session.journal`` records it as it goes, one JSON line per
+event, each written and fsynced before the click that caused it returns::
+
+    {"start": "<session id>", "details": {...}}    submit_details; starts the file over
+    {"save": {...}}                                data queued for the session
+    {"step": [4, 2, 0.137]}                        a setup screen's step, and the dial's zero
+
+"Completed Setups" is saved with the session like any other data, so the
+setups done come back with the record. ``load`` replays the file into a
+``JournalState``: the session's record as it was queued (details and every
+save merged), the setups done and the steps reached. The file only ever
+holds the current session, so restoring costs the same however long the
+history. A line cut short by the crash is ignored. ``finish`` removes the
+file when the app exits with every save written (``StoreWriter.close``
+says so), so the next start begins a new session; otherwise the session
+is restored and its saves queued again. The json store forgets session ids
+on restart, so there the journal is dropped instead (see
+``MainWindow.restore_session``).
+"""
+import json
+import os
+
+from workflow import completed_setups
+
+JOURNAL_PATH = "user_details.session.journal"
+
+
+class JournalState:
+    """The session in progress, as replayed from the journal."""
+
+    __slots__ = ("session_id", "record", "steps")
+
+    def __init__(self, session_id, record):
+        self.session_id = session_id
+        self.record = record  # The details with every queued save merged in
+        self.steps = {}  # Setup number -> (step, dial zero or None)
+
+    @property
+    def completed(self):
+        """Numbers of the setups marked completed."""
+        return completed_setups(self.record)
+
+
+class SessionJournal:
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self.file = None  # Opened by the first event
+
+    def _write(self, event, mode="ab"):
+        if self.file is None or mode == "wb":
+            if self.file is not None:
+                self.file.close()
+            self.file = open(self.path, mode)
+        self.file.write((json.dumps(event) + "\n").encode())
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def start(self, session_id, details):
+        """Start the journal over for a new session."""
+        self._write({"start": session_id, "details": details}, "wb")
+
+    def save(self, data):
+        """Record data queued for the session."""
+        self._write({"save": data})
+
+    def step(self, setup, step, zero=None):
+        """Record the step Setup #``setup``'s screen is at, and the dial's zero if it was read."""
+        self._write({"step": [setup, step, zero]})
+
+    def load(self):
+        """Replay the journal; None if there is no session in progress."""
+        try:
+            with open(self.path, "rb") as f:
+                lines = f.read().splitlines()
+        except FileNotFoundError:
+            return None
+        state = None
+        for line in lines:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                break  # Cut short by the crash; nothing was written after it
+            if "start" in event:
+                state = JournalState(event["start"], dict(event["details"]))
+            elif state is None:
+                continue
+            elif "save" in event:
+                state.record.update(event["save"])
+            elif "step" in event:
+                setup, step, zero = event["step"]
+                state.steps[setup] = (step, zero)
+        return state
+
+    def finish(self):
+        """Forget the session; the app is closing normally."""
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
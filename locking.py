@@ -0,0 +1,65 @@
+"""Advisory file locks shared by every station writing to the same store.
+
+``FileLock(path)`` holds an exclusive lock on ``path`` (created if missing)
+for the length of a ``with`` block. Other processes block until it is
+released, or until the holder exits, which releases its locks even after a
+crash. POSIX record locks (``lockf``) are used because they also work on
+NFS mounts; Windows uses ``msvcrt.locking``. The OS keeps such locks per
+process, so threads of one process are serialized by a thread lock as well,
+and each lock file stays open for the life of the process.
+"""
+import os
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+_registry_lock = threading.Lock()
+_handles = {}  # Absolute path -> [thread lock, file descriptor, depth]
+
+
+class FileLock:
+    """Exclusive advisory lock on ``path``; re-entrant within a thread."""
+
+    def __init__(self, path):
+        self.path = os.path.abspath(path)
+        with _registry_lock:
+            if self.path not in _handles:
+                fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+                _handles[self.path] = [threading.RLock(), fd, 0]
+            self.handle = _handles[self.path]
+
+    def __enter__(self):
+        thread_lock, fd, depth = self.handle
+        thread_lock.acquire()
+        if depth == 0:
+            try:
+                if fcntl is not None:
+                    fcntl.lockf(fd, fcntl.LOCK_EX)
+                else:
+                    os.lseek(fd, 0, os.SEEK_SET)
+                    while True:
+                        try:
+                            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+                            break
+                        except OSError:
+                            continue  # LK_LOCK gives up after ten seconds; keep waiting
+            except BaseException:
+                thread_lock.release()
+                raise
+        self.handle[2] = depth + 1
+        return self
+
+    def __exit__(self, *exc_info):
+        thread_lock, fd, depth = self.handle
+        self.handle[2] = depth - 1
+        if depth == 1:
+            if fcntl is not None:
+                fcntl.lockf(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        thread_lock.release()
@@ -1,24 +1,190 @@
 import os
 import sys
-from PySide6.QtCore import Qt
-from PySide6.QtGui import QPixmap
+from PySide6.QtCore import QDate, Qt, QThreadPool, QTimer
 from PySide6.QtWidgets import QApplication, QWidget, QVBoxLayout, QFormLayout, QLineEdit, QLabel, QHBoxLayout, \
-    QPushButton, QFrame, QGroupBox, QDateEdit, QCheckBox, QComboBox, QDialog, QDialogButtonBox, QMessageBox
-
-import json
-import csv
+    QPushButton, QFrame, QGroupBox, QDateEdit, QCheckBox, QComboBox, QProgressBar, QStackedWidget
+
+from aggregates import AggregateUpdater
+from journal import SessionJournal
+from navigation import Page, Router
+from storage import open_store
+from theme import apply_style_sheet, set_state
+from workflow import MARKER_CHOICES, completed_result, deflection_result, details_complete, marker_result, \
+    motion_result, new_session, setup_number
+from writer import StoreWriter
+
+# Build the setup screens in idle time after the main window is up, so the
+# first visit does not pay for it (set PPT_WARM_SCREENS=0 to build on demand only)
+WARM_SCREENS = os.environ.get("PPT_WARM_SCREENS", "1") != "0"
+WARM_DELAY = 500  # Milliseconds after start-up before warming screens
+WINDOW_TITLE = "PowerPoint MVP"
+HOME = "home"  # Page name of the main screen
+HISTORY = "history"  # Page name of the session history
+SPC = "spc"  # Page name of the SPC panel
+DASHBOARD = "dashboard"  # Page name of the supervisors' dashboard
+
+# Style sheet for the whole application, set once by MainWindow (see theme.py).
+# Widgets are picked out by object name; states by :disabled or dynamic properties.
+STYLE_SHEET = """
+#mainWindow, #mainWindow QProgressBar, QMessageBox {
+    background-color: #FFFFFF;
+}
+QPushButton#generateReportButton {
+    background-color: #4CAF50;
+    color: white;
+    padding: 10px;
+    border-radius: 5px;
+}
+QPushButton#generateReportButton:hover {
+    background-color: #45a049;  /* Lighter green on hover */
+}
+QPushButton#historyButton, QPushButton#spcButton, QPushButton#dashboardButton {
+    background-color: #3D75A2;
+    color: white;
+    padding: 10px;
+    border-radius: 5px;
+}
+QPushButton#cancelReportButton {
+    background-color: #f44336;
+    color: white;
+    padding: 10px;
+    border-radius: 5px;
+}
+
+/* Device SN, Operator and Date form */
+#detailsForm, QFrame#detailsRule {
+    background-color: #3D75A2;
+}
+#detailsForm QLineEdit, #detailsForm QDateEdit {
+    background-color: white;
+    color: black;
+    border: 1px solid #ccc;
+}
+QLabel#historyHint {
+    color: white;
+    font-style: italic;
+}
+QPushButton#submitDetailsButton {
+    background-color: grey;
+    color: white;
+    padding: 10px;
+    border-radius: 5px;
+}
+QPushButton#submitDetailsButton[ready="true"] {
+    background-color: #2196F3;
+}
+QPushButton#submitDetailsButton[ready="true"]:hover {
+    background-color: #3b7e99;
+}
+
+/* Test setup selection */
+QGroupBox#setupSelect {
+    background-color: #3D75A2;
+    color: white;
+    padding: 100px;
+}
+#setupSelect QPushButton {
+    background-color: #cccccc;
+    color: black;
+    padding: 10px;
+    border-radius: 5px;
+}
+#setupSelect QPushButton:enabled {
+    background-color: #3b7e99;
+    color: white;
+}
+#setupSelect QPushButton[completed="true"] {
+    background-color: orange;
+}
+QDialog#infoDialog, QDialog#infoDialog QWidget {
+    background-color: lightgreen;
+    color: black;
+}
+
+/* Setup screens */
+#setupScreen {
+    background-color: lightblue;
+}
+QPushButton#backButton {
+    background-color: #f44336;
+    color: white;
+    padding: 10px;
+    border-radius: 5px;
+}
+QLabel#screenTitle {
+    font-size: 16px;
+    font-weight: bold;
+    color: #333;
+}
+QLabel#fieldLabel {
+    font-size: 14px;
+    color: #333;
+    margin-right: 10px;
+}
+#setupScreen QComboBox {
+    background-color: white;
+    padding: 5px;
+    border: 1px solid #ccc;
+    border-radius: 3px;
+    color: #333;
+}
+#setupScreen QComboBox::drop-down {
+    border-left: 1px solid #ccc;
+}
+QLabel#measuredMaxHeightLabel {
+    color: black;
+}
+#setupScreen QLineEdit {
+    background-color: white;
+    color: black;
+}
+QPushButton#setupSubmitButton, QPushButton#nextButton {
+    background-color: #4CAF50;
+    color: white;
+    padding: 10px;
+    border-radius: 5px;
+}
+QPushButton#setupSubmitButton:disabled {
+    background-color: grey;
+    color: #ddd;
+}
+QPushButton#nextButton:disabled {
+    background-color: grey;
+}
+QCheckBox#stepCheckBox {
+    background-color: lightblue;
+    color: black;
+    font-size: 14px;
+}
+"""
 
 
 class MainWindow(QWidget):
     def __init__(self):
-        color = "#FFFFFF"
         super().__init__()
-        self.setWindowTitle("PowerPoint MVP")  # Set window title
-        self.setStyleSheet(f"background-color: {color}	;")
+        apply_style_sheet(STYLE_SHEET)
+        self.setObjectName("mainWindow")
+        self.setWindowTitle(WINDOW_TITLE)  # Set window title
         self.setGeometry(0, 10, 1430, 0)  # Set window size and position
 
         self.completed_setups = set()  # Track completed setups by their names
         self.user_details = {}  # Store the user's details (Device SN, Operator, Date)
+        self.session_id = None  # Id of the session created by submit_details
+        self.history = None  # Index of earlier serials and operators, once loaded (see load_history)
+        self.history_loader = None
+        self.spc = None  # Running SPC statistics, once loaded (see load_spc)
+        self.spc_columns = None  # Session results column-wise, for the control charts
+        self.spc_loader = None
+        self.spc_pending = []  # Sessions and results saved while the statistics load
+        self.store = open_store()  # Session storage backend (see storage.py)
+        # Saves run on a background thread, which also counts them for the dashboard
+        self.writer = StoreWriter(self.store, AggregateUpdater())
+        self.writer.failed.connect(self.on_save_failed)
+        self.journal = SessionJournal()  # The session in progress, kept through a crash (see journal.py)
+        self.restored_steps = {}  # Setup number -> (step, dial zero) to reopen its screen at, from the journal
+        QApplication.instance().aboutToQuit.connect(self.close_store)  # Flush before exit
+        self.report_job = None  # Report running in the background, if any
+        QApplication.instance().aboutToQuit.connect(self.cancel_report)
 
         # Initialize UI components
         self.main_layout = QVBoxLayout()
@@ -29,24 +195,35 @@ class MainWindow(QWidget):
         # set background color for the form layout
         self.top_row_layout = QHBoxLayout()
 
-        # Mapping screens
-        self.screens = {
-            "Test Setup #2:Telescope: Range, manual.": SetupScreen2(self),
-            "Test Setup #3:Lift: Range, powered": SetupScreen3(self),
-            "Test Setup #4:Deflection, vertical": SetupScreen4(self),
-            "Test Setup #5:(Right Bracket) Deflection, horizontal": SetupScreen5(self),
-            "Test Setup #6:(Right Bracket) Lift: Behavior, motion": SetupScreen6(self),
-            "Test Setup #7:(Left Bracket) Deflection, horizontal": SetupScreen7(self),
-            "Test Setup #8:(Left Bracket) Lift: Behavior, motion": SetupScreen8(self)
+        # The main screen and the setup screens are pages of one stacked widget;
+        # setup screens are built the first time they are opened (see screen())
+        self.stack = QStackedWidget()
+        self.router = Router(self.stack)
+        self.stack.currentChanged.connect(self.update_window_title)
+        screen_factories = {
+            "Test Setup #2:Telescope: Range, manual.": SetupScreen2,
+            "Test Setup #3:Lift: Range, powered": SetupScreen3,
+            "Test Setup #4:Deflection, vertical": SetupScreen4,
+            "Test Setup #5:(Right Bracket) Deflection, horizontal": SetupScreen5,
+            "Test Setup #6:(Right Bracket) Lift: Behavior, motion": SetupScreen6,
+            "Test Setup #7:(Left Bracket) Deflection, horizontal": SetupScreen7,
+            "Test Setup #8:(Left Bracket) Lift: Behavior, motion": SetupScreen8
         }
+        for setup_text, factory in screen_factories.items():
+            self.router.register(setup_text, lambda setup_text=setup_text, factory=factory: (
+                self.build_screen(setup_text, factory)))
+        self.router.register(HISTORY, self.build_history_screen)
+        self.router.register(SPC, self.build_spc_screen)
+        self.router.register(DASHBOARD, self.build_dashboard_screen)
+        if WARM_SCREENS:
+            QTimer.singleShot(WARM_DELAY, self.warm_screens)
+        QTimer.singleShot(0, self.load_history)  # Once the window is up
+        QTimer.singleShot(0, self.load_spc)
 
         self.device_sn = QLineEdit()
         self.operator = QLineEdit()
         self.date = QDateEdit()
         self.date.setCalendarPopup(True)
-        self.device_sn.setStyleSheet("background-color: white; color: black; border: 1px solid #ccc;")
-        self.operator.setStyleSheet("background-color: white; color: black; border: 1px solid #ccc;")
-        self.date.setStyleSheet("background-color: white; color: black; border: 1px solid #ccc;")
 
         # Set up the UI
         self.setup_top_button()
@@ -54,26 +231,24 @@ class MainWindow(QWidget):
         self.setup_test_select_section()
         self.main_layout.setSpacing(40)  # Remove spacing between widgets
 
-        # Set the layout for the window
-        self.setLayout(self.main_layout)
-
-    def setup_top_button(self):
-        """Set up the 'Generate Report' button at the top-right corner."""
-        self.top_button_layout.setAlignment(Qt.AlignRight)  # Align the button to the right
-        generate_report_button = QPushButton("Generate Report")
-        generate_report_button.setStyleSheet(
-            "background-color: #4CAF50; color: white; padding: 20px; border-radius: 5px;")
-        self.top_button_layout.addWidget(generate_report_button)
-
-        # Add the top button layout to the main layout
-        self.main_layout.addLayout(self.top_button_layout)
+        # Set the layout for the main screen page and the window
+        self.home = QWidget()
+        self.home.setLayout(self.main_layout)
+        self.router.add(HOME, self.home)
+        window_layout = QVBoxLayout()
+        window_layout.setContentsMargins(0, 0, 0, 0)
+        window_layout.addWidget(self.stack)
+        self.setLayout(window_layout)
+        self.restore_session()
 
     def setup_form_layout(self):
-        # Top Form Color Background (Device SN, Operator, Date)
-        color = "#3D75A2"
         """Set up the form layout with labels and input fields."""
         self.top_row_layout.addWidget(QLabel("Device SN:"))
         self.top_row_layout.addWidget(self.device_sn)
+        self.history_hint = QLabel()  # "Previously tested N times", once the serial is known
+        self.history_hint.setObjectName("historyHint")
+        self.history_hint.setVisible(False)
+        self.top_row_layout.addWidget(self.history_hint)
         self.top_row_layout.addWidget(QLabel("Operator:"))
         self.top_row_layout.addWidget(self.operator)
         self.top_row_layout.addWidget(QLabel("Date:"))
@@ -84,23 +259,9 @@ class MainWindow(QWidget):
 
         # Submit button (initially disabled)
         submit_button = QPushButton("Submit")
-        # submit_button.setStyleSheet("""
-        #     background-color: #808080; color: white; padding: 10px; border-radius: 5px;
-        #     transition: background-color 0.3s;
-        # """)
+        submit_button.setObjectName("submitDetailsButton")  # Grey until the form is filled in, then blue
         submit_button.setEnabled(False)  # Disable initially
         submit_button.clicked.connect(self.submit_details)
-        submit_button.setStyleSheet("""
-            QPushButton {
-                background-color: #808080;
-                color: white;
-                padding: 10px;
-                border-radius: 5px;
-            }
-            QPushButton:hover {
-                background-color: #3b7e99;
-            }
-        """)
 
         self.submit_button = submit_button  # Save reference to button
 
@@ -108,14 +269,15 @@ class MainWindow(QWidget):
 
         # Add a horizontal line for separation
         horizontal_line = QFrame()
+        horizontal_line.setObjectName("detailsRule")
         horizontal_line.setFrameShape(QFrame.HLine)
         horizontal_line.setFrameShadow(QFrame.Sunken)
         self.form_layout.addRow(horizontal_line)
 
         # Wrap the form layout inside a QWidget to apply a stylesheet
         form_widget = QWidget()
+        form_widget.setObjectName("detailsForm")
         form_widget.setLayout(self.form_layout)
-        form_widget.setStyleSheet(f"background-color:{color};")  # Set background color for the form section
 
         # Add the form widget to the main layout
         self.main_layout.addWidget(form_widget)
@@ -124,42 +286,92 @@ class MainWindow(QWidget):
         self.device_sn.textChanged.connect(self.update_submit_button_state)
         self.operator.textChanged.connect(self.update_submit_button_state)
         self.date.dateChanged.connect(self.update_submit_button_state)
+        self.device_sn.textChanged.connect(self.update_history_hint)
 
     def update_submit_button_state(self):
         """Enable or disable the submit button based on whether all fields are filled."""
-        if self.device_sn.text() and self.operator.text() and self.date.date():
-            self.submit_button.setEnabled(True)  # Enable the button when all fields are filled
-            self.submit_button.setStyleSheet("""
-                QPushButton {
-                    background-color: #2196F3;
-                    color: white;
-                    padding: 10px;
-                    border-radius: 5px;
-                }
-                QPushButton:hover {
-                    background-color: #3b7e99;
-                }
-            """)
+        ready = details_complete(self.device_sn.text(), self.operator.text(), self.date.date())
+        self.submit_button.setEnabled(ready)
+        set_state(self.submit_button, "ready", ready)  # Only restyles when the form becomes (in)complete
+
+    def load_history(self):
+        """Open the index of earlier serials and operators in the background."""
+        from history_completer import HistoryIndexLoader
+
+        self.history_loader = HistoryIndexLoader(open_store)
+        self.history_loader.signals.loaded.connect(self.on_history_loaded)
+        self.history_loader.signals.failed.connect(self.on_history_failed)
+        QThreadPool.globalInstance().start(self.history_loader)
+
+    def on_history_loaded(self, history):
+        """Suggest earlier serials and operators as they are typed."""
+        from history_completer import HistoryCompleter
+
+        self.history = history
+        self.history_loader = None
+        HistoryCompleter(self.device_sn, "device_sn", history)
+        HistoryCompleter(self.operator, "operator", history)
+        self.update_history_hint(self.device_sn.text())
+
+    def on_history_failed(self, message):
+        """Carry on without suggestions, which are only a convenience, saying why next to the serial."""
+        self.history_loader = None
+        self.history_hint.setText(f"Earlier tests unavailable: {message}")
+        self.history_hint.setVisible(True)
+
+    def update_history_hint(self, device_sn):
+        """Say how many times this serial has been tested before, if ever."""
+        if self.history is None:
+            return  # Still loading, or the hint says why it is unavailable
+        count = self.history.count("device_sn", device_sn)
+        if count:
+            self.history_hint.setText(f"Previously tested {count} time{'s' if count != 1 else ''}")
+        self.history_hint.setVisible(bool(count))
+
+    def load_spc(self):
+        """Load the SPC statistics and the control charts' columns in the background."""
+        from spc_panel import SpcLoader  # NumPy; not needed until the window is up
+
+        if self.spc_loader is not None:
+            return  # Already loading
+        self.spc_loader = SpcLoader(open_store, self.writer)
+        self.spc_loader.signals.loaded.connect(self.on_spc_loaded)
+        self.spc_loader.signals.failed.connect(self.on_spc_failed)
+        QThreadPool.globalInstance().start(self.spc_loader)
+
+    def on_spc_loaded(self, columns, stats):
+        """Keep the statistics up to date from now on, counting what was saved while they loaded."""
+        self.spc_loader = None
+        self.spc_columns = columns
+        if self.spc is None:
+            for session_id, record, data in self.spc_pending:
+                if data is not None:
+                    stats.add_results(session_id, record, data)  # In place of what the loader read, if anything
+                elif not columns.holds(session_id):  # Not written before the loader read the store
+                    stats.add_session(record)
+            self.spc, self.spc_pending = stats, []
+        if self.router.current_name() == SPC:
+            self.router.page(SPC).refresh()
+
+    def on_spc_failed(self, message):
+        """Carry on without SPC, saying why on the page if it is showing; it tries again when next shown."""
+        self.spc_loader = None
+        if self.router.current_name() == SPC:
+            self.router.page(SPC).status_label.setText(f"Statistics unavailable: {message}")
+
+    def update_spc(self, data=None):
+        """Count the current session (without ``data``) or a setup's results (``data``) in the SPC statistics."""
+        if self.spc is None:
+            self.spc_pending.append((self.session_id, dict(self.user_details), data))
+        elif data is None:
+            self.spc.add_session(self.user_details)
         else:
-            self.submit_button.setEnabled(False)  # Disable the button if any field is empty
-            self.submit_button.setStyleSheet("""
-                QPushButton {
-                    background-color: grey;
-                    color: white;
-                    padding: 10px;
-                    border-radius: 5px;
-                }
-                QPushButton:hover {
-                    background-color: grey;
-                }
-            """)
+            self.spc.add_results(self.session_id, self.user_details, data)
 
     def setup_test_select_section(self):
-        # Setups form color Background (Setup #2 to Setup #8)
-        color = "#3D75A2"
         """Set up the test selection section with button-like rows and checkboxes."""
         test_select_group = QGroupBox("Select Test Setup")
-        test_select_group.setStyleSheet(f"background-color:{color} ; color: white; padding: 100px;")
+        test_select_group.setObjectName("setupSelect")
         test_select_layout = QVBoxLayout()
 
         test_setups = [
@@ -178,10 +390,7 @@ class MainWindow(QWidget):
         for setup in test_setups:
             button = QPushButton(setup)
             self.setup_buttons[setup] = button  # Store the button for later reference
-            self.update_button_style(setup)  # Apply the appropriate style based on completion status
-
-            button.setEnabled(False)  # Disable the buttons initially
-            button.setStyleSheet("background-color: #cccccc; color: black; padding: 10px; border-radius: 5px;")
+            button.setEnabled(False)  # Disable the buttons initially (greyed out by the style sheet)
             button.clicked.connect(lambda checked, text=setup: self.redirect_to_screen(text))
             test_select_layout.addWidget(button)
 
@@ -192,76 +401,79 @@ class MainWindow(QWidget):
         self.main_layout.addWidget(test_select_group)
 
     def update_button_style(self, setup):
-        """Update the button's color based on its completion status."""
-        if setup in self.completed_setups:
-            self.setup_buttons[setup].setStyleSheet(
-                "background-color: orange; color: white; padding: 10px; border-radius: 5px;"
-            )
-        else:
-            self.setup_buttons[setup].setStyleSheet(
-                """
-                QPushButton {
-                    background-color: #3b7e99; 
-                    color: white; 
-                    padding: 10px; 
-                    margin-bottom: 5px; 
-                    border-radius: 5px;
-                    text-align: left;
-                }
-                QPushButton:hover {
-                    background-color: #2a697e;
-                }
-                QPushButton:pressed {
-                    background-color: #1e4d5f;
-                }
-                """
-            )
+        """Turn the setup's button orange once it is completed."""
+        set_state(self.setup_buttons[setup], "completed", setup in self.completed_setups)
 
     def submit_details(self):
         """Save the user details to a JSON file and enable the test setup section."""
-        self.user_details["device_sn"] = self.device_sn.text()
-        self.user_details["operator"] = self.operator.text()
-        self.user_details["date"] = self.date.date().toString()
-        self.user_details["Setup2 - Unit Reach Marker"] = None
-        self.user_details["Setup2 - Measured Max Height"] = None
-        self.user_details["Setup3 - Unit Reach Marker"] = None
-        self.user_details["Setup3 - Measured Max Height"] = None
-        self.user_details["Setup4 - Click to Zero Vertical Position Dial"] = False
-        self.user_details["Setup4 - Click to record vertical deflection"] = False
-
-        # Save the data to a JSON file
-        if os.path.exists("user_details.json"):
-            # If the file exists, read the existing data
-            with open("user_details.json", "r") as f:
-                existing_data = json.load(f)
-        else:
-            # If the file doesn't exist, initialize an empty list
-            existing_data = []
-
-            # Append the new data to the existing data
-        existing_data.append(self.user_details)
-
-        # Save the updated data to the JSON file
-        with open("user_details.json", "w") as f:
-            json.dump(existing_data, f, indent=4)
+        self.user_details.update(new_session(
+            self.device_sn.text(), self.operator.text(), self.date.date().toPython()))
+
+        # Queue the new session for the background writer; setup screens
+        # save their results against this id
+        self.session_id = self.writer.create_session(self.user_details)
+        self.journal.start(self.session_id, self.user_details)
+        if self.history is not None:
+            self.history.add([self.user_details])
+        self.update_spc()
+        self.submit_button.setEnabled(False)  # Ignore a second click on Submit
         # Show the popup
         self.show_popup("Data Saved! Setups enabled now")
+        self.lock_details()
 
+    def lock_details(self):
+        """Enable the test setups and disable the details form, once the session has started."""
+        self.submit_button.setEnabled(False)
         # Enable the test setup buttons after submitting
         for button in self.setup_buttons.values():
             button.setEnabled(True)
-            button.setStyleSheet("background-color: #3b7e99; color: white; padding: 10px; border-radius: 5px;")
 
         # Optionally, disable the form section after submission
         self.device_sn.setEnabled(False)
         self.operator.setEnabled(False)
         self.date.setEnabled(False)
 
+    def restore_session(self):
+        """Pick up the session that was in progress when the app last stopped, from the journal."""
+        state = self.journal.load()
+        if state is None:
+            return
+        if not self.store.keeps_ids:
+            # It could not tell whether the session reached the store before the stop, so it would save it twice
+            self.journal.finish()
+            QTimer.singleShot(0, lambda: self.show_popup(
+                "The session in progress when the app stopped cannot be picked up with the json store; "
+                "start it again."))
+            return
+        self.session_id = state.session_id
+        self.user_details = state.record
+        self.writer.restore_session(self.session_id, self.user_details)  # Saves lost with the crash
+        self.device_sn.setText(self.user_details.get("device_sn") or "")
+        self.operator.setText(self.user_details.get("operator") or "")
+        self.date.setDate(QDate.fromString(self.user_details.get("date") or ""))
+        self.lock_details()
+        for setup in self.setup_buttons:
+            if setup_number(setup) in state.completed:
+                self.completed_setups.add(setup)
+                self.update_button_style(setup)
+        self.restored_steps = state.steps
+
+    def close_store(self):
+        """Flush the queued saves; forget the journal only if they all reached the store."""
+        if self.writer.close():
+            self.journal.finish()
+
+    def on_save_failed(self, message):
+        """Tell the operator a queued save could not be written (retried), or was refused by the store (set aside)."""
+        self.show_popup(f"Could not save data: {message}")
+
     def show_popup(self, message):
         """Show a popup dialog with the given message."""
+        from PySide6.QtWidgets import QDialog, QDialogButtonBox  # Not needed until the first popup
+
         dialog = QDialog(self)
+        dialog.setObjectName("infoDialog")
         dialog.setWindowTitle("Info")
-        dialog.setStyleSheet("background-color: lightgreen; color: black;")
         layout = QVBoxLayout(dialog)
 
         label = QLabel(message)
@@ -276,73 +488,183 @@ class MainWindow(QWidget):
 
     def redirect_to_screen(self, setup_text):
         """Handle redirection based on the setup selected."""
-        if setup_text in self.screens:
-            self.hide()  # Hide the main window
-            self.screens[setup_text].show()
+        if setup_text in self.router:
+            self.router.navigate(setup_text)
+        else:
+            print(f"No screen defined for: {setup_text}")
 
-            # Mark the setup as completed when the user exits the setup screen
-            self.screens[setup_text].go_back = lambda: (
-                self.mark_setup_completed(setup_text),
+    def go_back(self):
+        """Go back to the page before the current one."""
+        self.router.back()
 
-                super(self.screens[setup_text].__class__, self.screens[setup_text]).go_back()
-            )
+    def screen(self, setup_text):
+        """Return the screen for a setup, building it on first use."""
+        return self.router.page(setup_text)
 
-        else:
-            print(f"No screen defined for: {setup_text}")
+    def build_screen(self, setup_text, factory):
+        """Build a setup screen for the router, at the step the journal left it at."""
+        screen = factory(self)
+        step = self.restored_steps.pop(setup_number(setup_text), None)
+        if step is not None:
+            screen.restore_step(*step)  # Back where it was when the app stopped
+        return screen
+
+    def build_history_screen(self):
+        """Build the session history page for the router."""
+        from history_browser import HistoryScreen
+
+        return HistoryScreen(self, open_store)
+
+    def build_spc_screen(self):
+        """Build the SPC page for the router."""
+        from spc_panel import SpcScreen
+
+        return SpcScreen(self)
+
+    def build_dashboard_screen(self):
+        """Build the supervisors' dashboard for the router."""
+        from dashboard import DashboardScreen
+
+        return DashboardScreen(self, open_store)
+
+    def warm_screens(self):
+        """Build the screens not opened yet, one per event loop pass, while the app is idle."""
+        for setup_text in self.router.factories:
+            if setup_text not in self.router.pages:
+                self.screen(setup_text)
+                QTimer.singleShot(0, self.warm_screens)  # Let input events in between screens
+                return
+
+    def update_window_title(self):
+        """Title the window after the current page, e.g. "Test Setup #4"."""
+        self.setWindowTitle(self.stack.currentWidget().windowTitle() or WINDOW_TITLE)
 
     def mark_setup_completed(self, setup):
-        """Mark a setup as completed and update its button style."""
+        """Mark a setup as completed, update its button style and save it with the session."""
+        new = setup not in self.completed_setups
         self.completed_setups.add(setup)
         self.update_button_style(setup)
+        if new and self.session_id is not None:  # Counted on the dashboard (see aggregates.py)
+            data = completed_result(setup_number(name) for name in self.completed_setups)
+            self.user_details.update(data)
+            self.save_results(data)
 
-    import csv
+    def save_results(self, data):
+        """Queue ``data`` to be saved with the current session, journalled until it is."""
+        self.writer.update_session(self.session_id, data)
+        self.journal.save(data)
 
     def generate_csv_report(self):
-        """Generate a CSV report from the user_details.json file."""
-        # Check if the JSON file exists
-        if not os.path.exists("user_details.json"):
-            self.show_popup("No data available to generate report.")
-            return
-
-        # Read data from the JSON file
-        with open("user_details.json", "r") as json_file:
-            user_data = json.load(json_file)
+        """Start generating the CSV report from the session store in the background."""
+        if self.report_job is not None:
+            return  # A report is already running
+
+        # Imported here: the report modules pull in csv, hashlib and multiprocessing
+        from report_job import ReportJob
+        from reports import REPORT_PATH
+
+        # Export only the sessions added or changed since the last report
+        self.report_job = ReportJob(open_store, REPORT_PATH, self.writer)
+        self.report_job.signals.progress.connect(self.on_report_progress)
+        self.report_job.signals.finished.connect(self.on_report_finished)
+        self.report_job.signals.failed.connect(self.on_report_failed)
+        self.report_job.signals.cancelled.connect(self.on_report_cancelled)
+        self.report_job.signals.empty.connect(self.on_report_empty)
+
+        self.generate_report_button.setEnabled(False)
+        self.report_progress.setRange(0, 0)  # Busy until the first progress update
+        self.report_status.setText("Generating report...")
+        self.report_progress.setVisible(True)
+        self.report_cancel_button.setVisible(True)
+        self.report_status.setVisible(True)
+        QThreadPool.globalInstance().start(self.report_job)
+
+    def cancel_report(self):
+        """Stop the running report job and wait for its thread to finish."""
+        if self.report_job is not None:
+            self.report_job.cancel()
+            QThreadPool.globalInstance().waitForDone()
+
+    def on_report_progress(self, done, total, rows_per_second):
+        """Show the running report's progress."""
+        if total:
+            self.report_progress.setRange(0, total)
+            self.report_progress.setValue(min(done, total))
+        self.report_status.setText(f"{done:,} rows ({rows_per_second:,.0f} rows/s)")
+
+    def finish_report(self):
+        """Hide the progress widgets once the job has reported back."""
+        self.report_job = None
+        self.generate_report_button.setEnabled(True)
+        self.report_progress.setVisible(False)
+        self.report_cancel_button.setVisible(False)
+
+    def on_report_finished(self, path, rows, mode, seconds):
+        self.finish_report()
+        if mode == "unchanged":
+            message = f"Report is already up to date: {path}"
+        else:
+            message = f"Report generated successfully in {seconds:.2f} s ({rows:,} rows written): {path}"
+        self.report_status.setText(message)
+        self.show_notification(message)
 
-        # Define the CSV file path
-        csv_file_path = "user_details_report.csv"
+    def on_report_failed(self, message):
+        self.finish_report()
+        self.report_status.setText("Report failed")
+        self.show_notification(f"Could not generate report: {message}")
 
-        # Open the CSV file for writing
-        with open(csv_file_path, "w", newline="") as csv_file:
-            writer = csv.writer(csv_file)
+    def on_report_cancelled(self):
+        self.finish_report()
+        self.report_status.setText("Report cancelled")
 
-            # Write the header row based on the keys of the first dictionary
-            if user_data:
-                header = list(user_data[0].keys())
-                writer.writerow(header)
+    def on_report_empty(self):
+        self.finish_report()
+        self.report_status.setVisible(False)
+        self.show_popup("No data available to generate report.")
 
-                # Write the data rows
-                for entry in user_data:
-                    writer.writerow(entry.values())
+    def show_notification(self, message):
+        """Show a message box that does not block the main screen."""
+        from PySide6.QtWidgets import QMessageBox  # Not needed until the first report
 
-        # Notify the user
-        self.show_popup(f"Report generated successfully: {csv_file_path}")
+        box = QMessageBox(QMessageBox.Information, "Report", message, QMessageBox.Ok, self)
+        box.setModal(False)
+        box.setAttribute(Qt.WA_DeleteOnClose)
+        box.show()
 
     def setup_top_button(self):
-        """Set up the 'Generate Report' button at the top-right corner."""
+        """Set up the 'Generate Report' button and report progress at the top-right corner."""
         self.top_button_layout.setAlignment(Qt.AlignRight)  # Align the button to the right
+
+        # Progress of a running report (hidden while idle)
+        self.report_status = QLabel()
+        self.report_status.setVisible(False)
+        self.report_progress = QProgressBar()
+        self.report_progress.setFixedWidth(300)
+        self.report_progress.setVisible(False)
+        self.report_cancel_button = QPushButton("Cancel")
+        self.report_cancel_button.setObjectName("cancelReportButton")
+        self.report_cancel_button.clicked.connect(lambda: self.report_job and self.report_job.cancel())
+        self.report_cancel_button.setVisible(False)
+        self.top_button_layout.addWidget(self.report_status)
+        self.top_button_layout.addWidget(self.report_progress)
+        self.top_button_layout.addWidget(self.report_cancel_button)
+
+        history_button = QPushButton("History")
+        history_button.setObjectName("historyButton")
+        history_button.clicked.connect(lambda: self.router.navigate(HISTORY))
+        self.top_button_layout.addWidget(history_button)
+        spc_button = QPushButton("SPC")
+        spc_button.setObjectName("spcButton")
+        spc_button.clicked.connect(lambda: self.router.navigate(SPC))
+        self.top_button_layout.addWidget(spc_button)
+        dashboard_button = QPushButton("Dashboard")
+        dashboard_button.setObjectName("dashboardButton")
+        dashboard_button.clicked.connect(lambda: self.router.navigate(DASHBOARD))
+        self.top_button_layout.addWidget(dashboard_button)
         generate_report_button = QPushButton("Generate Report")
-        generate_report_button.setStyleSheet("""
-            QPushButton {
-                background-color: #4CAF50; 
-                color: white; 
-                padding: 10px; 
-                border-radius: 5px;
-            }
-            QPushButton:hover {
-                background-color: #45a049;  /* Lighter green on hover */
-            }
-        """)
+        generate_report_button.setObjectName("generateReportButton")
         generate_report_button.clicked.connect(self.generate_csv_report)  # Connect to the report generation method
+        self.generate_report_button = generate_report_button
         self.top_button_layout.addWidget(generate_report_button)
 
         # Add the top button layout to the main layout
@@ -350,28 +672,12 @@ class MainWindow(QWidget):
 
 
 # ==============================================================
-class SetupScreenInside(QWidget):
-    def __init__(self, parent):
-        super().__init__()
-        self.parent = parent  # Reference to the main screen
-        self.setGeometry(0, 10, 1430, 0)
-        self.setStyleSheet("background-color: lightblue;")
+class SetupScreenInside(Page):
+    def cached_pixmap(self, path):
+        """Return the image at ``path`` scaled for this screen, from the shared cache."""
+        from image_cache import pixmap_cache, IMAGE_SIZE  # Screens are built after the first paint
 
-        self.layout = QVBoxLayout()
-        self.setLayout(self.layout)
-
-        # Add a Back button
-        back_button = QPushButton("Back to Main Screen")
-        back_button.setStyleSheet(
-            "background-color: #f44336; color: white; padding: 10px; border-radius: 5px;"
-        )
-        back_button.clicked.connect(self.go_back)
-        self.layout.addWidget(back_button)
-
-    def go_back(self):
-        """Go back to the main screen."""
-        self.hide()
-        self.parent.show()
+        return pixmap_cache().get(path, IMAGE_SIZE, self.devicePixelRatioF())
 
 
 class SetupScreen2(SetupScreenInside):
@@ -381,14 +687,13 @@ class SetupScreen2(SetupScreenInside):
 
         # Welcome label
         welcome_label = QLabel("Setup #2 : Telescope: Range, manual")
+        welcome_label.setObjectName("screenTitle")
         welcome_label.setAlignment(Qt.AlignCenter)
-        welcome_label.setStyleSheet("font-size: 16px; font-weight: bold; color: #333;")
         self.layout.addWidget(welcome_label)
 
         # Add an image
         image_label = QLabel(self)
-        image_label.setPixmap(
-            QPixmap("img.png").scaled(1000, 1300, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        image_label.setPixmap(self.cached_pixmap("img.png"))
         image_label.setAlignment(Qt.AlignCenter)
         self.layout.addWidget(image_label)
 
@@ -396,26 +701,13 @@ class SetupScreen2(SetupScreenInside):
         dropdown_row_layout_label = QHBoxLayout()
         dropdown_row_layout = QHBoxLayout()
         self.dropdown_label = QLabel("Unit Reach Marker:")
-        self.dropdown_label.setStyleSheet("font-size: 14px; color: #333; margin-right: 10px;")
+        self.dropdown_label.setObjectName("fieldLabel")
 
         # Dropdown (combo box) with Yes and No options
         self.dropdown = QComboBox()
-        self.dropdown.addItems(["---", "No", "Yes"])
-        self.dropdown.setStyleSheet(
-            """
-            QComboBox {
-                background-color: white; 
-                padding: 5px; 
-                border: 1px solid #ccc; 
-                border-radius: 3px;
-                color: #333;
-            }
-            QComboBox::drop-down {
-                border-left: 1px solid #ccc;
-            }
-            """
-        )
+        self.dropdown.addItems(["---", *MARKER_CHOICES])
         self.measured_max_height_label = QLabel("Measured Max Height:")
+        self.measured_max_height_label.setObjectName("measuredMaxHeightLabel")
         self.measured_max_height_input = QLineEdit()
         self.measured_max_height_input.setVisible(False)  # Hidden by default
         self.measured_max_height_label.setVisible(False)  # Hide label as well # Disabled by default
@@ -426,20 +718,7 @@ class SetupScreen2(SetupScreenInside):
 
         # Submit button
         self.submit_button = QPushButton("Submit")
-        self.submit_button.setStyleSheet(
-            """
-            QPushButton {
-                background-color: #4CAF50; 
-                color: white; 
-                padding: 10px; 
-                border-radius: 5px;
-            }
-            QPushButton:disabled {
-                background-color: grey; 
-                color: #ddd;
-            }
-            """
-        )
+        self.submit_button.setObjectName("setupSubmitButton")
         self.submit_button.clicked.connect(self.submit_and_redirect)
         dropdown_row_layout.addWidget(self.submit_button)
 
@@ -458,8 +737,6 @@ class SetupScreen2(SetupScreenInside):
         if value == "No":
             self.measured_max_height_label.setVisible(True)  # Show label
             self.measured_max_height_input.setVisible(True)  # Show field
-            self.measured_max_height_label.setStyleSheet("color: black;")
-            self.measured_max_height_input.setStyleSheet("background-color: white; color:black")
         else:
             self.measured_max_height_label.setVisible(False)  # Hide label
             self.measured_max_height_input.setVisible(False)  # Hide field
@@ -473,24 +750,12 @@ class SetupScreen2(SetupScreenInside):
         """Handle submit button click."""
         selected_option = self.dropdown.currentText()
         print(f"Selected option: {selected_option}")
-        # save data in the json file
-        if selected_option == "Yes":
-            data = {
-                "Setup2 - Unit Reach Marker": selected_option,
-                "Setup2 - Measured Max Height": None
-
-            }
-        else:
-            data = {
-                "Setup2 - Unit Reach Marker": selected_option,
-                "Setup2 - Measured Max Height": self.measured_max_height_input.text()
-            }
-        # open user_details.json file and save data with last record
-        with open("user_details.json", "r") as f:
-            existing_data = json.load(f)
-            existing_data[-1].update(data)
-        with open("user_details.json", "w") as f:
-            json.dump(existing_data, f, indent=4)
+        # save data in the session store
+        data = marker_result(2, selected_option, self.measured_max_height_input.text())
+        # save data with this station's current session
+        self.parent.save_results(data)
+        self.parent.update_spc(data)
+        self.parent.mark_setup_completed("Test Setup #2:Telescope: Range, manual.")  # Mark as completed
 
         # Optional: Print for debug
         self.go_back()  # Redirect to the main screen
@@ -503,14 +768,13 @@ class SetupScreen3(SetupScreenInside):
 
         # Welcome label
         welcome_label = QLabel("Setup #2 : Lift: Range, Powered")
+        welcome_label.setObjectName("screenTitle")
         welcome_label.setAlignment(Qt.AlignCenter)
-        welcome_label.setStyleSheet("font-size: 16px; font-weight: bold; color: #333;")
         self.layout.addWidget(welcome_label)
 
         # Add an image
         image_label = QLabel(self)
-        image_label.setPixmap(
-            QPixmap("img.png").scaled(1000, 1300, Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        image_label.setPixmap(self.cached_pixmap("img.png"))
         image_label.setAlignment(Qt.AlignCenter)
         self.layout.addWidget(image_label)
 
@@ -518,26 +782,13 @@ class SetupScreen3(SetupScreenInside):
         dropdown_row_layout_label = QHBoxLayout()
         dropdown_row_layout = QHBoxLayout()
         self.dropdown_label = QLabel("Unit Reach Marker:")
-        self.dropdown_label.setStyleSheet("font-size: 14px; color: #333; margin-right: 10px;")
+        self.dropdown_label.setObjectName("fieldLabel")
 
         # Dropdown (combo box) with Yes and No options
         self.dropdown = QComboBox()
-        self.dropdown.addItems(["---", "No", "Yes"])
-        self.dropdown.setStyleSheet(
-            """
-            QComboBox {
-                background-color: white; 
-                padding: 5px; 
-                border: 1px solid #ccc; 
-                border-radius: 3px;
-                color: #333;
-            }
-            QComboBox::drop-down {
-                border-left: 1px solid #ccc;
-            }
-            """
-        )
+        self.dropdown.addItems(["---", *MARKER_CHOICES])
         self.measured_max_height_label = QLabel("Measured Max Height:")
+        self.measured_max_height_label.setObjectName("measuredMaxHeightLabel")
         self.measured_max_height_input = QLineEdit()
         self.measured_max_height_input.setVisible(False)  # Hidden by default
         self.measured_max_height_label.setVisible(False)  # Hide label as well # Disabled by default
@@ -547,20 +798,7 @@ class SetupScreen3(SetupScreenInside):
 
         # Submit button
         self.submit_button = QPushButton("Submit")
-        self.submit_button.setStyleSheet(
-            """
-            QPushButton {
-                background-color: #4CAF50; 
-                color: white; 
-                padding: 10px; 
-                border-radius: 5px;
-            }
-            QPushButton:disabled {
-                background-color: grey; 
-                color: #ddd;
-            }
-            """
-        )
+        self.submit_button.setObjectName("setupSubmitButton")
         self.submit_button.clicked.connect(self.submit_and_redirect)
         dropdown_row_layout.addWidget(self.submit_button)
 
@@ -579,8 +817,6 @@ class SetupScreen3(SetupScreenInside):
         if value == "No":
             self.measured_max_height_label.setVisible(True)  # Show label
             self.measured_max_height_input.setVisible(True)  # Show field
-            self.measured_max_height_label.setStyleSheet("color: black;")
-            self.measured_max_height_input.setStyleSheet("background-color: white; color:black")
         else:
             self.measured_max_height_label.setVisible(False)  # Hide label
             self.measured_max_height_input.setVisible(False)  # Hide field
@@ -595,24 +831,12 @@ class SetupScreen3(SetupScreenInside):
         selected_option = self.dropdown.currentText()
         print(f"Selected option: {selected_option}")  # Optional: Print for debug
 
-        # save data in the json file
-        if selected_option == "Yes":
-            data = {
-                "Setup3 - Unit Reach Marker": selected_option,
-                "Setup3 - Measured Max Height": None
-
-            }
-        else:
-            data = {
-                "Setup3 - Unit Reach Marker": selected_option,
-                "Setup3 - Measured Max Height": self.measured_max_height_input.text()
-            }
-        # open user_details.json file and save data with last record
-        with open("user_details.json", "r") as f:
-            existing_data = json.load(f)
-            existing_data[-1].update(data)
-        with open("user_details.json", "w") as f:
-            json.dump(existing_data, f, indent=4)
+        # save data in the session store
+        data = marker_result(3, selected_option, self.measured_max_height_input.text())
+        # save data with this station's current session
+        self.parent.save_results(data)
+        self.parent.update_spc(data)
+        self.parent.mark_setup_completed("Test Setup #3:Lift: Range, powered")  # Mark as completed
 
         self.go_back()  # Redirect to the main screen
 
@@ -634,17 +858,30 @@ class SetupScreen4(SetupScreenInside):
         self.update_image()  # Load and scale the first image
 
         self.checkbox = QCheckBox(self.steps[self.current_step]["label"])
-        self.checkbox.setStyleSheet("color: black; font-size: 14px;")
+        self.checkbox.setObjectName("stepCheckBox")
         self.checkbox.stateChanged.connect(self.update_button_state)
 
+        # The dial is read on a background thread while the screen is shown
+        from acquisition import DialAcquisition  # NumPy; screens are built after the first paint
+
+        self.dial = DialAcquisition()
+        self.dial.updated.connect(self.show_reading)
+        self.dial.failed.connect(self.on_dial_failed)
+        self.zero = None  # Dial readings taken at step 2 (see next_step)
+        self.measure_from = None
+        self.reading_label = QLabel("Dial: ---")
+        self.reading_label.setObjectName("fieldLabel")
+
         self.next_button = QPushButton("Next")
-        self.style_button(self.next_button, enabled=False)  # Set initial grey style
+        self.next_button.setObjectName("nextButton")
+        self.next_button.setEnabled(False)  # Greyed out until the step is ticked
         self.next_button.clicked.connect(self.next_step)
 
         # Layout setup
         self.step_layout = QVBoxLayout()
         self.step_layout.addWidget(self.image_label)
         self.step_layout.addWidget(self.checkbox)
+        self.step_layout.addWidget(self.reading_label)
 
         self.button_layout = QHBoxLayout()
         self.button_layout.addWidget(self.next_button)
@@ -652,62 +889,82 @@ class SetupScreen4(SetupScreenInside):
         self.layout.addLayout(self.step_layout)
         self.layout.addLayout(self.button_layout)
 
-    def style_button(self, button, enabled):
-        """Update the button's color based on its state."""
-        if enabled:
-            button.setEnabled(True)
-            button.setStyleSheet(
-                "background-color: #4CAF50; color: white; padding: 10px; border-radius: 5px;"
-            )
-        else:
-            button.setEnabled(False)
-            button.setStyleSheet(
-                "background-color: grey; color: white; padding: 10px; border-radius: 5px;"
-            )
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.dial.start()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.dial.stop(wait=False)  # The thread finishes its last read on its own
+
+    def show_reading(self, reading, rate):
+        """Show the dial's latest reading (a few times a second, however fast it is read)."""
+        text = f"Dial: {reading:.3f} mm"
+        if self.zero is not None:
+            text += f", deflection {reading - self.zero:+.3f} mm"
+        self.reading_label.setText(f"{text} ({rate:.0f} readings/s)")
+
+    def on_dial_failed(self, message):
+        """Carry on without readings; the steps are saved as confirmed."""
+        self.reading_label.setText(f"Dial not available: {message}")
 
     def update_button_state(self):
         """Enable the button if the checkbox is checked, otherwise disable it."""
-        if self.checkbox.isChecked():
-            self.style_button(self.next_button, enabled=True)
-        else:
-            self.style_button(self.next_button, enabled=False)
+        self.next_button.setEnabled(self.checkbox.isChecked())
 
     def update_image(self):
-        """Update the displayed image with proper scaling."""
-        pixmap = QPixmap(self.steps[self.current_step]["image"])
+        """Update the displayed image from the scaled pixmap cache."""
+        from image_cache import pixmap_cache, IMAGE_SIZE
+
+        cache = pixmap_cache()
+        device_pixel_ratio = self.devicePixelRatioF()
         self.image_label.setPixmap(
-            pixmap.scaled(1000, 1300, Qt.KeepAspectRatio, Qt.SmoothTransformation)
-        )
+            cache.get(self.steps[self.current_step]["image"], IMAGE_SIZE, device_pixel_ratio))
+        # Decode the next step's image while the operator reads this one
+        if self.current_step + 1 < len(self.steps):
+            cache.prefetch(self.steps[self.current_step + 1]["image"], IMAGE_SIZE, device_pixel_ratio)
 
     def next_step(self):
         """Handle the transition to the next step."""
         if self.current_step < len(self.steps) - 1:
+            if self.current_step == 1:  # The dial has just been zeroed
+                self.zero = self.dial.zero()
+                self.measure_from = self.dial.mark()
             self.current_step += 1
-            self.update_image()  # Update to the new image
-            self.checkbox.setText(self.steps[self.current_step]["label"])
-            self.checkbox.setChecked(False)  # Reset the checkbox
-            is_last_step = self.current_step == len(self.steps) - 1
-            self.next_button.setText("Submit" if is_last_step else "Next")
-            self.style_button(self.next_button, enabled=False)  # Disable the button until checkbox is checked
+            self.parent.journal.step(4, self.current_step, self.zero)
+            self.show_step()
         else:
             self.submit()
 
+    def show_step(self):
+        """Show the current step, its box unticked."""
+        self.update_image()  # Update to the new image
+        self.checkbox.setText(self.steps[self.current_step]["label"])
+        self.checkbox.setChecked(False)  # Reset the checkbox
+        is_last_step = self.current_step == len(self.steps) - 1
+        self.next_button.setText("Submit" if is_last_step else "Next")
+        self.next_button.setEnabled(False)  # Disable the button until checkbox is checked
+
+    def restore_step(self, step, zero):
+        """Pick up at ``step`` after a restart, deflection measured from the ``zero`` read before it."""
+        self.current_step = min(step, len(self.steps) - 1)
+        self.zero = zero
+        if zero is not None:
+            self.measure_from = self.dial.mark()  # The readings before the restart are gone
+        self.show_step()
+
     def submit(self):
         """Redirect to the main screen and mark this setup as completed."""
-        self.parent.mark_setup_completed("Test Setup #4:Deflection, vertical")  # Mark as completed
-        # save data in the json file
-        data = {
-            "Setup4 - Click to Zero Vertical Position Dial": "Yes",
-            "Setup4 - Click to record vertical deflection": "Yes"
-        }
-        # open user_details.json file and save data with last record
-        with open("user_details.json", "r") as f:
-            existing_data = json.load(f)
-            existing_data[-1].update(data)
-        with open("user_details.json", "w") as f:
-            json.dump(existing_data, f, indent=4)
-        self.hide()
-        self.parent.show()
+        # save data in the session store, with the dial's readings if it was read
+        peak = settled = None
+        if self.zero is not None:
+            peak, settled = self.dial.measure(self.measure_from, self.zero)
+        data = deflection_result(self.zero, peak, settled)
+        # save data with this station's current session
+        self.parent.save_results(data)
+        self.parent.update_spc(data)
+        self.parent.mark_setup_completed("Test Setup #4:Deflection, vertical")  # Once the results are saved
+        self.go_back()
 
 
 class SetupScreen5(SetupScreenInside):
@@ -717,11 +974,101 @@ class SetupScreen5(SetupScreenInside):
         self.layout.addWidget(QLabel("Welcome to Test Setup #4!"))
 
 
-class SetupScreen6(SetupScreenInside):
-    def __init__(self, parent):
+class LiftMotionScreen(SetupScreenInside):
+    """Setups #6 and #8: watch the lift move on a live plot and record the motion with the session."""
+
+    def __init__(self, parent, setup, setup_text, title):
         super().__init__(parent)
-        self.setWindowTitle("Test Setup #6")
-        self.layout.addWidget(QLabel("Welcome to Test Setup #4!"))
+        self.setup = setup
+        self.setup_text = setup_text  # Its button's text, to mark it completed on submit
+        self.setWindowTitle(f"Test Setup #{setup}")
+
+        welcome_label = QLabel(title)
+        welcome_label.setObjectName("screenTitle")
+        welcome_label.setAlignment(Qt.AlignCenter)
+        self.layout.addWidget(welcome_label)
+
+        # The lift is read on a background thread while the screen is shown
+        from motion import MotionAcquisition, MotionPlot  # NumPy; screens are built after the first paint
+
+        self.lift = MotionAcquisition()
+        self.lift.updated.connect(self.show_recording)
+        self.lift.failed.connect(self.on_lift_failed)
+        self.plot = MotionPlot(self.lift)
+        self.layout.addWidget(self.plot)
+        self.trace = None  # Path of the last recording, once stopped
+        self.recording = None  # Path being recorded to
+
+        self.status_label = QLabel("Not recording")
+        self.status_label.setObjectName("fieldLabel")
+        self.layout.addWidget(self.status_label)
+
+        button_row_layout = QHBoxLayout()
+        self.record_button = QPushButton("Start recording")
+        self.record_button.setObjectName("nextButton")
+        self.record_button.clicked.connect(self.toggle_recording)
+        self.submit_button = QPushButton("Submit")
+        self.submit_button.setObjectName("setupSubmitButton")
+        self.submit_button.setEnabled(False)  # Until a recording has been started
+        self.submit_button.clicked.connect(self.submit)
+        button_row_layout.addWidget(self.record_button)
+        button_row_layout.addWidget(self.submit_button)
+        self.layout.addLayout(button_row_layout)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.lift.start()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        if self.recording is not None:
+            self.stop_recording()
+        self.lift.stop(wait=False)  # The thread finishes its last read on its own
+
+    def toggle_recording(self):
+        if self.recording is None:
+            from motion import trace_path
+
+            self.recording = trace_path(self.parent.session_id, self.setup)
+            self.lift.record(self.recording)
+            self.record_button.setText("Stop recording")
+            self.submit_button.setEnabled(True)  # Submitting stops the recording
+        else:
+            self.stop_recording()
+
+    def stop_recording(self):
+        readings = self.lift.stop_recording()
+        self.trace, self.recording = self.recording, None
+        self.status_label.setText(f"Recorded {readings} readings")
+        self.record_button.setText("Record again")
+
+    def show_recording(self, position, rate):
+        """Show how much has been recorded (a few times a second, however fast the lift is read)."""
+        trace = self.lift.trace
+        if trace is not None and rate:
+            self.status_label.setText(f"Recording: {trace.samples / rate:.1f} s ({rate:.0f} readings/s)")
+
+    def on_lift_failed(self, message):
+        self.status_label.setText(f"Lift sensor not available: {message}")
+        self.record_button.setEnabled(False)
+
+    def submit(self):
+        """Save the recorded trace with this station's current session and go back."""
+        from motion import LIFT_RATE
+
+        if self.recording is not None:
+            self.stop_recording()
+        data = motion_result(self.setup, self.trace, self.lift.rate or LIFT_RATE)
+        self.parent.save_results(data)
+        self.parent.update_spc(data)
+        self.parent.mark_setup_completed(self.setup_text)
+        self.go_back()
+
+
+class SetupScreen6(LiftMotionScreen):
+    def __init__(self, parent):
+        super().__init__(parent, 6, "Test Setup #6:(Right Bracket) Lift: Behavior, motion",
+                         "Setup #6 : (Right Bracket) Lift: Behavior, motion")
 
 
 class SetupScreen7(SetupScreenInside):
@@ -731,11 +1078,10 @@ class SetupScreen7(SetupScreenInside):
         self.layout.addWidget(QLabel("Welcome to Test Setup #4!"))
 
 
-class SetupScreen8(SetupScreenInside):
+class SetupScreen8(LiftMotionScreen):
     def __init__(self, parent):
-        super().__init__(parent)
-        self.setWindowTitle("Test Setup #8")
-        self.layout.addWidget(QLabel("Welcome to Test Setup #4!"))
+        super().__init__(parent, 8, "Test Setup #8:(Left Bracket) Lift: Behavior, motion",
+                         "Setup #8 : (Left Bracket) Lift: Behavior, motion")
 
 
 # Main execution
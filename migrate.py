@@ -0,0 +1,263 @@
+"""Stream a legacy ``user_details.json`` into a store in the current schema.
+
+Schema versions:
+
+1. What ``main.py`` and ``main_layout_file.py`` saved before typed
+   records: one JSON list, keys and value types varying by build and by
+   how far a session got (``QDate.toString()`` or ISO dates, heights as
+   typed, Setup #4 flags ``False`` until "Yes", keys missing altogether).
+2. Every record has the keys ``workflow.new_session`` gives it, with
+   values as ``SessionRecord.to_dict`` writes them. Keys the schema does
+   not know are kept as they are.
+3. Current: as 2, plus Setup #4's dial readings: the zero reading and the
+   settled deflection in place of the steps' "Yes" when the dial was read,
+   and a "Setup4 - Peak Vertical Deflection" key (None if it was not).
+
+The source is read one record at a time, so memory stays flat however big
+the file is. Records are written to the store in batches, and after each
+batch ``<source>.migrate.json`` records the byte offset reached, so a run
+that was interrupted (or crashed) picks up from there when started again.
+Session ids are fixed per run and record, so the one batch that may have
+been written without its checkpoint is not written twice. Every value that
+had to be dropped or guessed at is logged to ``<source>.anomalies.ndjson``.
+
+    python migrate.py [user_details.json] [--backend log|segments|sqlite] [--restart]
+"""
+import argparse
+import codecs
+import json
+import os
+import re
+import sys
+import time
+
+from session_record import KEYS, SCHEMA_VERSION, SessionRecord
+
+BATCH_SIZE = 1000  # Records per store write and checkpoint
+CHUNK_SIZE = 1 << 20  # Bytes read from the source at a time
+REPORT_EVERY = 2.0  # Seconds between progress lines
+CHECKPOINT_SUFFIX = ".migrate.json"
+ANOMALIES_SUFFIX = ".anomalies.ndjson"
+ADDED_KEYS = {KEYS["setup4_peak"]}  # New in schema 3, so no legacy record is missing them
+SPACE = re.compile(r"\s*")
+SEPARATORS = re.compile(r"[\s,]*")
+
+
+class MigrationError(Exception):
+    """Raised when a source cannot be migrated (not a JSON list, changed since the checkpoint...)."""
+
+
+def iter_legacy(path, offset=0):
+    """Yield ``(record, end offset)`` for each item of the JSON list in ``path``.
+
+    ``offset`` is 0 or an end offset yielded by an earlier run; the file is
+    read from there on, so resuming does not parse what came before.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    at_start = offset == 0
+    with open(path, "rb") as f:
+        f.seek(offset)
+        buffer, pos, eof = "", 0, False
+
+        def fill():
+            nonlocal buffer, pos, eof
+            chunk = f.read(CHUNK_SIZE)
+            eof = not chunk
+            buffer = buffer[pos:] + utf8.decode(chunk, final=eof)
+            pos = 0
+
+        def skip(separators):
+            # JSON whitespace and commas are ASCII, so each is one byte
+            nonlocal pos, offset
+            while True:
+                end = separators.match(buffer, pos).end()
+                offset += end - pos
+                pos = end
+                if pos < len(buffer) or eof:
+                    return
+                fill()
+
+        skip(SPACE)
+        if at_start:
+            if pos >= len(buffer) or buffer[pos] != "[":
+                raise MigrationError(f"{path} does not contain a JSON list")
+            pos += 1
+            offset += 1
+        while True:
+            skip(SEPARATORS)
+            if pos >= len(buffer):
+                raise MigrationError(f"{path} ends before the JSON list is closed")
+            if buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError as e:
+                if eof:
+                    raise MigrationError(f"{path}: bad JSON at byte {offset}: {e.msg}") from None
+                fill()
+                continue
+            if end == len(buffer) and not eof:
+                fill()  # A scalar may go on in the next chunk; parse it again
+                continue
+            offset += len(buffer[pos:end].encode())
+            pos = end
+            yield item, offset
+
+
+def migrate_record(record, anomalies):
+    """Return ``record`` in the current schema, adding ``(key, value, reason)`` to ``anomalies``."""
+    found = []
+    migrated = SessionRecord.from_dict(record, found).to_dict()
+    anomalies.extend(found)
+    for key in dict.fromkeys(KEYS.values()):
+        if key not in record and key not in ADDED_KEYS:
+            anomalies.append((key, None, "missing"))
+    for key, value in record.items():
+        if key not in migrated:
+            migrated[key] = value
+    return migrated
+
+
+class Migration:
+    """One source file's migration into ``store``, resumable from its checkpoint."""
+
+    def __init__(self, source, store, backend, restart=False, batch_size=BATCH_SIZE):
+        self.source = source
+        self.store = store
+        self.batch_size = batch_size
+        self.checkpoint_path = source + CHECKPOINT_SUFFIX
+        self.anomalies_path = source + ANOMALIES_SUFFIX
+        stat = os.stat(source)
+        self.state = None if restart else self._load_checkpoint()
+        self.resuming = self.state is not None
+        if self.state is not None:
+            if (self.state["size"], self.state["mtime_ns"]) != (stat.st_size, stat.st_mtime_ns):
+                raise MigrationError(f"{source} changed since the last run; use --restart to start over")
+            if self.state["backend"] != backend:
+                raise MigrationError(f"the last run went into the {self.state['backend']} backend, "
+                                     f"not {backend}; use --restart to start over")
+        else:
+            import uuid
+
+            self.state = {"source": os.path.abspath(source), "size": stat.st_size, "mtime_ns": stat.st_mtime_ns,
+                          "backend": backend, "schema": SCHEMA_VERSION, "run": uuid.uuid4().hex[:8],
+                          "offset": 0, "records": 0, "migrated": 0, "skipped": 0, "anomalies": 0,
+                          "anomalies_size": 0, "seconds": 0.0, "done": False}
+            self._save_checkpoint()  # Keeps the run's session ids should the first batch be cut short
+
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _save_checkpoint(self):
+        tmp_path = self.checkpoint_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.state, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _write(self, batch, anomaly_lines, log, resumed):
+        """Write one batch to the store and the log, then checkpoint past it."""
+        self.state["migrated"] += len(batch)
+        if resumed:  # This batch may have been written before the last checkpoint was
+            batch = [operation for operation in batch if not self._exists(operation[1])]
+        if batch:
+            self.store.write_batch(batch)
+        log.write("".join(anomaly_lines))
+        log.flush()
+        self.state["anomalies_size"] = log.tell()
+        self._save_checkpoint()
+
+    def _exists(self, session_id):
+        try:
+            self.store.session_version(session_id)
+        except KeyError:
+            return False
+        return True
+
+    def run(self, progress=None):
+        """Migrate the rest of the source; ``progress(state, records per second)`` is called now and then.
+
+        Returns the final state (also saved as the checkpoint).
+        """
+        state = self.state
+        if state["done"]:
+            return state
+        resumed = self.resuming
+        started = time.perf_counter()
+        seconds_before, records_before = state["seconds"], state["records"]
+        reported = started
+        batch, anomaly_lines = [], []
+        with open(self.anomalies_path, "a+") as log:
+            log.truncate(state["anomalies_size"])  # Drop lines past the checkpoint
+            log.seek(state["anomalies_size"])
+            for record, end in iter_legacy(self.source, state["offset"]):
+                position = state["records"]
+                state["records"] += 1
+                state["offset"] = end
+                anomalies = []
+                if isinstance(record, dict):
+                    batch.append(("create", f"{state['run']}-{position}", migrate_record(record, anomalies)))
+                else:
+                    state["skipped"] += 1
+                    anomalies.append((None, record, "not a session record; skipped"))
+                for key, value, reason in anomalies:
+                    anomaly_lines.append(json.dumps({"record": position, "key": key, "value": value,
+                                                     "reason": reason}, default=str) + "\n")
+                state["anomalies"] += len(anomalies)
+                if state["records"] % self.batch_size == 0:
+                    state["seconds"] = seconds_before + time.perf_counter() - started
+                    self._write(batch, anomaly_lines, log, resumed)
+                    batch, anomaly_lines, resumed = [], [], False
+                    if progress is not None and time.perf_counter() - reported >= REPORT_EVERY:
+                        reported = time.perf_counter()
+                        progress(state, (state["records"] - records_before) / (reported - started))
+            state["done"] = True
+            state["seconds"] = seconds_before + time.perf_counter() - started
+            self._write(batch, anomaly_lines, log, resumed)
+        if progress is not None:
+            progress(state, (state["records"] - records_before) / max(time.perf_counter() - started, 1e-9))
+        return state
+
+
+def report(state, rate):
+    done = state["offset"] / state["size"] * 100 if state["size"] else 100
+    print(f"{state['records']} records ({done:.1f}%), {state['migrated']} migrated, {state['skipped']} skipped, "
+          f"{state['anomalies']} anomalies, {rate:.0f} records/s", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("source", nargs="?", default="user_details.json")
+    parser.add_argument("--backend", help="Store to migrate into (default: PPT_STORE_BACKEND or log)")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE, help="Records per write and checkpoint")
+    parser.add_argument("--restart", action="store_true", help="Ignore the checkpoint and start over")
+    args = parser.parse_args()
+
+    from storage import DEFAULT_BACKEND, open_store
+
+    backend = args.backend or os.environ.get("PPT_STORE_BACKEND", DEFAULT_BACKEND)
+    if backend == "json":
+        sys.exit("user_details.json is the legacy format itself; migrate into log, segments or sqlite")
+    store = open_store(backend, legacy_path="")  # No first-use import of the whole file
+    try:
+        migration = Migration(args.source, store, backend, args.restart, args.batch_size)
+        if migration.state["done"]:
+            sys.exit(f"{args.source} was already migrated; use --restart to migrate it again")
+        state = migration.run(report)
+    except MigrationError as e:
+        sys.exit(str(e))
+    except KeyboardInterrupt:
+        sys.exit("Interrupted; run again to resume from the last checkpoint")
+    finally:
+        store.close()
+    print(f"Migrated {state['migrated']} of {state['records']} records into {backend} in {state['seconds']:.1f}s "
+          f"({state['records'] / max(state['seconds'], 1e-9):.0f} records/s); "
+          f"{state['anomalies']} anomalies in {migration.anomalies_path}")
+
+
+if __name__ == "__main__":
+    main()
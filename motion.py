@@ -0,0 +1,181 @@
+"""Lift motion (Setups #6 and #8): a live, decimated plot of the lift's position.
+
+The lift's position sensor is read like the Setup #4 dial (see
+``acquisition.py``), ``LIFT_RATE`` readings a second by default, from the
+source in ``PPT_LIFT_SOURCE``: ``simulator`` (default), ``serial:PORT[@BAUD]``
+or ``tcp:HOST:PORT``, which ``python acquisition.py simulate --device lift``
+serves a simulated lift on.
+
+``MotionPlot`` repaints the last ``WINDOW_SECONDS`` at up to ``FPS`` frames a
+second. Each frame reduces the window to the lowest and highest reading
+under each pixel column (``decimate``) and draws just those, two points a
+column, so painting costs the same at 1 kHz as at 100 kHz; only the NumPy
+reduction grows with the rate. Columns start at whole multiples of their
+reading count, so a steady trace does not shimmer as it scrolls.
+
+While a setup is recorded, every reading also goes to a trace file,
+``user_details.traces/<session id>-setup<N>.npy`` (see ``trace_path``), that
+the session record names and ``acquisition.load_trace`` memory-maps.
+"""
+import os
+import time
+
+import numpy as np
+import shiboken6
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtGui import QColor, QPainter, QPen, QPolygonF
+from PySide6.QtWidgets import QSizePolicy, QWidget
+
+from acquisition import DEFAULT_SOURCE, Acquisition, SimulatedDial, open_source
+
+LIFT_RATE = 10000  # Readings per second sent by the simulator
+WINDOW_SECONDS = 5.0  # Seconds of motion on the plot
+FPS = 60  # Most frames painted per second
+TRACE_DIR = "user_details.traces"
+MARGIN = 0.05  # Of the plotted range, left free above and below the trace
+BACKGROUND = QColor("#FFFFFF")
+TRACE_COLOR = QColor("#3D75A2")
+TEXT_COLOR = QColor("#333333")
+
+
+class SimulatedLift(SimulatedDial):
+    """Stands in for the lift's position sensor: up ``TRAVEL`` mm and back every ``PERIOD`` seconds.
+
+    Each move eases in and out over ``MOVE`` seconds, after which the bracket
+    rings at ``RING_HZ`` for a while. Readings are made as ``SimulatedDial``
+    makes them.
+    """
+
+    PERIOD = 6.0
+    MOVE = 2.0  # Seconds per move, up or down
+    TRAVEL = 300.0
+    NOISE = 0.05
+    RING_HZ = 25.0
+    RING_MM = 0.8
+    DAMPING = 0.3
+
+    def __init__(self, rate=LIFT_RATE, seed=None):
+        super().__init__(rate, seed)
+
+    @classmethod
+    def profile(cls, seconds):
+        half = cls.PERIOD / 2
+        phase = seconds % cls.PERIOD
+        since_move = phase % half
+        done = np.clip(since_move / cls.MOVE, 0.0, 1.0)
+        eased = done * done * (3 - 2 * done)
+        position = np.where(phase < half, eased, 1 - eased) * cls.TRAVEL
+        ringing = since_move - cls.MOVE
+        return position + np.where(ringing < 0, 0.0, cls.RING_MM * np.exp(-np.clip(ringing, 0.0, None) / cls.DAMPING)
+                                   * np.sin(2 * np.pi * cls.RING_HZ * ringing))
+
+
+class MotionAcquisition(Acquisition):
+    """The lift's position sensor."""
+
+    def open_device(self):
+        return open_source(self.source or os.environ.get("PPT_LIFT_SOURCE", DEFAULT_SOURCE), SimulatedLift, "lift")
+
+
+def trace_path(session_id, setup):
+    """Where a session's trace of a setup is recorded."""
+    return os.path.join(TRACE_DIR, f"{session_id}-setup{setup}.npy")
+
+
+def decimate(samples, per_column):
+    """Lowest and highest of each run of ``per_column`` readings; a partial run at the end is left out."""
+    columns = len(samples) // per_column
+    runs = samples[:columns * per_column].reshape(columns, per_column)
+    return runs.min(axis=1), runs.max(axis=1)
+
+
+def polyline(xs, ys):
+    """A ``QPolygonF`` of the points (``xs``, ``ys``), written into its memory by NumPy.
+
+    Making a ``QPointF`` per point from Python costs ten times as much as
+    drawing them.
+    """
+    polygon = QPolygonF()
+    polygon.resize(len(xs))
+    points = np.frombuffer(shiboken6.VoidPtr(polygon.data(), len(xs) * 16, True), np.float64).reshape(-1, 2)
+    points[:, 0] = xs
+    points[:, 1] = ys
+    return polygon
+
+
+def envelope(buffer, columns, window):
+    """Lowest and highest readings for up to ``columns`` pixel columns over the last ``window`` readings.
+
+    Each column covers the same whole multiple of readings from frame to
+    frame, so a column's values only change once it is complete.
+    """
+    per_column = max(1, window // columns)
+    end = buffer.total - buffer.total % per_column
+    first, samples = buffer.since(max(end - columns * per_column, 0))
+    skip = -first % per_column  # The oldest readings were overwritten part way into a column
+    return decimate(samples[skip:end - first], per_column)
+
+
+class MotionPlot(QWidget):
+    """The last ``seconds`` of an ``Acquisition``'s readings, repainted as they come in."""
+
+    def __init__(self, acquisition, seconds=WINDOW_SECONDS, fps=FPS, unit="mm"):
+        super().__init__()
+        self.acquisition = acquisition
+        self.seconds = seconds
+        self.unit = unit
+        self.painted_total = None  # Readings there were at the last paint
+        self.frames = 0  # Painted so far, and the seconds it took (for benchmarks)
+        self.paint_seconds = 0.0
+        self.setMinimumHeight(240)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+        self.setAttribute(Qt.WA_OpaquePaintEvent)  # Every pixel is painted; nothing behind to draw first
+        self.timer = QTimer(self)
+        self.timer.setTimerType(Qt.PreciseTimer)
+        self.timer.setInterval(round(1000 / fps))
+        self.timer.timeout.connect(self.tick)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.timer.start()
+
+    def hideEvent(self, event):
+        super().hideEvent(event)
+        self.timer.stop()
+
+    def tick(self):
+        """Repaint if readings came in since the last frame."""
+        if self.acquisition.buffer.total != self.painted_total:
+            self.update()
+
+    def paintEvent(self, event):
+        started = time.perf_counter()
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), BACKGROUND)
+        buffer = self.acquisition.buffer
+        self.painted_total = buffer.total
+        window = int(self.seconds * (self.acquisition.rate or LIFT_RATE))
+        lows, highs = envelope(buffer, max(1, self.width()), window)
+        if len(lows):
+            self.paint_trace(painter, lows, highs)
+        painter.end()
+        self.frames += 1
+        self.paint_seconds += time.perf_counter() - started
+
+    def paint_trace(self, painter, lows, highs):
+        """Draw each column from its lowest to its highest reading, joined up in one polyline."""
+        low, high = float(lows.min()), float(highs.max())
+        spread = max(high - low, 1e-9)
+        low, high = low - spread * MARGIN, high + spread * MARGIN
+        scale = (self.height() - 1) / (high - low)
+        x = np.repeat(np.arange(self.width() - len(lows), self.width(), dtype=np.float64), 2)
+        y = np.empty(len(x))
+        y[0::2] = (high - highs) * scale  # Pixel rows grow downwards
+        y[1::2] = (high - lows) * scale
+        painter.setPen(QPen(TRACE_COLOR, 1))
+        painter.drawPolyline(polyline(x, y))
+        painter.setPen(TEXT_COLOR)
+        painter.drawText(4, 14, f"{high:.1f} {self.unit}")
+        painter.drawText(4, self.height() - 4, f"{low:.1f} {self.unit}")
+        latest = (lows[-1] + highs[-1]) / 2
+        painter.drawText(self.rect().adjusted(0, 0, -4, 0), Qt.AlignRight | Qt.AlignTop, f"{latest:.2f} {self.unit}")
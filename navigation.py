@@ -0,0 +1,122 @@
+"""Page navigation inside the single application window.
+
+The main screen and the setup screens are pages of one ``QStackedWidget``, so
+switching screens just raises another page instead of unmapping and mapping
+top-level windows. ``Router`` builds pages from registered factories on first
+use, keeps a back stack, and times every switch from the request to the first
+paint of the new page. Every page but the main screen is a ``Page``.
+"""
+import time
+from collections import deque
+
+from PySide6.QtCore import QEvent, QObject, Qt, Signal
+from PySide6.QtWidgets import QPushButton, QSizePolicy, QVBoxLayout, QWidget
+
+FRAME_MS = 1000 / 60  # One frame on a 60 Hz panel, the switch latency budget
+LATENCY_SAMPLES = 100  # Recent switch latencies kept for inspection
+
+
+class Page(QWidget):
+    """A page below the main screen, styled as ``#setupScreen``, with a button back to the previous page.
+
+    A ``QWidget`` subclass only paints the style sheet's background with
+    ``WA_StyledBackground`` set; without it the page would show the window
+    behind it.
+    """
+
+    def __init__(self, parent):
+        super().__init__()
+        self.parent = parent  # Reference to the main screen
+        self.setObjectName("setupScreen")
+        self.setAttribute(Qt.WA_StyledBackground)
+
+        self.layout = QVBoxLayout()
+        self.setLayout(self.layout)
+
+        # Add a Back button
+        back_button = QPushButton("Back to Main Screen")
+        back_button.setObjectName("backButton")
+        back_button.clicked.connect(self.go_back)
+        self.layout.addWidget(back_button)
+
+    def go_back(self):
+        """Go back to the main screen."""
+        self.parent.go_back()
+
+
+class Router(QObject):
+    switched = Signal(str, float)  # Page name, milliseconds from request to first paint
+
+    def __init__(self, stack):
+        super().__init__()
+        self.stack = stack
+        self.factories = {}  # name -> callable building the page, for pages not built yet
+        self.pages = {}  # name -> page widget added to the stack
+        self.names = {}  # page widget -> name
+        self.back_stack = []  # Names of the pages to return to, most recent last
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.switch_started = None  # perf_counter() of the switch awaiting its first paint
+
+    def add(self, name, page):
+        """Add an already built page."""
+        self.pages[name] = page
+        self.names[page] = name
+        page.installEventFilter(self)
+        if self.stack.count():
+            # Hidden pages must not stretch the window to the largest page
+            page.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+        self.stack.addWidget(page)
+        return page
+
+    def register(self, name, factory):
+        """Register a page to be built by ``factory()`` the first time it is needed."""
+        self.factories[name] = factory
+
+    def __contains__(self, name):
+        return name in self.pages or name in self.factories
+
+    def page(self, name):
+        """Return the page called ``name``, building it on first use."""
+        page = self.pages.get(name)
+        if page is None:
+            page = self.add(name, self.factories[name]())
+        return page
+
+    def current_name(self):
+        return self.names.get(self.stack.currentWidget())
+
+    def navigate(self, name):
+        """Show page ``name``, remembering the current page for ``back``."""
+        current = self.current_name()
+        if current == name:
+            return
+        if current is not None:
+            self.back_stack.append(current)
+        self._switch(name)
+
+    def back(self):
+        """Return to the previous page, if there is one."""
+        if self.back_stack:
+            self._switch(self.back_stack.pop())
+
+    def _switch(self, name):
+        self.switch_started = time.perf_counter()
+        page = self.page(name)
+        previous = self.stack.currentWidget()
+        if previous is not None:
+            previous.setSizePolicy(QSizePolicy.Ignored, QSizePolicy.Ignored)
+        page.setSizePolicy(QSizePolicy.Preferred, QSizePolicy.Preferred)
+        self.stack.setCurrentWidget(page)
+
+    def last_latency(self):
+        """Milliseconds the most recent switch took to paint, or None."""
+        return self.latencies[-1] if self.latencies else None
+
+    def eventFilter(self, obj, event):
+        if (event.type() == QEvent.Paint and self.switch_started is not None
+                and obj is self.stack.currentWidget()):
+            latency = (time.perf_counter() - self.switch_started) * 1000
+            self.switch_started = None
+            self.latencies.append(latency)
+            self.switched.emit(self.names[obj], latency)
+        return False
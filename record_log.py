@@ -0,0 +1,392 @@
+"""Append-only record log for session data.
+
+Every save appends one newline-delimited JSON event to ``user_details.ndjson``
+instead of rewriting the whole history, and a tiny side index keeps the few
+facts the UI and reports need (last session, session count, log size, the
+record keys seen so far) so a save never has to read the log back.
+
+A second append-only file, ``user_details.offsets``, maps each session id to
+the byte offsets of its events, so one session can be read back with a couple
+of seeks no matter how long the history is.
+
+Stations sharing the log append under an advisory lock on
+``user_details.ndjson.lock``. Holding it, a station first catches up with
+what the others appended since it last looked (reading only the new tail of
+the offsets file), so offsets and counts stay right with any number of
+writers. A session's version is the number of events it has in the log.
+"""
+import json
+import os
+import re
+
+from locking import FileLock
+from storage import ConflictError, StorageBackend, matches
+
+LOG_PATH = "user_details.ndjson"
+INDEX_PATH = "user_details.idx"
+OFFSETS_PATH = "user_details.offsets"
+FOLD_BYTES = 1 << 20  # Log bytes iter_sessions folds at a time
+READ_BLOCK = 1 << 20  # Bytes read at a time when reading the log backwards
+EVENT_HEAD = re.compile(rb'\{"op": "(create|update)", "id": "([^"\\]*)", ')  # As json.dumps writes an event
+
+
+class RecordLog(StorageBackend):
+    def __init__(self, path=LOG_PATH, index_path=INDEX_PATH, offsets_path=OFFSETS_PATH):
+        self.path = path
+        self.index_path = index_path
+        self.offsets_path = offsets_path
+        self.lock = FileLock(path + ".lock")
+        self.offsets = None  # session_id -> [event offsets], loaded on first lookup
+        with self.lock:
+            self.index = self._load_index()
+        self.known_fields = set(self.index["fields"])
+
+    def _load_index(self):
+        """Load the side index, rebuilding it if it is missing or stale."""
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        offsets_size = os.path.getsize(self.offsets_path) if os.path.exists(self.offsets_path) else 0
+        if os.path.exists(self.index_path):
+            with open(self.index_path, "r") as f:
+                try:
+                    index = json.load(f)
+                except ValueError:
+                    index = None
+            # A crash between the log append and the index write leaves the
+            # index behind the log; only trust it if the sizes agree
+            if (index is not None and index.get("size") == size
+                    and index.get("offsets_size") == offsets_size and "fields" in index):
+                return index
+        return self._rebuild_index()
+
+    def _rebuild_index(self):
+        """Scan the log once to recover the side index and the offset index."""
+        self.offsets = None  # Rewritten below; reload on next lookup
+        index = {"last": None, "sessions": 0, "size": 0, "offsets_size": 0, "fields": []}
+        lines, fields = [], {}
+        for offset, event in self._scan():
+            if event["op"] == "create":
+                index["last"] = event["id"]
+                index["sessions"] += 1
+            for key in event["data"]:
+                fields.setdefault(key)
+            lines.append(f"{event['id']}\t{offset}\n")
+        if os.path.exists(self.path):
+            # Drop a torn tail so the next append starts on a fresh line
+            with open(self.path, "ab") as f:
+                f.truncate(self._valid_size)
+            index["size"] = self._valid_size
+        with open(self.offsets_path, "w") as f:
+            f.write("".join(lines))
+        index["offsets_size"] = os.path.getsize(self.offsets_path)
+        index["fields"] = list(fields)
+        self._write_index(index)
+        return index
+
+    def _scan(self):
+        """Yield ``(offset, event)`` for every complete line in the log."""
+        self._valid_size = 0
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            offset = 0
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break  # Torn write from a crash; ignore the partial line
+                yield offset, json.loads(line)
+                offset += len(line)
+                self._valid_size = offset
+
+    def _sync(self):
+        """Catch up with events other stations appended since we last looked.
+
+        Call with the lock held.
+        """
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        offsets_size = os.path.getsize(self.offsets_path) if os.path.exists(self.offsets_path) else 0
+        if size == self.index["size"] and offsets_size == self.index["offsets_size"]:
+            return
+        seen = self.index["offsets_size"]
+        self.index = self._load_index()
+        self.known_fields = set(self.index["fields"])
+        if self.offsets is not None:  # Still valid up to ``seen``; read just the rest
+            with open(self.offsets_path, "rb") as f:
+                f.seek(seen)
+                self._read_offsets(f, self.offsets)
+
+    def _refresh(self):
+        """Catch up with other stations before answering from the side index."""
+        with self.lock:
+            self._sync()
+
+    def _write_index(self, index):
+        """Atomically replace the side index file."""
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(index, f)
+        os.replace(tmp_path, self.index_path)
+
+    def _append(self, *events):
+        """Append events to the log, record their offsets and bump the side index."""
+        with self.lock:
+            self._sync()
+            self._append_locked(events)
+
+    def _append_locked(self, events):
+        offset = self.index["size"]
+        lines, offset_lines = [], []
+        for event in events:
+            if event["op"] == "create":
+                self.index["last"] = event["id"]
+                self.index["sessions"] += 1
+            line = (json.dumps(event) + "\n").encode()
+            lines.append(line)
+            offset_lines.append(f"{event['id']}\t{offset}\n")
+            if self.offsets is not None:
+                self.offsets.setdefault(event["id"], []).append(offset)
+            for key in event["data"]:
+                if key not in self.known_fields:
+                    self.known_fields.add(key)
+                    self.index["fields"].append(key)
+            offset += len(line)
+        with open(self.path, "ab") as f:
+            f.write(b"".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        with open(self.offsets_path, "a") as f:
+            f.write("".join(offset_lines))
+            self.index["offsets_size"] = f.tell()
+        self.index["size"] = offset
+        self._write_index(self.index)
+
+    def _load_offsets(self):
+        """Load the on-disk offset index into memory."""
+        offsets = {}
+        if os.path.exists(self.offsets_path):
+            with open(self.offsets_path, "rb") as f:
+                self._read_offsets(f, offsets)
+        return offsets
+
+    @staticmethod
+    def _read_offsets(f, offsets):
+        """Add the offset lines from ``f`` (opened in binary) to ``offsets``."""
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # Being appended by another station right now
+            session_id, offset = line.decode().split("\t")
+            offsets.setdefault(session_id, []).append(int(offset))
+
+    def _session_offsets(self, session_id):
+        """Return a session's event offsets, up to date with every station."""
+        with self.lock:
+            self._sync()
+            if self.offsets is None:
+                self.offsets = self._load_offsets()
+        if session_id not in self.offsets:
+            raise KeyError(session_id)
+        return self.offsets[session_id]
+
+    def create_session(self, record, session_id=None):
+        """Start a new session and return its id."""
+        import uuid  # Not needed to open the log, so kept off start-up
+
+        session_id = session_id or uuid.uuid4().hex
+        self._append({"op": "create", "id": session_id, "data": record})
+        return session_id
+
+    def create_sessions(self, records):
+        """Append a batch of new sessions with a single write."""
+        import uuid
+
+        self.write_batch([("create", uuid.uuid4().hex, record) for record in records])
+
+    def update_session(self, session_id, data, expected_version=None):
+        """Record a partial update (e.g. one setup's results) for a session."""
+        event = {"op": "update", "id": session_id, "data": data}
+        if expected_version is None:
+            self._append(event)
+            return
+        with self.lock:  # Held from the version check to the append
+            version = self.session_version(session_id)
+            if version != expected_version:
+                raise ConflictError(session_id, expected_version, version)
+            self._append(event)
+
+    def session_version(self, session_id):
+        return len(self._session_offsets(session_id))
+
+    def write_batch(self, operations):
+        """Append a batch of creates and updates with a single write and fsync."""
+        events = [{"op": op, "id": session_id, "data": data} for op, session_id, data in operations]
+        if events:
+            self._append(*events)
+
+    def get_session(self, session_id):
+        """Read one session back by seeking to its events."""
+        record = {}
+        offsets = self._session_offsets(session_id)  # KeyError for an unknown id, even before the first write
+        with open(self.path, "rb") as f:
+            for offset in offsets:
+                f.seek(offset)
+                record.update(json.loads(f.readline())["data"])
+        return record
+
+    def last_session_id(self):
+        """Return the id of the most recently created session."""
+        self._refresh()
+        return self.index["last"]
+
+    def count(self):
+        self._refresh()
+        return self.index["sessions"]
+
+    def iter_events(self):
+        """Yield the raw events in the order they were written."""
+        for _, event in self._scan():
+            yield event
+
+    def field_names(self):
+        self._refresh()
+        return list(self.index["fields"])
+
+    def partition(self, chunk_rows):
+        """Chunk sessions by their event offsets, for ``read_sessions``."""
+        sessions = list(self._load_offsets().items())  # First event order, i.e. creation order
+        return ((read_sessions, (self.path, sessions[start:start + chunk_rows]))
+                for start in range(0, len(sessions), chunk_rows))
+
+    def change_token(self):
+        """The log size: every change appends to the log."""
+        self._refresh()
+        return self.index["size"]
+
+    def changes_since(self, token):
+        """Read only the events appended after ``token`` (a previous log size)."""
+        if not isinstance(token, int) or token > self.change_token():
+            return None
+        changed = {}
+        with open(self.path, "rb") as f:
+            f.seek(token)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                changed.setdefault(json.loads(line)["id"])
+        return list(changed)
+
+    def iter_sessions(self, device_sn=None, operator=None, date=None):
+        """Fold the log into ``(session_id, record)`` pairs, in creation order.
+
+        Sessions are yielded as soon as the scan passes their last event. The
+        log is folded ``FOLD_BYTES`` at a time, after a first pass that reads
+        it backwards (just each event's op and id) to find which sessions are
+        still updated after each stretch. Memory is bounded by one stretch and
+        the sessions open across stretch ends, however long the history.
+        Events appended once the scan has started are left for the next one.
+        """
+        end = self.change_token()
+        if not end:
+            return
+        with open(self.path, "rb") as f:
+            carried = {}  # Stretch -> sessions created by its end and updated after it (only if any)
+            open_sessions, stretch = set(), None
+            for offset, line in read_lines_backwards(f, end):
+                at = offset // FOLD_BYTES
+                if stretch is not None and at < stretch and open_sessions:
+                    frozen = frozenset(open_sessions)
+                    for passed in range(at, stretch):
+                        carried[passed] = frozen
+                stretch = at
+                op, session_id = event_head(line)
+                if op == "create":
+                    open_sessions.discard(session_id)
+                else:
+                    open_sessions.add(session_id)
+            del open_sessions
+
+            pending, complete = {}, set()  # Sessions in creation order, and those fully read
+
+            def fold(lines, updated_later):
+                last = {event_head(line)[1]: i for i, line in enumerate(lines)}
+                for i, line in enumerate(lines):
+                    event = json.loads(line)
+                    session_id = event["id"]
+                    if event["op"] == "create":
+                        pending[session_id] = dict(event["data"])
+                    elif session_id in pending:
+                        pending[session_id].update(event["data"])
+                    else:
+                        continue  # Update for an unknown or already emitted session
+                    if last[session_id] == i and session_id not in updated_later:
+                        complete.add(session_id)
+                    while pending:
+                        head = next(iter(pending))
+                        if head not in complete:
+                            break
+                        complete.discard(head)
+                        record = pending.pop(head)
+                        if matches(record, device_sn, operator, date):
+                            yield head, record
+
+            f.seek(0)
+            lines, stretch, offset = [], 0, 0
+            for line in f:
+                if offset >= end:
+                    break
+                if offset // FOLD_BYTES != stretch:
+                    yield from fold(lines, carried.get(stretch, ()))
+                    lines, stretch = [], offset // FOLD_BYTES
+                lines.append(line)
+                offset += len(line)
+            yield from fold(lines, ())
+        for session_id, record in pending.items():  # Not reached unless a session was created twice
+            if matches(record, device_sn, operator, date):
+                yield session_id, record
+
+
+def event_head(line):
+    """``(op, session_id)`` of a log line, read without decoding its data."""
+    found = EVENT_HEAD.match(line)
+    if found is None:  # Not as json.dumps writes our events (e.g. an escaped id); decode it all
+        event = json.loads(line)
+        return event["op"], event["id"]
+    return found.group(1).decode(), found.group(2).decode()
+
+
+def read_lines_backwards(f, end):
+    """Yield ``(offset, line)`` for the lines of ``f`` (opened in binary) before ``end``, last first.
+
+    ``end`` must be the end of a line.
+    """
+    carry, position = b"", end  # carry: the rest of the line the block read last started inside
+    while position > 0:
+        size = min(READ_BLOCK, position)
+        position -= size
+        f.seek(position)
+        buffer = f.read(size) + carry
+        start = buffer.find(b"\n") + 1 if position else 0
+        if position and not start:
+            carry = buffer  # No line starts in this block
+            continue
+        carry = buffer[:start]
+        offsets, offset = [], position + start
+        lines = buffer[start:].split(b"\n")[:-1]
+        for line in lines:
+            offsets.append(offset)
+            offset += len(line) + 1
+        for offset, line in zip(reversed(offsets), reversed(lines)):
+            yield offset, line + b"\n"
+
+
+def read_sessions(path, sessions):
+    """Yield ``(session_id, record)`` for ``(session_id, event offsets)`` pairs."""
+    with open(path, "rb") as f:
+        for session_id, offsets in sessions:
+            record = None
+            for offset in offsets:
+                f.seek(offset)
+                event = json.loads(f.readline())
+                if event["op"] == "create":
+                    record = dict(event["data"])
+                elif record is not None:
+                    record.update(event["data"])
+            if record is not None:  # Skip updates whose session was never created
+                yield session_id, record
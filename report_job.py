@@ -0,0 +1,70 @@
+"""Background report generation.
+
+``ReportJob`` runs ``reports.update_csv_report`` as a ``store_job.StoreJob``
+and reports progress, completion, an empty store, failure or cancellation
+back to the UI through ``ReportJobSignals``. Whether there is anything to
+report is checked on the worker thread too: counting the sessions is a scan
+of the whole file on the json backend.
+"""
+import threading
+import time
+
+from PySide6.QtCore import QObject, Signal
+
+from reports import ReportCancelled, update_csv_report
+from store_job import StoreJob
+
+PROGRESS_INTERVAL = 0.1  # Seconds between progress signals
+
+
+class ReportJobSignals(QObject):
+    progress = Signal(int, int, float)  # Rows written, rows expected (0 if unknown), rows per second
+    finished = Signal(str, int, str, float)  # Report path, rows written, mode, seconds
+    failed = Signal(str)  # Error message
+    cancelled = Signal()
+    empty = Signal()  # No sessions to report
+
+
+class ReportJob(StoreJob):
+    def __init__(self, open_store, csv_path, writer=None, force=False):
+        super().__init__(open_store, writer)
+        self.csv_path = csv_path
+        self.force = force
+        self.signals = ReportJobSignals()
+        self.cancel_event = threading.Event()
+
+    def cancel(self):
+        """Ask the job to stop at the next progress check."""
+        self.cancel_event.set()
+
+    def run(self):
+        started = time.perf_counter()
+        last_emit = [0.0]
+
+        def progress(done, total):
+            if self.cancel_event.is_set():
+                raise ReportCancelled()
+            now = time.perf_counter()
+            if now - last_emit[0] >= PROGRESS_INTERVAL or done == total:
+                last_emit[0] = now
+                elapsed = now - started
+                self.signals.progress.emit(done, total, done / elapsed if elapsed else 0.0)
+
+        def report(store):
+            if not len(store):
+                return None
+            return update_csv_report(store, self.csv_path, self.force, progress)
+
+        try:
+            written = self.read_store(report)
+        except ReportCancelled:
+            self.signals.cancelled.emit()
+            return
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        if written is None:
+            self.signals.empty.emit()
+            return
+        rows, mode = written
+        self.signals.finished.emit(self.csv_path, rows, mode, time.perf_counter() - started)
@@ -0,0 +1,447 @@
+"""CSV report generation.
+
+Reports are written as the records stream out of the store, so memory use
+does not grow with the history. The header is the union of every record's
+keys (in first-seen order), taken from the store's field list when it keeps
+one and otherwise from a cheap pre-pass over the records.
+
+Next to the report two small files remember how far it got:
+
+* ``<report>.state`` - the store's change token at export time, the header,
+  the report size and row count
+* ``<report>.rows``  - one ``session_id, row digest, byte offset`` line per row
+
+``update_csv_report`` uses them to return straight away when the store has not
+changed, and otherwise to rewrite the report only from the first session
+whose row changed, appending new sessions after it.
+
+Full rebuilds can decode and encode rows in a pool of worker processes
+(``PPT_REPORT_WORKERS`` or ``--workers``); chunks are written back in order,
+so the output is byte-identical to a single-process run.
+
+``write_typed_report`` (``--typed``) writes the sessions as ``SessionRecord``
+reads them instead: one fixed set of columns, ISO dates, numeric heights and
+dial readings and 1/0 answers, for spreadsheets and tools that need to sort
+or sum them.
+"""
+import argparse
+import collections
+import csv
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+REPORT_PATH = "user_details_report.csv"
+TYPED_REPORT_PATH = "user_details_typed.csv"
+TYPED_HEADER = ["session_id", "device_sn", "operator", "date", "setup2_reached", "setup2_height",
+                "setup3_reached", "setup3_height", "setup4_zeroed", "setup4_recorded", "setup4_zero",
+                "setup4_deflection", "setup4_peak", "outcome"]
+STATE_SUFFIX = ".state"
+ROWS_SUFFIX = ".rows"
+PROGRESS_EVERY = 1000  # Rows between progress callbacks
+CHUNK_ROWS = 5000  # Rows per chunk handed to an encoding worker
+DEFAULT_WORKERS = int(os.environ.get("PPT_REPORT_WORKERS", "1"))
+
+
+class ReportCancelled(Exception):
+    """Raised from a progress callback to stop a report part-way.
+
+    The saved watermark is dropped before any rows are written, so the next
+    run after a cancelled one rebuilds the report.
+    """
+
+
+def iter_json_array(path, chunk_size=1 << 16):
+    """Yield the items of a top-level JSON list without loading the whole file."""
+    decoder = json.JSONDecoder()
+    with open(path, "r") as f:
+        buffer, pos, eof = "", 0, False
+
+        def fill():
+            # Keep the unparsed tail and append the next chunk
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+
+        def skip(separators):
+            # Advance past whitespace and separators, reading more as needed
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and (buffer[pos].isspace() or buffer[pos] in separators):
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    return
+                fill()
+
+        skip("")
+        if pos >= len(buffer) or buffer[pos] != "[":
+            raise ValueError(f"{path} does not contain a JSON list")
+        pos += 1
+        while True:
+            skip(",")
+            if pos >= len(buffer):
+                raise ValueError(f"{path} ends before the JSON list is closed")
+            if buffer[pos] == "]":
+                return
+            try:
+                item, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                fill()
+                continue
+            if end == len(buffer) and not eof:
+                # A scalar may continue in the next chunk; parse it again
+                fill()
+                continue
+            pos = end
+            yield item
+
+
+def union_header(records):
+    """Return every key seen in ``records``, in first-seen order."""
+    header = {}
+    for record in records:
+        for key in record:
+            header.setdefault(key)
+    return list(header)
+
+
+def report_header(store):
+    """Return the report header from the store's field list or a pre-pass."""
+    fields = store.field_names()
+    if fields is None:
+        fields = union_header(store.iter_records())
+    return fields
+
+
+def encode_row(values):
+    """Encode one CSV row exactly as ``csv.writer`` writes it to a file."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue().encode()
+
+
+def row_digest(line):
+    """Return a short content hash of an encoded CSV row."""
+    return hashlib.blake2b(line, digest_size=8).hexdigest()
+
+
+def load_report_state(csv_path):
+    """Return the saved watermark for ``csv_path`` if it still matches the file."""
+    try:
+        with open(csv_path + STATE_SUFFIX, "r") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (not os.path.exists(csv_path) or os.path.getsize(csv_path) != state.get("size")
+            or not os.path.exists(csv_path + ROWS_SUFFIX)):
+        return None  # Report edited or a previous update was interrupted
+    return state
+
+
+def _save_state(csv_path, state):
+    tmp_path = csv_path + STATE_SUFFIX + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, csv_path + STATE_SUFFIX)
+
+
+def _drop_state(csv_path):
+    if os.path.exists(csv_path + STATE_SUFFIX):
+        os.remove(csv_path + STATE_SUFFIX)
+
+
+class _ReportWriter:
+    """Appends encoded rows to the report and their watermarks to the rows file."""
+
+    def __init__(self, csv_file, rows_file, offset=0, rows=0, progress=None, total=0):
+        self.csv_file = csv_file
+        self.rows_file = rows_file
+        self.offset = offset
+        self.rows = rows
+        self.written = 0
+        self.progress = progress  # Called as progress(rows written, rows expected)
+        self.total = total
+
+    def write_header(self, line):
+        self.csv_file.write(line)
+        self.offset += len(line)
+
+    def write(self, session_id, line):
+        self.rows_file.write(f"{session_id}\t{row_digest(line)}\t{self.offset}\n".encode())
+        self.csv_file.write(line)
+        self.offset += len(line)
+        self.rows += 1
+        self.written += 1
+        if self.progress is not None and self.written % PROGRESS_EVERY == 0:
+            self.progress(self.written, self.total)
+
+    def write_chunk(self, data, rows):
+        """Write a chunk encoded by ``encode_chunk``."""
+        lines = []
+        offset = self.offset
+        for session_id, digest, length in rows:
+            lines.append(f"{session_id}\t{digest}\t{offset}\n")
+            offset += length
+        self.rows_file.write("".join(lines).encode())
+        self.csv_file.write(data)
+        self.offset = offset
+        self.rows += len(rows)
+        before = self.written // PROGRESS_EVERY
+        self.written += len(rows)
+        if self.progress is not None and self.written // PROGRESS_EVERY != before:
+            self.progress(self.written, self.total)
+
+    def done(self):
+        if self.progress is not None:
+            self.progress(self.written, self.total)
+
+
+def encode_chunk(chunk):
+    """Encode ``(session_id, values)`` rows; runs in a worker process.
+
+    Returns the encoded bytes and a ``(session_id, digest, length)`` per row.
+    """
+    lines, rows = [], []
+    for session_id, values in chunk:
+        line = encode_row(values)
+        lines.append(line)
+        rows.append((session_id, row_digest(line), len(line)))
+    return b"".join(lines), rows
+
+
+def encode_partition(header, reader, args):
+    """Read one store partition with ``reader(*args)`` and encode it; runs in a worker."""
+    return encode_chunk([(session_id, [record.get(key) for key in header])
+                         for session_id, record in reader(*args)])
+
+
+def _tasks(store, header):
+    """Yield ``(function, args)`` encoding tasks covering the store in order.
+
+    Stores that can be partitioned are read and decoded by the workers
+    themselves; otherwise records are read here and only encoded remotely.
+    """
+    partitions = store.partition(CHUNK_ROWS)
+    if partitions is not None:
+        for reader, args in partitions:
+            yield encode_partition, (header, reader, args)
+        return
+    chunk = []
+    for session_id, record in store.iter_sessions():
+        chunk.append((session_id, [record.get(key) for key in header]))
+        if len(chunk) == CHUNK_ROWS:
+            yield encode_chunk, (chunk,)
+            chunk = []
+    if chunk:
+        yield encode_chunk, (chunk,)
+
+
+def _encoded_chunks(store, header, workers):
+    """Yield encoded chunks in order, keeping a bounded number in flight."""
+    # Spawned workers do not inherit the Qt threads of the calling process
+    pool = ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn"))
+    try:
+        in_flight = collections.deque()
+        for function, args in _tasks(store, header):
+            in_flight.append(pool.submit(function, *args))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
+    finally:
+        pool.shutdown(cancel_futures=True)
+
+
+def write_csv_report(store, csv_path=REPORT_PATH, progress=None, workers=DEFAULT_WORKERS):
+    """Rebuild the whole report from ``store``; return the row count.
+
+    ``progress(rows written, rows expected)`` is called every few rows and may
+    raise ``ReportCancelled`` to stop. With ``workers > 1`` rows are read and
+    encoded in that many worker processes.
+    """
+    # Taken first, so sessions saved during the export are picked up next time
+    token = store.change_token()
+    header = report_header(store)
+    _drop_state(csv_path)
+    with open(csv_path, "wb") as csv_file, open(csv_path + ROWS_SUFFIX, "wb") as rows_file:
+        out = _ReportWriter(csv_file, rows_file, progress=progress,
+                            total=store.count() if progress else 0)
+        if header:
+            out.write_header(encode_row(header))
+            if workers > 1:
+                for data, rows in _encoded_chunks(store, header, workers):
+                    out.write_chunk(data, rows)
+            else:
+                for session_id, record in store.iter_sessions():
+                    out.write(session_id, encode_row([record.get(key) for key in header]))
+        out.done()
+    _save_state(csv_path, {"token": token, "header": header, "size": out.offset, "rows": out.rows})
+    return out.rows
+
+
+def _diff_changed(store, csv_path, state, header, changed):
+    """Find the first dirty row using the store's list of changed sessions."""
+    lines = {}
+    for session_id in changed:
+        lines[session_id] = encode_row([store.get_session(session_id).get(key) for key in header])
+    keep = (state["rows"], state["size"], os.path.getsize(csv_path + ROWS_SUFFIX))
+    seen, tail, dirty = set(), [], False
+    with open(csv_path + ROWS_SUFFIX, "rb") as f:
+        row, position = 0, 0
+        for raw in f:
+            session_id, digest, offset = raw.decode().split("\t")
+            if session_id in lines:
+                seen.add(session_id)
+                if not dirty and row_digest(lines[session_id]) != digest:
+                    dirty = True
+                    keep = (row, int(offset), position)
+            if dirty:
+                tail.append(session_id)
+            row += 1
+            position += len(raw)
+    tail.extend(session_id for session_id in changed if session_id not in seen)
+
+    def sessions():
+        for session_id in tail:
+            line = lines.get(session_id)
+            if line is None:
+                line = encode_row([store.get_session(session_id).get(key) for key in header])
+            yield session_id, line
+
+    return keep, sessions(), len(tail)
+
+
+def _diff_all(store, csv_path, state, header):
+    """Find the first dirty row by comparing every session with the rows file."""
+    sessions = store.iter_sessions()
+    keep = (state["rows"], state["size"], os.path.getsize(csv_path + ROWS_SUFFIX))
+    first = None
+    with open(csv_path + ROWS_SUFFIX, "rb") as f:
+        row, position = 0, 0
+        for session_id, record in sessions:
+            line = encode_row([record.get(key) for key in header])
+            raw = f.readline()
+            if not raw:
+                first = (session_id, line)
+                break
+            saved_id, digest, offset = raw.decode().split("\t")
+            if saved_id != session_id or digest != row_digest(line):
+                first = (session_id, line)
+                keep = (row, int(offset), position)
+                break
+            row += 1
+            position += len(raw)
+
+    def remaining():
+        if first is not None:
+            yield first
+            for session_id, record in sessions:
+                yield session_id, encode_row([record.get(key) for key in header])
+
+    return keep, remaining(), max(store.count() - keep[0], 0)
+
+
+def update_csv_report(store, csv_path=REPORT_PATH, force=False, progress=None,
+                      workers=DEFAULT_WORKERS):
+    """Bring the report up to date, re-exporting only new or changed sessions.
+
+    Returns ``(rows written, mode)`` where mode is ``"unchanged"``,
+    ``"updated"`` or ``"rebuilt"``. ``force=True`` always rebuilds.
+    ``progress`` and ``workers`` are passed on to ``write_csv_report``; the
+    incremental path only touches a few rows and always runs in-process.
+    """
+    state = None if force else load_report_state(csv_path)
+    if state is None:
+        return write_csv_report(store, csv_path, progress, workers), "rebuilt"
+    token = store.change_token()
+    if token == state["token"]:
+        return 0, "unchanged"
+    header = report_header(store)
+    if header != state["header"]:
+        return write_csv_report(store, csv_path, progress, workers), "rebuilt"  # The header line changes
+    changed = store.changes_since(state["token"])
+    if changed is None:
+        keep, sessions, total = _diff_all(store, csv_path, state, header)
+    else:
+        keep, sessions, total = _diff_changed(store, csv_path, state, header, changed)
+    keep_rows, keep_offset, rows_offset = keep
+    _drop_state(csv_path)
+    with open(csv_path, "r+b") as csv_file, open(csv_path + ROWS_SUFFIX, "r+b") as rows_file:
+        csv_file.truncate(keep_offset)
+        csv_file.seek(keep_offset)
+        rows_file.truncate(rows_offset)
+        rows_file.seek(rows_offset)
+        out = _ReportWriter(csv_file, rows_file, keep_offset, keep_rows, progress, total)
+        for session_id, line in sessions:
+            out.write(session_id, line)
+        out.done()
+    _save_state(csv_path, {"token": token, "header": header, "size": out.offset, "rows": out.rows})
+    return out.rows - keep_rows, "updated"
+
+
+def typed_values(session_id, typed):
+    """The typed report's values for one ``SessionRecord``."""
+    def answer(value):
+        return "" if value is None else int(value)
+
+    def number(value):
+        return "" if value is None else value
+
+    return [session_id, typed.device_sn, typed.operator, typed.date.isoformat() if typed.date else "",
+            answer(typed.setup2_reached), number(typed.setup2_height),
+            answer(typed.setup3_reached), number(typed.setup3_height),
+            int(typed.setup4_zeroed), int(typed.setup4_recorded), number(typed.setup4_zero),
+            number(typed.setup4_deflection), number(typed.setup4_peak), typed.outcome.value]
+
+
+def write_typed_report(store, csv_path=TYPED_REPORT_PATH, anomalies=None):
+    """Write every session from ``store`` as typed columns; return the row count.
+
+    Values that cannot be read are left blank; with an ``anomalies`` list,
+    ``(session_id, key, value, reason)`` is added to it for each.
+    """
+    from session_record import SessionRecord
+
+    rows = 0
+    found = [] if anomalies is not None else None
+    with open(csv_path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(TYPED_HEADER)
+        for session_id, record in store.iter_sessions():
+            writer.writerow(typed_values(session_id, SessionRecord.from_dict(record, found)))
+            rows += 1
+            if found:
+                anomalies.extend((session_id, *anomaly) for anomaly in found)
+                found.clear()
+    return rows
+
+
+if __name__ == "__main__":
+    from storage import open_store
+    parser = argparse.ArgumentParser(description="Bring the CSV report up to date.")
+    parser.add_argument("report", nargs="?")
+    parser.add_argument("--full", action="store_true", help="rebuild the whole report")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help="encoding processes for a full rebuild")
+    parser.add_argument("--typed", action="store_true", help="write the typed report instead")
+    args = parser.parse_args()
+    started = time.perf_counter()
+    if args.typed:
+        anomalies = []
+        written = write_typed_report(open_store(), args.report or TYPED_REPORT_PATH, anomalies)
+        print(f"typed: {written} rows written in {time.perf_counter() - started:.3f}s, "
+              f"{len(anomalies)} values could not be read")
+        for session_id, key, value, reason in anomalies[:20]:
+            print(f"  {session_id}: {key}: {reason}")
+    else:
+        written, mode = update_csv_report(open_store(), args.report or REPORT_PATH, force=args.full,
+                                          workers=args.workers)
+        print(f"{mode}: {written} rows written in {time.perf_counter() - started:.3f}s")
@@ -0,0 +1,605 @@
+"""Segmented session store: a log split into sealed, optionally compressed days.
+
+Events (``{"op": "create" | "update", "id": ..., "data": ...}``, as in
+``record_log.py``) are appended to ``active.ndjson`` in
+``user_details.segments/``, and a save only ever touches that file. The
+first write of a new day, or one that finds the active segment over
+``segment_bytes``, first rotates it: the file is renamed to a numbered
+segment (``000042-2024-05-01.ndjson``), its event offsets are written next to
+it (``.idx``), and ``manifest.json`` lists it. Sealed segments never change
+again, so ``seal`` can compress them (stdlib gzip or lzma, picked with
+``PPT_SEGMENT_COMPRESSION``) on a background thread after each rotation.
+
+A session's events can span segments: the placeholders from
+``submit_details`` land in one, setup results possibly in the next.
+``compact`` rewrites the sealed segments with one event per session holding
+its final record (and how many writes it folds, so versions still count
+every write), and swaps them in with one manifest write. Files that
+``seal`` or ``compact`` replace are not removed there and then: another
+station may have listed them just before and be about to read them. The
+manifest keeps them as ``retired`` for ``RETIRED_SECONDS``, and a later
+seal, compaction or rotation removes them.
+
+Lookups read the active segment's offsets (kept in memory) and then the
+sealed segments' indexes from newest to oldest, stopping at the one that
+created the session, so recent sessions cost the same however long the
+history is. A full scan reads the sealed indexes one at a time and
+keeps none of them. Stations sharing the directory write under its
+advisory lock and catch up from the manifest and the active segment's size.
+
+    python segment_store.py seal      # Compress sealed segments now
+    python segment_store.py compact   # Fold sessions in sealed segments
+    python segment_store.py stats
+"""
+import datetime
+import json
+import os
+import sys
+import time
+
+from locking import FileLock
+from storage import ConflictError, StorageBackend, matches
+
+SEGMENTS_DIR = "user_details.segments"
+SEGMENT_BYTES = 64 * 1024 * 1024  # Rotate once the active segment is this big, or on a new day
+COMPRESSION = os.environ.get("PPT_SEGMENT_COMPRESSION") or None  # None, "gzip" or "lzma"
+SUFFIXES = {None: "", "gzip": ".gz", "lzma": ".xz"}
+ACTIVE_NAME = "active.ndjson"
+MANIFEST_NAME = "manifest.json"
+RETIRED_SECONDS = 60 * 60  # How long files replaced by seal or compact are kept, for readers that listed them
+
+
+def open_segment(path, compression, mode="rb"):
+    """Open a segment file, through gzip or lzma if it is compressed."""
+    if compression == "gzip":
+        import gzip
+        return gzip.open(path, mode)
+    if compression == "lzma":
+        import lzma
+        return lzma.open(path, mode)
+    return open(path, mode)
+
+
+def new_index():
+    """An empty segment index: each session's ``[offset, writes]`` events, and those it created."""
+    return {"events": {}, "created": {}, "fields": {}, "size": 0}
+
+
+def index_event(index, offset, event):
+    """Add one event, found at ``offset`` in the segment, to ``index``."""
+    index["events"].setdefault(event["id"], []).append([offset, event.get("writes", 1)])
+    if event["op"] == "create":
+        index["created"][event["id"]] = None  # An ordered set
+    for key in event["data"]:
+        index["fields"].setdefault(key)
+
+
+def read_lines(f, offset=0):
+    """Yield ``(offset, line)`` for the complete lines of ``f`` from ``offset`` on."""
+    if offset:
+        f.seek(offset)
+    for line in f:
+        if not line.endswith(b"\n"):
+            break  # Torn write from a crash, or being appended right now
+        yield offset, line
+        offset += len(line)
+
+
+class SegmentStore(StorageBackend):
+    def __init__(self, directory=SEGMENTS_DIR, segment_bytes=SEGMENT_BYTES, compression=COMPRESSION):
+        if compression not in SUFFIXES:
+            raise ValueError(f"Unknown segment compression: {compression}")
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.compression = compression
+        os.makedirs(directory, exist_ok=True)
+        self.active_path = os.path.join(directory, ACTIVE_NAME)
+        self.manifest_path = os.path.join(directory, MANIFEST_NAME)
+        self.lock = FileLock(os.path.join(directory, "lock"))
+        self.manifest = None
+        self.manifest_stat = None
+        self.active = new_index()  # Index of the active segment, read up to active["size"]
+        self.indexes = {}  # Sealed segment name -> its index, loaded on first use
+        self.sealing = None  # Background compression thread
+        with self.lock:
+            self._sync()
+            self._recover()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    # Keeping up with other stations
+
+    def _sync(self):
+        """Catch up with what other stations wrote since we last looked.
+
+        Call with the lock held.
+        """
+        stat = self._manifest_stat()
+        if self.manifest is None or stat != self.manifest_stat:
+            rotations = self.manifest["rotations"] if self.manifest else 0
+            if stat is None:
+                self.manifest = {"segments": [], "next": 1, "rotations": 0, "active_day": None}
+            else:
+                with open(self.manifest_path, "r") as f:
+                    self.manifest = json.load(f)
+            self.manifest_stat = stat
+            if self.manifest["rotations"] != rotations:
+                self.active = new_index()  # Rotated by another station; read the new file
+            names = {entry["name"] for entry in self.manifest["segments"]}
+            self.indexes = {name: index for name, index in self.indexes.items() if name in names}
+        size = os.path.getsize(self.active_path) if os.path.exists(self.active_path) else 0
+        if size < self.active["size"]:
+            self.active = new_index()
+        if size != self.active["size"]:
+            with open(self.active_path, "rb") as f:
+                for offset, line in read_lines(f, self.active["size"]):
+                    index_event(self.active, offset, json.loads(line))
+                    self.active["size"] = offset + len(line)
+
+    def _manifest_stat(self):
+        try:
+            stat = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _write_manifest(self):
+        """Atomically replace the manifest; call with the lock held."""
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+        self.manifest_stat = self._manifest_stat()
+
+    def _recover(self):
+        """List a segment rotated just before a crash, before the manifest was written."""
+        prefix = f"{self.manifest['next']:06d}-"
+        for name in sorted(os.listdir(self.directory)):
+            if name.startswith(prefix) and name.endswith(".ndjson"):
+                index = new_index()
+                with open(self._path(name), "rb") as f:
+                    for offset, line in read_lines(f):
+                        index_event(index, offset, json.loads(line))
+                        index["size"] = offset + len(line)
+                self._add_segment(name[:-len(".ndjson")], name, None, index, rotated=True)
+                self._write_manifest()
+
+    # Segments
+
+    def _add_segment(self, name, file_name, compression, index, rotated):
+        """Write a sealed segment's index and list it in the (unsaved) manifest."""
+        with open(self._path(name + ".idx"), "w") as f:
+            json.dump({"events": index["events"], "created": list(index["created"])}, f)
+        if rotated:
+            self.manifest["rotations"] += 1
+        self.manifest["next"] = max(self.manifest["next"], int(name.split("-", 1)[0]) + 1)
+        self.manifest["segments"].append({
+            "name": name,
+            "file": file_name,
+            "compression": compression,
+            "day": name.split("-", 1)[1],
+            "rotation": self.manifest["rotations"] if rotated else None,  # None once compacted
+            "sessions": len(index["created"]),
+            "last": next(reversed(index["created"]), None),
+            "fields": list(index["fields"]),
+            "size": index["size"],
+        })
+        self.indexes[name] = {"events": index["events"], "created": index["created"]}
+
+    def _segment_index(self, entry):
+        """Return a sealed segment's index, reading it on first use."""
+        index = self.indexes.get(entry["name"])
+        if index is None:
+            index = self.indexes[entry["name"]] = self._read_index(entry)
+        return index
+
+    def _read_index(self, entry):
+        """Return a sealed segment's index without keeping it, for scans over every segment."""
+        index = self.indexes.get(entry["name"])
+        if index is None:
+            with open(self._path(entry["name"] + ".idx"), "r") as f:
+                index = json.load(f)
+            index["created"] = dict.fromkeys(index["created"])
+        return index
+
+    def _retire(self, file_names):
+        """List files no longer in use in the (unsaved) manifest, to be removed once nobody reads them."""
+        now = time.time()
+        self.manifest.setdefault("retired", []).extend([file_name, now] for file_name in file_names)
+
+    def _remove_retired(self):
+        """Remove files retired over ``RETIRED_SECONDS`` ago; call with the lock held, then write the manifest.
+
+        Returns whether any were removed. A file still open somewhere (which
+        Windows does not allow to be removed) is left for the next time.
+        """
+        kept, cutoff = [], time.time() - RETIRED_SECONDS
+        for file_name, retired in self.manifest.get("retired", []):
+            if retired > cutoff:
+                kept.append([file_name, retired])
+                continue
+            try:
+                os.remove(self._path(file_name))
+            except FileNotFoundError:
+                pass
+            except OSError:
+                kept.append([file_name, retired])
+        removed = len(kept) != len(self.manifest.get("retired", []))
+        if removed:
+            self.manifest["retired"] = kept
+        return removed
+
+    def _rotate_if_due(self):
+        """Seal the active segment on a new day or once it is full; call with the lock held."""
+        today = datetime.date.today().isoformat()
+        if self.active["size"] and (self.manifest["active_day"] != today
+                                    or self.active["size"] >= self.segment_bytes):
+            name = f"{self.manifest['next']:06d}-{self.manifest['active_day'] or today}"
+            self.active["size"] = self._truncate_torn_tail()
+            os.replace(self.active_path, self._path(name + ".ndjson"))
+            self._add_segment(name, name + ".ndjson", None, self.active, rotated=True)
+            self.active = new_index()
+            self.manifest["active_day"] = today
+            self._remove_retired()
+            self._write_manifest()
+            if self.compression and (self.sealing is None or not self.sealing.is_alive()):
+                import threading
+                self.sealing = threading.Thread(target=self.seal, daemon=True)
+                self.sealing.start()
+        elif not self.active["size"] and self.manifest["active_day"] != today:
+            self.manifest["active_day"] = today
+            self._write_manifest()
+
+    def _truncate_torn_tail(self):
+        """Drop a partial line left by a crash; with the lock held nobody else is appending."""
+        if os.path.exists(self.active_path) and os.path.getsize(self.active_path) > self.active["size"]:
+            with open(self.active_path, "ab") as f:
+                f.truncate(self.active["size"])
+        return self.active["size"]
+
+    def seal(self):
+        """Compress sealed segments that are not yet; return how many were."""
+        if not self.compression:
+            return 0
+        with self.lock:
+            self._sync()
+            if self._remove_retired():
+                self._write_manifest()
+            pending = [(entry["name"], entry["file"]) for entry in self.manifest["segments"]
+                       if entry["compression"] is None]
+        for name, source_name in pending:
+            file_name = name + ".ndjson" + SUFFIXES[self.compression]
+            tmp_path = self._path(f"{file_name}.{os.getpid()}.tmp")
+            # Compress outside the lock: the segment no longer changes
+            try:
+                with open(self._path(source_name), "rb") as source, \
+                        open_segment(tmp_path, self.compression, "wb") as target:
+                    while block := source.read(1024 * 1024):
+                        target.write(block)
+            except FileNotFoundError:
+                continue  # Compressed or compacted meanwhile by another station
+            os.replace(tmp_path, self._path(file_name))
+            with self.lock:
+                self._sync()
+                for current in self.manifest["segments"]:
+                    if current["name"] == name and current["file"] == source_name:
+                        current["file"], current["compression"] = file_name, self.compression
+                        self._retire([source_name])
+                        self._write_manifest()
+                        break
+                else:
+                    os.remove(self._path(file_name))  # The segment is gone; drop the copy
+        return len(pending)
+
+    def compact(self):
+        """Rewrite the sealed segments with one final record per session.
+
+        Returns the number of segments before and after. Segments sealed
+        while this runs are left for the next pass.
+        """
+        with self.lock:
+            self._sync()
+            inputs = [dict(entry) for entry in self.manifest["segments"]]
+        # Where each session's last sealed event is, so it is written out once passed
+        last = {}
+        for position, entry in enumerate(inputs):
+            for session_id, events in self._read_index(entry)["events"].items():
+                last[session_id] = (position, events[-1][0])
+        outputs = []
+        output = None  # [name, file, index, day] of the segment being written
+        pending, complete = {}, set()  # session_id -> [op, record, writes, day], and those fully read
+
+        def write(session_id, op, record, writes, day):
+            nonlocal output
+            if output is not None and (output[3] != day or output[2]["size"] >= self.segment_bytes):
+                finish()
+            if output is None:
+                with self.lock:
+                    self._sync()
+                    name = f"{self.manifest['next']:06d}-{day}"
+                    self.manifest["next"] += 1  # Reserve the number
+                    self._write_manifest()
+                file_name = name + ".ndjson" + SUFFIXES[self.compression]
+                output = [name, open_segment(self._path(file_name), self.compression, "wb"), new_index(), day]
+            event = {"op": op, "id": session_id, "data": record, "writes": writes}
+            line = (json.dumps(event) + "\n").encode()
+            index_event(output[2], output[2]["size"], event)
+            output[1].write(line)
+            output[2]["size"] += len(line)
+
+        def finish():
+            nonlocal output
+            output[1].close()
+            outputs.append(output)
+            output = None
+
+        for position, entry in enumerate(inputs):
+            with open_segment(self._path(entry["file"]), entry["compression"]) as f:
+                for offset, line in read_lines(f):
+                    event = json.loads(line)
+                    session_id = event["id"]
+                    if session_id in pending and event["op"] == "update":
+                        pending[session_id][1].update(event["data"])
+                        pending[session_id][2] += event.get("writes", 1)
+                    else:  # A create, or an update whose create is gone, kept as one
+                        pending[session_id] = [event["op"], dict(event["data"]), event.get("writes", 1),
+                                               entry["day"]]
+                    if last[session_id] == (position, offset):
+                        complete.add(session_id)
+                    while pending:
+                        head = next(iter(pending))
+                        if head not in complete:
+                            break
+                        complete.discard(head)
+                        write(head, *pending.pop(head))
+        for session_id, folded in pending.items():  # Not reached if every index is right
+            write(session_id, *folded)
+        if output is not None:
+            finish()
+
+        with self.lock:
+            self._sync()
+            names = {entry["name"] for entry in inputs}
+            removed = [entry for entry in self.manifest["segments"] if entry["name"] in names]
+            kept = [entry for entry in self.manifest["segments"] if entry["name"] not in names]
+            self.manifest["segments"] = []
+            for name, _, index, _ in outputs:
+                self._add_segment(name, name + ".ndjson" + SUFFIXES[self.compression], self.compression,
+                                  index, rotated=False)
+            self.manifest["segments"] += kept
+            self._remove_retired()
+            # Current file names, and those seen at the start
+            self._retire(dict.fromkeys(file_name for entry in removed + inputs
+                                       for file_name in (entry["file"], entry["name"] + ".idx")
+                                       if os.path.exists(self._path(file_name))))
+            self._write_manifest()
+        return len(inputs), len(outputs)
+
+    def _locate(self, session_id):
+        """Return ``[(segment entry or None for the active one, [[offset, writes], ...])]``, oldest first.
+
+        Segments are searched from the newest, down to the one that created the session.
+        """
+        with self.lock:
+            self._sync()
+            found = []
+            if session_id in self.active["events"]:
+                found.append((None, self.active["events"][session_id]))
+                if session_id in self.active["created"]:
+                    return found
+            for entry in reversed(self.manifest["segments"]):
+                index = self._segment_index(entry)
+                if session_id in index["events"]:
+                    found.append((entry, index["events"][session_id]))
+                    if session_id in index["created"]:
+                        break
+        if not found:
+            raise KeyError(session_id)
+        return found[::-1]
+
+    # StorageBackend
+
+    def _append(self, events):
+        with self.lock:
+            self._sync()
+            self._rotate_if_due()
+            offset = self._truncate_torn_tail()
+            lines = []
+            for event in events:
+                line = (json.dumps(event) + "\n").encode()
+                lines.append(line)
+                index_event(self.active, offset, event)
+                offset += len(line)
+            with open(self.active_path, "ab") as f:
+                f.write(b"".join(lines))
+                f.flush()
+                os.fsync(f.fileno())
+            self.active["size"] = offset
+
+    def create_session(self, record, session_id=None):
+        import uuid
+
+        session_id = session_id or uuid.uuid4().hex
+        self._append([{"op": "create", "id": session_id, "data": record}])
+        return session_id
+
+    def create_sessions(self, records):
+        import uuid
+
+        self.write_batch([("create", uuid.uuid4().hex, record) for record in records])
+
+    def update_session(self, session_id, data, expected_version=None):
+        event = {"op": "update", "id": session_id, "data": data}
+        if expected_version is None:
+            self._append([event])
+            return
+        with self.lock:  # Held from the version check to the append
+            version = self.session_version(session_id)
+            if version != expected_version:
+                raise ConflictError(session_id, expected_version, version)
+            self._append([event])
+
+    def session_version(self, session_id):
+        return sum(writes for _, events in self._locate(session_id) for _, writes in events)
+
+    def write_batch(self, operations):
+        events = [{"op": op, "id": session_id, "data": data} for op, session_id, data in operations]
+        if events:
+            self._append(events)
+
+    def get_session(self, session_id):
+        record = {}
+        for entry, events in self._locate(session_id):
+            if entry is None:
+                path, compression = self.active_path, None
+            else:
+                path, compression = self._path(entry["file"]), entry["compression"]
+            with open_segment(path, compression) as f:
+                for offset, _ in events:
+                    f.seek(offset)  # Compressed segments are decompressed up to here
+                    record.update(json.loads(f.readline())["data"])
+        return record
+
+    def last_session_id(self):
+        with self.lock:
+            self._sync()
+            if self.active["created"]:
+                return next(reversed(self.active["created"]))
+            for entry in reversed(self.manifest["segments"]):
+                if entry["last"] is not None:
+                    return entry["last"]
+        return None
+
+    def count(self):
+        with self.lock:
+            self._sync()
+            return sum(entry["sessions"] for entry in self.manifest["segments"]) + len(self.active["created"])
+
+    def field_names(self):
+        with self.lock:
+            self._sync()
+            fields = {}
+            for entry in self.manifest["segments"]:
+                fields.update(dict.fromkeys(entry["fields"]))
+            fields.update(self.active["fields"])
+        return list(fields)
+
+    def change_token(self):
+        """Rotations so far and the active segment's size, e.g. ``"12:40960"``."""
+        with self.lock:
+            self._sync()
+            return f"{self.manifest['rotations']}:{self.active['size']}"
+
+    def changes_since(self, token):
+        """Read only what was appended after ``token``, unless compaction has folded it away."""
+        try:
+            rotations, size = (int(part) for part in token.split(":"))
+        except (AttributeError, ValueError):
+            return None
+        with self.lock:
+            self._sync()
+            if (rotations, size) > (self.manifest["rotations"], self.active["size"]):
+                return None
+            segments = {entry["rotation"]: entry for entry in self.manifest["segments"]
+                        if entry["rotation"] is not None and entry["rotation"] > rotations}
+            if len(segments) != self.manifest["rotations"] - rotations:
+                return None  # Compacted since
+            sources = [(self._path(entry["file"]), entry["compression"]) for _, entry in sorted(segments.items())]
+            sources.append((self.active_path, None))
+            active_size = self.active["size"]
+        changed = {}
+        for number, (path, compression) in enumerate(sources):
+            with open_segment(path, compression) as f:
+                for offset, line in read_lines(f, size if number == 0 else 0):
+                    if path == self.active_path and offset >= active_size:
+                        break
+                    changed.setdefault(json.loads(line)["id"])
+        return list(changed)
+
+    def iter_sessions(self, device_sn=None, operator=None, date=None):
+        """Fold the segments into ``(session_id, record)`` pairs, in creation order.
+
+        As in ``RecordLog.iter_sessions``, a session is yielded as soon as
+        the scan passes its last event, so only sessions still receiving
+        updates further on are held in memory. Sealed indexes are read one
+        segment at a time and not kept; only where the sessions updated in a
+        later segment than their own were last updated is held throughout.
+        """
+        with self.lock:
+            self._sync()
+            entries = [dict(entry) for entry in self.manifest["segments"]]
+            active_size = self.active["size"]
+            active = {"events": {session_id: list(events) for session_id, events in self.active["events"].items()},
+                      "created": dict(self.active["created"])}
+        sources = [(self._path(entry["file"]), entry["compression"]) for entry in entries]
+        sources.append((self.active_path, None))
+
+        def index_at(position):
+            return active if position == len(entries) else self._read_index(entries[position])
+
+        carried = {}  # Session id -> (position, offset) of its last event, for sessions updated after their segment
+        for position in range(len(sources)):
+            index = index_at(position)
+            for session_id, events in index["events"].items():
+                if session_id not in index["created"]:
+                    carried[session_id] = (position, events[-1][0])
+        pending, complete = {}, set()
+        for position, (path, compression) in enumerate(sources):
+            events_by_session = index_at(position)["events"]
+            if not events_by_session:
+                continue
+            with open_segment(path, compression) as f:
+                for offset, line in read_lines(f):
+                    if path == self.active_path and offset >= active_size:
+                        break  # Appended since; left for the next read
+                    event = json.loads(line)
+                    session_id = event["id"]
+                    if event["op"] == "create":
+                        pending[session_id] = dict(event["data"])
+                    elif session_id in pending:
+                        pending[session_id].update(event["data"])
+                    else:
+                        continue  # Update for an unknown or already emitted session
+                    last = carried.get(session_id)
+                    if last is None or last[0] < position:
+                        events = events_by_session.get(session_id)
+                        last = (position, events[-1][0] if events else offset)
+                    if last <= (position, offset):
+                        complete.add(session_id)
+                    while pending:
+                        head = next(iter(pending))
+                        if head not in complete:
+                            break
+                        complete.discard(head)
+                        record = pending.pop(head)
+                        if matches(record, device_sn, operator, date):
+                            yield head, record
+        for session_id, record in pending.items():
+            if matches(record, device_sn, operator, date):
+                yield session_id, record
+
+    def stats(self):
+        """Sealed segments (name, sessions, bytes before and on disk) and the active segment's size."""
+        with self.lock:
+            self._sync()
+            segments = [(entry["name"], entry["sessions"], entry["size"],
+                         os.path.getsize(self._path(entry["file"]))) for entry in self.manifest["segments"]]
+            return segments, self.active["size"]
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "stats"
+    store = SegmentStore()
+    if command == "seal":
+        print(f"Compressed {store.seal()} segments")
+    elif command == "compact":
+        before, after = store.compact()
+        print(f"Compacted {before} segments into {after}")
+    elif command == "stats":
+        segments, active_size = store.stats()
+        for name, sessions, size, disk_size in segments:
+            print(f"{name}  {sessions:8d} sessions  {size:12d} bytes  {disk_size:12d} on disk")
+        print(f"active  {active_size:12d} bytes")
+    else:
+        sys.exit(f"Unknown command: {command}")
@@ -0,0 +1,268 @@
+"""Typed session records.
+
+Sessions are stored the way the screens have always written them: free-form
+dicts with the heights as typed ("12"), the Setup #4 flags ``False`` until
+they become "Yes", and ``QDate.toString()`` dates ("Sat Jan 1 2000") that
+neither sort nor range-filter. ``SessionRecord`` holds one session in typed
+slots instead: heights and dial readings as floats, markers and flags as
+booleans (a marker is None until its setup is done), the date as a day
+number (days since 1970-01-01, so it sorts and subtracts) and the outcome as
+an ``Outcome``. Setup #4's zero reading and settled deflection are stored in
+place of its steps' "Yes" when the dial was read, so one stored key gives
+both a flag slot and a reading slot.
+
+``SessionRecord.from_dict`` normalizes a stored record from any build of the
+app, or from a legacy ``user_details.json``, and can note every value it
+had to guess at; ``to_dict`` gives the stored form back. ``to_row`` and
+``from_row`` encode a record as a flat list, about a fifth of the size of
+the stored dict and quicker to parse.
+"""
+import datetime
+import enum
+
+from workflow import MONTH_NAMES, format_date
+
+SCHEMA_VERSION = 3  # Of the stored records; see migrate.py
+EPOCH = datetime.date(1970, 1, 1).toordinal()
+KEYS = {  # Slot -> key of the stored record
+    "device_sn": "device_sn",
+    "operator": "operator",
+    "day": "date",
+    "setup2_reached": "Setup2 - Unit Reach Marker",
+    "setup2_height": "Setup2 - Measured Max Height",
+    "setup3_reached": "Setup3 - Unit Reach Marker",
+    "setup3_height": "Setup3 - Measured Max Height",
+    "setup4_zeroed": "Setup4 - Click to Zero Vertical Position Dial",
+    "setup4_recorded": "Setup4 - Click to record vertical deflection",
+    "setup4_zero": "Setup4 - Click to Zero Vertical Position Dial",
+    "setup4_deflection": "Setup4 - Click to record vertical deflection",
+    "setup4_peak": "Setup4 - Peak Vertical Deflection",
+}
+EMPTY = (None, "", "---")  # What an unanswered field has been saved as
+
+
+class Outcome(enum.Enum):
+    """How a session went, summed up over its setups."""
+
+    PASSED = "passed"
+    MARKER_MISSED = "marker missed"
+    INCOMPLETE = "incomplete"
+
+
+def to_day(date):
+    """Day number of a ``datetime.date``."""
+    return date.toordinal() - EPOCH
+
+
+def from_day(day):
+    """``datetime.date`` of a day number."""
+    return datetime.date.fromordinal(day + EPOCH)
+
+
+def parse_day(value):
+    """Day number of a stored date: ``QDate.toString()`` text, ISO text, a date or a day number.
+
+    Raises ``ValueError`` for anything else.
+    """
+    if isinstance(value, datetime.date):
+        return to_day(value)
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if isinstance(value, str):
+        parts = value.split()
+        if len(parts) == 4 and parts[1] in MONTH_NAMES:  # "Sat Jan 1 2000"
+            return to_day(datetime.date(int(parts[3]), MONTH_NAMES.index(parts[1]) + 1, int(parts[2])))
+        if len(parts) == 1:
+            return to_day(datetime.date.fromisoformat(value[:10]))  # "2000-01-01", maybe with a time
+    raise ValueError(f"not a date: {value!r}")
+
+
+def parse_marker(value):
+    """True for a reached marker, False for a missed one, None if not answered yet."""
+    if value in EMPTY:
+        return None
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, str) and value.strip().lower() in ("yes", "no"):
+        return value.strip().lower() == "yes"
+    raise ValueError(f"not Yes or No: {value!r}")
+
+
+def parse_height(value):
+    """A measured height as a float, None if not measured.
+
+    Takes the number as typed, with a decimal comma or a trailing "mm".
+    """
+    if value in EMPTY:
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        text = value.strip().lower().removesuffix("mm").strip().replace(",", ".")
+        try:
+            return float(text)
+        except ValueError:
+            pass
+    raise ValueError(f"not a height: {value!r}")
+
+
+def parse_flag(value):
+    """Whether a Setup #4 step was confirmed ("Yes" or a dial reading; ``False`` until then)."""
+    if value in EMPTY or value is False:
+        return False
+    if value is True or parse_reading(value) is not None:
+        return True
+    if isinstance(value, str) and value.strip().lower() in ("yes", "no"):
+        return value.strip().lower() == "yes"
+    raise ValueError(f"not Yes: {value!r}")
+
+
+def parse_reading(value):
+    """The dial reading saved for a Setup #4 step, None if it was confirmed without one.
+
+    Never raises: anything that is not a number is for ``parse_flag`` to judge.
+    """
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            pass
+    return None
+
+
+def format_height(height):
+    """A height as the screens save it: the number typed, without a needless ".0"."""
+    return None if height is None else f"{height:g}"
+
+
+MARKERS = {None: None, "Yes": True, "No": False}  # As the screens save them
+FLAGS = {"Yes": True}  # Not False: 0.0, a dial reading, would look it up as False
+DAYS = {}  # Stored date -> day number; a history has few distinct dates
+PARSERS = (  # Slot, parser, values parsed already
+    ("day", parse_day, DAYS),
+    ("setup2_reached", parse_marker, MARKERS),
+    ("setup2_height", parse_height, {None: None}),
+    ("setup3_reached", parse_marker, MARKERS),
+    ("setup3_height", parse_height, {None: None}),
+    ("setup4_zeroed", parse_flag, FLAGS),
+    ("setup4_recorded", parse_flag, FLAGS),
+    ("setup4_zero", parse_reading, {"Yes": None}),
+    ("setup4_deflection", parse_reading, {"Yes": None}),
+    ("setup4_peak", parse_height, {None: None}),
+)
+DEFAULTS = {"setup4_zeroed": False, "setup4_recorded": False}
+
+
+class SessionRecord:
+    """One session's results in typed slots."""
+
+    __slots__ = tuple(KEYS)
+
+    def __init__(self, device_sn="", operator="", day=None, setup2_reached=None, setup2_height=None,
+                 setup3_reached=None, setup3_height=None, setup4_zeroed=False, setup4_recorded=False,
+                 setup4_zero=None, setup4_deflection=None, setup4_peak=None):
+        self.device_sn = device_sn
+        self.operator = operator
+        self.day = day  # Days since 1970-01-01, or None if the record had no usable date
+        self.setup2_reached = setup2_reached
+        self.setup2_height = setup2_height
+        self.setup3_reached = setup3_reached
+        self.setup3_height = setup3_height
+        self.setup4_zeroed = setup4_zeroed
+        self.setup4_recorded = setup4_recorded
+        self.setup4_zero = setup4_zero  # Dial readings in mm, None unless the dial was read
+        self.setup4_deflection = setup4_deflection  # Settled, from the zero
+        self.setup4_peak = setup4_peak
+
+    @classmethod
+    def from_dict(cls, record, anomalies=None):
+        """Normalize a stored record.
+
+        A value that cannot be read is left unset (None, or False for a
+        Setup #4 flag); with an ``anomalies`` list, ``(key, value, reason)``
+        is added to it for each.
+        """
+        self = cls.__new__(cls)
+        self.device_sn = str(record.get("device_sn") or "")
+        self.operator = str(record.get("operator") or "")
+        for slot, parse, parsed in PARSERS:
+            value = record.get(KEYS[slot])
+            try:
+                setattr(self, slot, parsed[value])
+                continue
+            except (KeyError, TypeError):  # Not seen yet, or not hashable
+                pass
+            try:
+                setattr(self, slot, parse(value))
+            except ValueError as e:
+                setattr(self, slot, DEFAULTS.get(slot))
+                if anomalies is not None:
+                    anomalies.append((KEYS[slot], value, str(e)))
+            else:
+                if parsed is DAYS and isinstance(value, str) and len(DAYS) < 100_000:
+                    DAYS[value] = self.day
+        return self
+
+    def to_dict(self):
+        """The record as the screens store it."""
+        return {
+            "device_sn": self.device_sn,
+            "operator": self.operator,
+            "date": None if self.day is None else format_date(from_day(self.day)),
+            KEYS["setup2_reached"]: self._marker(self.setup2_reached),
+            KEYS["setup2_height"]: format_height(self.setup2_height),
+            KEYS["setup3_reached"]: self._marker(self.setup3_reached),
+            KEYS["setup3_height"]: format_height(self.setup3_height),
+            KEYS["setup4_zeroed"]: self._step(self.setup4_zeroed, self.setup4_zero),
+            KEYS["setup4_recorded"]: self._step(self.setup4_recorded, self.setup4_deflection),
+            KEYS["setup4_peak"]: self.setup4_peak,
+        }
+
+    @staticmethod
+    def _marker(reached):
+        return None if reached is None else "Yes" if reached else "No"
+
+    @staticmethod
+    def _step(confirmed, reading):
+        return reading if reading is not None else "Yes" if confirmed else False
+
+    def to_row(self):
+        """The slots as a flat list, in ``__slots__`` order."""
+        return [getattr(self, slot) for slot in self.__slots__]
+
+    @classmethod
+    def from_row(cls, row):
+        self = cls.__new__(cls)
+        (self.device_sn, self.operator, self.day, self.setup2_reached, self.setup2_height,
+         self.setup3_reached, self.setup3_height, self.setup4_zeroed, self.setup4_recorded,
+         self.setup4_zero, self.setup4_deflection, self.setup4_peak) = row
+        return self
+
+    @property
+    def date(self):
+        return None if self.day is None else from_day(self.day)
+
+    @property
+    def outcome(self):
+        """A missed reach marker counts even if other setups are still to be done."""
+        markers = (self.setup2_reached, self.setup3_reached)
+        if False in markers:
+            return Outcome.MARKER_MISSED
+        if None in markers or not (self.setup4_zeroed and self.setup4_recorded):
+            return Outcome.INCOMPLETE
+        return Outcome.PASSED
+
+    def __eq__(self, other):
+        return isinstance(other, SessionRecord) and self.to_row() == other.to_row()
+
+    def __repr__(self):
+        slots = ", ".join(f"{slot}={getattr(self, slot)!r}" for slot in self.__slots__)
+        return f"SessionRecord({slots})"
+
+
+def typed_records(records, anomalies=None):
+    """Yield a ``SessionRecord`` for each stored record in ``records``."""
+    for record in records:
+        yield SessionRecord.from_dict(record, anomalies)
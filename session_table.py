@@ -0,0 +1,186 @@
+"""Indexed table of sessions for browsing the history.
+
+``SessionTable`` keeps one row per session in ``user_details.browse.db``
+(SQLite): creation order, the record, and indexed copies of the columns the
+history can be sorted and filtered by - device serial, operator, date (as
+YYYY-MM-DD, so it sorts by time) and outcome, as ``SessionRecord`` reads
+them. It works the same whichever backend holds the sessions.
+
+``sync`` brings the table up to date from the store, reading only the
+sessions changed since the store's change token it last saw (every session
+the first time, or when the backend cannot tell). ``page`` returns rows in
+the requested order after a given row (keyset paging), so every page costs
+one index seek however deep into the history it is. When a filter's index
+does not give rows in the requested order, the filter decides the plan: one
+matching a few rows is answered from its index and sorted, one matching many
+(a serial prefix of "S") by walking the sort order until a page is found.
+"""
+import json
+import sqlite3
+
+from session_record import SessionRecord
+from storage import changes_to_sync
+
+TABLE_PATH = "user_details.browse.db"
+PAGE_ROWS = 200  # Rows per page
+SORT_ROWS = 50000  # Filters matching more rows than this are answered by walking the sort order
+SORT_COLUMNS = ("seq", "device_sn", "operator", "date", "outcome")
+LAST_TEXT = "\U0010ffff"  # Sorts after any text, for prefix ranges
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    seq INTEGER PRIMARY KEY,
+    session_id TEXT NOT NULL UNIQUE,
+    device_sn TEXT NOT NULL,
+    operator TEXT NOT NULL,
+    date TEXT NOT NULL,
+    outcome TEXT NOT NULL,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_device_sn ON sessions(device_sn, seq);
+CREATE INDEX IF NOT EXISTS sessions_operator ON sessions(operator, seq);
+CREATE INDEX IF NOT EXISTS sessions_date ON sessions(date, seq);
+CREATE INDEX IF NOT EXISTS sessions_outcome ON sessions(outcome, seq);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+UPSERT_SQL = ("INSERT INTO sessions (seq, session_id, device_sn, operator, date, outcome, record) "
+              "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(session_id) DO UPDATE SET "
+              "device_sn = excluded.device_sn, operator = excluded.operator, date = excluded.date, "
+              "outcome = excluded.outcome, record = excluded.record")
+NEXT_SEQ_SQL = "SELECT coalesce(max(seq), 0) + 1 FROM sessions"
+GET_META_SQL = "SELECT value FROM meta WHERE key = ?"
+SET_META_SQL = "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)"
+
+
+def row(seq, session_id, record):
+    """The table row for a session record."""
+    typed = SessionRecord.from_dict(record)
+    return (seq, session_id, typed.device_sn, typed.operator, typed.date.isoformat() if typed.date else "",
+            typed.outcome.value, json.dumps(record))
+
+
+class SessionTable:
+    def __init__(self, path=TABLE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30.0)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def _meta(self, key):
+        found = self.conn.execute(GET_META_SQL, (key,)).fetchone()
+        return json.loads(found[0]) if found else None
+
+    def sync(self, store):
+        """Catch up with ``store``; return how many sessions were (re)read."""
+        source, token, changed = changes_to_sync(store, self._meta("source"), self._meta("token"))
+        if changed == []:
+            return 0
+        with self.conn:
+            if changed is None:
+                self.conn.execute("DELETE FROM sessions")
+                self.conn.executemany(UPSERT_SQL, (
+                    row(seq, session_id, record)
+                    for seq, (session_id, record) in enumerate(store.iter_sessions(), 1)))
+                count = self.conn.execute("SELECT count(*) FROM sessions").fetchone()[0]
+                self.conn.execute("ANALYZE")  # Lets SQLite pick the filter that matches fewest rows
+            else:
+                seq = self.conn.execute(NEXT_SEQ_SQL).fetchone()[0]
+                for session_id in changed:  # Creation order, so new sessions keep it
+                    try:
+                        record = store.get_session(session_id)
+                    except KeyError:
+                        continue
+                    # An existing row keeps its seq; only new sessions use this one
+                    self.conn.execute(UPSERT_SQL, row(seq, session_id, record))
+                    seq += 1
+                count = len(changed)
+            self.conn.execute(SET_META_SQL, ("source", json.dumps(source)))
+            self.conn.execute(SET_META_SQL, ("token", json.dumps(token)))
+        return count
+
+    @staticmethod
+    def _where(filters, indexed=True):
+        """SQL conditions for ``filters``: device_sn is a prefix, the others exact values.
+
+        With ``indexed`` False the conditions cannot use the filters' indexes.
+        """
+        clauses, params = [], []
+        prefix = "" if indexed else "+"
+        for column, value in filters.items():
+            if not value:
+                continue
+            if column == "device_sn":
+                clauses.append(f"{prefix}device_sn >= ? AND {prefix}device_sn < ?")
+                params += [value, value + LAST_TEXT]
+            elif column in ("operator", "date", "outcome"):
+                clauses.append(f"{prefix}{column} = ?")
+                params.append(value)
+            else:
+                raise ValueError(f"Cannot filter by {column}")
+        return clauses, params
+
+    def _plan(self, filters, sort):
+        """How ``page`` finds rows in ``sort`` order under ``filters``.
+
+        "ordered" when an index gives the matching rows in that order,
+        otherwise "sort" (sort the matches from the filters' indexes) for
+        filters matching fewer than ``SORT_ROWS`` rows, or "walk" (step
+        through ``sort`` order until a page of matches is found).
+        """
+        active = [column for column, value in filters.items() if value]
+        if all(column != "device_sn" and sort in ("seq", column) for column in active) \
+                or active == ["device_sn"] and sort == "device_sn":
+            return "ordered"  # No filters, or the (column, seq) index of the only one in use
+        clauses, params = self._where(filters)
+        sql = f"SELECT count(*) FROM (SELECT 1 FROM sessions WHERE {' AND '.join(clauses)} LIMIT ?)"
+        return "sort" if self.conn.execute(sql, params + [SORT_ROWS]).fetchone()[0] < SORT_ROWS else "walk"
+
+    def page(self, filters=None, sort="seq", descending=False, after=None, limit=PAGE_ROWS):
+        """Return up to ``limit`` rows in ``sort`` order after the row ``after``.
+
+        Rows are ``(key, session_id, record)``, where ``key`` is what to pass
+        as ``after`` to continue from that row.
+        """
+        if sort not in SORT_COLUMNS:
+            raise ValueError(f"Cannot sort by {sort}")
+        filters = filters or {}
+        plan = self._plan(filters, sort)
+        clauses, params = self._where(filters, indexed=plan != "walk")
+        # A unary + keeps SQLite from using an index on the column for it
+        unindexed = "+" if plan == "sort" else ""
+        direction, compare = ("DESC", "<") if descending else ("ASC", ">")
+        if sort == "seq":
+            order, key = f"{unindexed}seq {direction}", "seq"
+            if after is not None:
+                clauses.append(f"{unindexed}seq {compare} ?")
+                params.append(after[0])
+        else:
+            order, key = f"{unindexed}{sort} {direction}, seq {direction}", f"{sort}, seq"
+            if after is not None:
+                clauses.append(f"({unindexed}{sort}, seq) {compare} (?, ?)")
+                params += list(after)
+        # Order the keys alone, then read the records of just the page
+        sql = f"SELECT {key} FROM sessions"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        keys = self.conn.execute(f"{sql} ORDER BY {order} LIMIT ?", params + [limit]).fetchall()
+        records = {seq: (session_id, record) for seq, session_id, record in self.conn.execute(
+            f"SELECT seq, session_id, record FROM sessions WHERE seq IN ({', '.join('?' * len(keys))})",
+            [found[-1] for found in keys])}
+        return [(tuple(found), records[found[-1]][0], json.loads(records[found[-1]][1])) for found in keys]
+
+    def count(self, filters=None):
+        """Number of sessions matching ``filters``."""
+        clauses, params = self._where(filters or {})
+        sql = "SELECT count(*) FROM sessions"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return self.conn.execute(sql, params).fetchone()[0]
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,444 @@
+"""Statistical process control over the session results.
+
+``Columns`` holds the results column-wise, one NumPy array per measurement
+(heights and dial readings as floats, NaN where not measured) with the
+operator (as a code into ``operators``), the day and the reach markers
+alongside. It is cached in ``user_details.spc.npz`` with the store's change
+token and caught up from only the sessions changed since, as
+``SessionTable.sync`` does, so loading it does not re-read the history.
+
+From the columns, in vectorized form:
+
+* ``group_stats`` - count, mean and sum of squared deviations per operator
+  or per day (``np.bincount`` over group codes)
+* ``xbar_r`` - X-bar and R chart points and control limits over subgroups of
+  ``SUBGROUP_SIZE`` consecutive readings
+* ``cpk`` - process capability against ``LIMITS``
+
+``SpcStats`` keeps the same statistics as running aggregates (Welford's
+mean and variance) per operator and per day. It is built from the columns
+once, then ``add_session`` and ``add_results`` update it in O(1) as
+sessions and setup results are saved, so the SPC page reads it as is. A
+setup submitted again replaces the results it counted before (the values
+last counted for each session are kept, as ``Aggregates`` keeps its facts),
+so the statistics match what a restart computes.
+
+    python spc.py [slot]
+"""
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+from session_record import KEYS, SessionRecord, parse_day
+from storage import changes_to_sync
+
+COLUMNS_PATH = "user_details.spc.npz"
+METRICS = {  # Slot -> label of the measurements charted
+    "setup2_height": "Setup #2 measured max height",
+    "setup3_height": "Setup #3 measured max height",
+    "setup4_deflection": "Setup #4 settled deflection",
+    "setup4_peak": "Setup #4 peak deflection",
+}
+MARKERS = ("setup2_reached", "setup3_reached")  # Passed when reached
+# Specification limits in mm, (lower, upper), None where there is none; the
+# heights are only measured when a marker is missed and have no specification
+LIMITS = {
+    "setup2_height": (None, None),
+    "setup3_height": (None, None),
+    "setup4_deflection": (None, 1.0),
+    "setup4_peak": (None, 1.5),
+}
+SUBGROUP_SIZE = 5  # Consecutive readings per X-bar/R subgroup
+CONTROL_CONSTANTS = {  # Subgroup size -> (A2, D3, D4)
+    2: (1.880, 0.0, 3.267),
+    3: (1.023, 0.0, 2.574),
+    4: (0.729, 0.0, 2.282),
+    5: (0.577, 0.0, 2.114),
+    6: (0.483, 0.0, 2.004),
+    7: (0.419, 0.076, 1.924),
+    8: (0.373, 0.136, 1.864),
+    9: (0.337, 0.184, 1.816),
+    10: (0.308, 0.223, 1.777),
+}
+NO_DAY = np.iinfo(np.int32).min  # Day column value of a session without a usable date
+UNANSWERED = -1  # Marker column value of a setup not done yet
+
+
+def row_values(record):
+    """A stored record's operator, day, markers and measurements, in ``Columns`` order."""
+    typed = SessionRecord.from_dict(record)
+    markers = [UNANSWERED if getattr(typed, slot) is None else int(getattr(typed, slot)) for slot in MARKERS]
+    metrics = [math.nan if getattr(typed, slot) is None else getattr(typed, slot) for slot in METRICS]
+    return [typed.operator, NO_DAY if typed.day is None else typed.day, *markers, *metrics]
+
+
+class Columns:
+    """Session results column by column, one row per session in creation order.
+
+    Rows are found by session id through ``order``, the rows in id order,
+    binary-searched in place, so catching up with a few changed sessions
+    costs the same however many there are.
+    """
+
+    def __init__(self, path=COLUMNS_PATH):
+        self.path = path
+        self.session_ids = np.empty(0, "S1")  # UTF-8
+        self.order = np.empty(0, np.int64)
+        self.operators = []  # Operator of each code in the operator column
+        self.arrays = {"operator": np.empty(0, np.int32), "day": np.empty(0, np.int32),
+                       **{slot: np.empty(0, np.int8) for slot in MARKERS},
+                       **{slot: np.empty(0, np.float64) for slot in METRICS}}
+        self.source = None  # Store class and change token the columns are up to date with
+        self.token = None
+        self.codes = None  # Operator -> code, built when first needed
+
+    def __len__(self):
+        return len(self.session_ids)
+
+    def __getitem__(self, column):
+        return self.arrays[column]
+
+    @classmethod
+    def load(cls, path=COLUMNS_PATH):
+        """The cached columns, or empty ones if there is no usable cache."""
+        self = cls(path)
+        try:
+            with np.load(path, allow_pickle=False) as saved:
+                meta = json.loads(str(saved["meta"]))
+                arrays = {column: saved[column] for column in self.arrays}
+                session_ids, order, operators = saved["session_ids"], saved["order"], saved["operators"].tolist()
+        except (OSError, KeyError, ValueError):
+            return self  # Missing, from an older build or cut short: read the store again
+        self.arrays, self.session_ids, self.order, self.operators = arrays, session_ids, order, operators
+        self.source, self.token = meta["source"], meta["token"]
+        return self
+
+    def save(self):
+        tmp_path = self.path + ".tmp.npz"  # np.savez adds .npz to a name without it
+        np.savez(tmp_path, session_ids=self.session_ids, order=self.order, operators=np.array(self.operators, str),
+                 meta=np.array(json.dumps({"source": self.source, "token": self.token})), **self.arrays)
+        os.replace(tmp_path, self.path)
+
+    def sync(self, store):
+        """Catch up with ``store``; return how many sessions were (re)read."""
+        source, token, changed = changes_to_sync(store, self.source, self.token)
+        if changed == []:
+            return 0
+        if changed is None:
+            session_ids, rows = [], []
+            for session_id, record in store.iter_sessions():
+                session_ids.append(session_id)
+                rows.append(row_values(record))
+            empty = Columns(self.path)
+            self.session_ids, self.order, self.operators, self.codes = empty.session_ids, empty.order, [], None
+            self.arrays = empty.arrays
+            self._append(session_ids, rows)
+            count = len(session_ids)
+        else:
+            found = []
+            for session_id in changed:
+                try:
+                    found.append((session_id, store.get_session(session_id)))
+                except KeyError:
+                    continue
+            session_ids, rows = [], []
+            for (session_id, record), row in zip(found, self.rows([session_id for session_id, _ in found])):
+                if row < 0:
+                    session_ids.append(session_id)
+                    rows.append(row_values(record))
+                else:  # A setup's results were saved to an existing session
+                    self._set(row, row_values(record))
+            self._append(session_ids, rows)
+            count = len(changed)
+        self.source, self.token = source, token
+        return count
+
+    def rows(self, session_ids):
+        """Row of each session, -1 for one that is not in the columns."""
+        keys = encode_ids(session_ids)
+        if not len(self.order):
+            return np.full(len(keys), -1)
+        at = np.searchsorted(self.session_ids, keys, sorter=self.order)
+        rows = self.order[np.minimum(at, len(self.order) - 1)]
+        return np.where(self.session_ids[rows] == keys, rows, -1)
+
+    def holds(self, session_id):
+        """Whether the session is in the columns."""
+        return int(self.rows([session_id])[0]) >= 0
+
+    def results(self, session_id):
+        """The session's markers and measurements by slot (None where not answered); empty if not in the columns."""
+        row = int(self.rows([session_id])[0])
+        if row < 0:
+            return {}
+        found = {slot: None if self.arrays[slot][row] == UNANSWERED else bool(self.arrays[slot][row])
+                 for slot in MARKERS}
+        found.update((slot, None if np.isnan(self.arrays[slot][row]) else float(self.arrays[slot][row]))
+                     for slot in METRICS)
+        return found
+
+    def _code(self, operator):
+        if self.codes is None:
+            self.codes = {name: code for code, name in enumerate(self.operators)}
+        if operator not in self.codes:
+            self.codes[operator] = len(self.operators)
+            self.operators.append(operator)
+        return self.codes[operator]
+
+    def _set(self, row, values):
+        values[0] = self._code(values[0])
+        for array, value in zip(self.arrays.values(), values):
+            array[row] = value
+
+    def _append(self, session_ids, rows):
+        if not session_ids:
+            return
+        for values in rows:
+            values[0] = self._code(values[0])
+        new = list(zip(*rows))
+        self.arrays = {column: np.concatenate([array, np.array(values, array.dtype)])
+                       for (column, array), values in zip(self.arrays.items(), new)}
+        keys = encode_ids(session_ids)
+        new_order = np.argsort(keys, kind="stable")
+        positions = np.searchsorted(self.session_ids, keys[new_order], sorter=self.order)
+        self.order = np.insert(self.order, positions, new_order + len(self.session_ids))
+        self.session_ids = np.concatenate([self.session_ids, keys])
+
+
+def encode_ids(session_ids):
+    """Session ids as a NumPy array of UTF-8 bytes."""
+    return np.array([session_id.encode() for session_id in session_ids], "S")
+
+
+def load_columns(store, path=COLUMNS_PATH):
+    """The columns of every session in ``store``, from the cache and the sessions changed since."""
+    columns = Columns.load(path)
+    if columns.sync(store):
+        columns.save()
+    return columns
+
+
+def group_stats(codes, values, groups):
+    """Count, mean and sum of squared deviations of ``values`` per group code; NaNs are left out."""
+    kept = ~np.isnan(values)
+    codes, values = codes[kept], values[kept]
+    count = np.bincount(codes, minlength=groups)
+    mean = np.bincount(codes, values, groups) / np.maximum(count, 1)
+    m2 = np.bincount(codes, (values - mean[codes]) ** 2, groups)
+    return count, mean, m2
+
+
+def cpk(mean, std, limits):
+    """Process capability: distance from the mean to the nearer limit, in units of 3 standard deviations.
+
+    Takes arrays as well as numbers; NaN where there is no limit or no spread.
+    """
+    lower, upper = limits
+    sides = []
+    with np.errstate(divide="ignore", invalid="ignore"):
+        if upper is not None:
+            sides.append((upper - np.asarray(mean, np.float64)) / (3 * np.asarray(std, np.float64)))
+        if lower is not None:
+            sides.append((np.asarray(mean, np.float64) - lower) / (3 * np.asarray(std, np.float64)))
+    if not sides:
+        return np.full(np.shape(mean), np.nan)
+    return np.where(np.asarray(std) > 0, np.minimum.reduce(sides), np.nan)
+
+
+class XbarR:
+    """X-bar and R chart points of consecutive subgroups, with their centre lines and control limits."""
+
+    def __init__(self, means, ranges, size):
+        a2, d3, d4 = CONTROL_CONSTANTS[size]
+        self.means = means
+        self.ranges = ranges
+        self.size = size
+        self.center = float(means.mean())
+        self.range_center = float(ranges.mean())
+        self.lower = self.center - a2 * self.range_center
+        self.upper = self.center + a2 * self.range_center
+        self.range_lower = d3 * self.range_center
+        self.range_upper = d4 * self.range_center
+
+    def out_of_control(self):
+        """Mask of the subgroups whose mean or range is outside its limits."""
+        return ((self.means < self.lower) | (self.means > self.upper)
+                | (self.ranges < self.range_lower) | (self.ranges > self.range_upper))
+
+
+def xbar_r(values, size=SUBGROUP_SIZE):
+    """X-bar/R chart of the readings in ``values`` (NaNs left out); None if there is not one subgroup.
+
+    A partial subgroup at the end waits for the readings that complete it.
+    """
+    if size not in CONTROL_CONSTANTS:
+        raise ValueError(f"subgroups must have 2 to 10 readings, not {size}")
+    values = values[~np.isnan(values)]
+    subgroups = values[:len(values) // size * size].reshape(-1, size)
+    if not len(subgroups):
+        return None
+    return XbarR(subgroups.mean(axis=1), np.ptp(subgroups, axis=1), size)
+
+
+class Running:
+    """Welford's running count, mean and sum of squared deviations."""
+
+    __slots__ = ("count", "mean", "m2")
+
+    def __init__(self, count=0, mean=0.0, m2=0.0):
+        self.count = count
+        self.mean = mean
+        self.m2 = m2
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+
+    def remove(self, value):
+        """Take back a ``value`` added before."""
+        self.count -= 1
+        if not self.count:
+            self.mean = self.m2 = 0.0
+            return
+        delta = value - self.mean
+        self.mean -= delta / self.count
+        self.m2 = max(0.0, self.m2 - delta * (value - self.mean))
+
+    @property
+    def std(self):
+        """Sample standard deviation, NaN below two readings."""
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else math.nan
+
+
+class GroupStats:
+    """Running statistics of one operator's or one day's sessions."""
+
+    __slots__ = ("sessions", "markers", "reached", "metrics")
+
+    def __init__(self):
+        self.sessions = 0
+        self.markers = 0  # Reach markers answered
+        self.reached = 0
+        self.metrics = {slot: Running() for slot in METRICS}
+
+    @property
+    def pass_rate(self):
+        """Share of answered reach markers that were reached, NaN before the first."""
+        return self.reached / self.markers if self.markers else math.nan
+
+    def cpk(self, slot):
+        metric = self.metrics[slot]
+        return float(cpk(metric.mean, metric.std, LIMITS[slot])) if metric.count > 1 else math.nan
+
+
+class SpcStats:
+    """Running statistics overall (``ALL``), per operator and per day."""
+
+    ALL = ("all", None)
+
+    def __init__(self, columns=None):
+        self.groups = {}  # ("all", None), ("operator", name) or ("day", day number) -> GroupStats
+        self.columns = columns  # What the statistics were built from, for the results counted then
+        self.counted = {}  # Session id -> results counted since, by slot
+
+    def group(self, by, key):
+        found = self.groups.get((by, key))
+        if found is None:
+            found = self.groups[(by, key)] = GroupStats()
+        return found
+
+    def keys(self, by):
+        """Operators, or day numbers, with statistics."""
+        return [key for group_by, key in self.groups if group_by == by]
+
+    @classmethod
+    def from_columns(cls, columns):
+        """Statistics of every session in ``columns``, computed column-wise."""
+        self = cls(columns)
+        everyone = np.zeros(len(columns), np.intp)
+        days, day_codes = np.unique(columns["day"], return_inverse=True)
+        for by, keys, codes in (("all", [None], everyone), ("operator", columns.operators, columns["operator"]),
+                                ("day", days.tolist(), day_codes)):
+            if by == "day":  # Sessions without a date have no day to be counted under
+                keys = [None if day == NO_DAY else day for day in keys]
+            sessions = np.bincount(codes, minlength=len(keys))
+            markers = sum(np.bincount(codes, columns[slot] != UNANSWERED, len(keys)) for slot in MARKERS)
+            reached = sum(np.bincount(codes, columns[slot] == 1, len(keys)) for slot in MARKERS)
+            metrics = {slot: group_stats(codes, columns[slot], len(keys)) for slot in METRICS}
+            for code, key in enumerate(keys):
+                if key is None and by == "day" or not sessions[code]:
+                    continue
+                group = self.group(by, key)
+                group.sessions = int(sessions[code])
+                group.markers, group.reached = int(markers[code]), int(reached[code])
+                for slot, (count, mean, m2) in metrics.items():
+                    group.metrics[slot] = Running(int(count[code]), float(mean[code]), float(m2[code]))
+        return self
+
+    def _groups(self, record):
+        """The groups a session counts towards."""
+        groups = [self.group(*self.ALL), self.group("operator", str(record.get("operator") or ""))]
+        try:
+            groups.append(self.group("day", parse_day(record.get("date"))))
+        except ValueError:
+            pass
+        return groups
+
+    def add_session(self, record):
+        """Count a newly created session."""
+        for group in self._groups(record):
+            group.sessions += 1
+
+    def add_results(self, session_id, record, data):
+        """Count a setup's results (``data``) saved to the session ``record``, in place of any counted before."""
+        counted = self.counted.get(session_id)
+        if counted is None:
+            counted = self.counted[session_id] = self.columns.results(session_id) if self.columns else {}
+        typed = SessionRecord.from_dict(data)
+        changes = [(slot, counted.get(slot), getattr(typed, slot)) for slot in (*MARKERS, *METRICS)
+                   if KEYS[slot] in data]
+        for group in self._groups(record):
+            for slot, old, new in changes:
+                if slot in MARKERS:
+                    if old is not None:
+                        group.markers -= 1
+                        group.reached -= old
+                    if new is not None:
+                        group.markers += 1
+                        group.reached += new
+                else:
+                    if old is not None:
+                        group.metrics[slot].remove(old)
+                    if new is not None:
+                        group.metrics[slot].add(new)
+        counted.update((slot, new) for slot, _, new in changes)
+
+
+if __name__ == "__main__":
+    from storage import open_store
+
+    slot = sys.argv[1] if len(sys.argv) > 1 else "setup4_deflection"
+    if slot not in METRICS:
+        sys.exit(f"Unknown measurement: {slot} (one of {', '.join(METRICS)})")
+    store = open_store()
+    try:
+        columns = load_columns(store)
+    finally:
+        store.close()
+    stats = SpcStats.from_columns(columns)
+    print(f"{METRICS[slot]}, {len(columns)} sessions")
+    for name in sorted(stats.keys("operator")):
+        group = stats.group("operator", name)
+        metric = group.metrics[slot]
+        print(f"{name or '(none)'}\t{group.sessions} sessions\tpass rate {group.pass_rate:.1%}\t"
+              f"n {metric.count}\tmean {metric.mean:.3f}\tsd {metric.std:.3f}\tCpk {group.cpk(slot):.2f}")
+    chart = xbar_r(columns[slot])
+    if chart is not None:
+        print(f"X-bar {chart.center:.3f} ({chart.lower:.3f} to {chart.upper:.3f}), "
+              f"R {chart.range_center:.3f} ({chart.range_lower:.3f} to {chart.range_upper:.3f}), "
+              f"{int(chart.out_of_control().sum())} of {len(chart.means)} subgroups out of control")
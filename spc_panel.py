@@ -0,0 +1,188 @@
+"""SPC page: pass rates, Cpk and X-bar/R charts of the session results.
+
+``SpcLoader`` loads the results column-wise (``spc.load_columns``) and
+builds ``SpcStats`` from them as a ``store_job.StoreJob``. The window
+keeps the statistics up to date as results are saved, so ``SpcScreen``
+fills its table from them straight away, however long the history; only
+the charts wait for the columns, which are caught up each time the page is
+shown.
+"""
+import math
+
+import numpy as np
+from PySide6.QtCore import QObject, QPointF, QRectF, Qt, Signal
+from PySide6.QtGui import QColor, QPainter, QPen
+from PySide6.QtWidgets import QComboBox, QHBoxLayout, QHeaderView, QLabel, QSizePolicy, QTableWidget, \
+    QTableWidgetItem, QWidget
+
+from navigation import Page
+from session_record import from_day
+from spc import METRICS, SpcStats, load_columns, xbar_r
+from store_job import StoreJob
+
+GROUPINGS = (("Operator", "operator"), ("Day", "day"))
+HEADER = ("Sessions", "Pass rate", "Readings", "Mean", "SD", "Cpk")
+DAY_ROWS = 90  # Most recent days listed
+CHART_SUBGROUPS = 100  # Most recent subgroups charted
+MARGIN = 0.1  # Of a chart's range, left free above and below
+BACKGROUND = QColor("#FFFFFF")
+SERIES_COLOR = QColor("#3D75A2")
+CENTER_COLOR = QColor("#4CAF50")
+LIMIT_COLOR = QColor("#f44336")
+TEXT_COLOR = QColor("#333333")
+
+
+class SpcLoaderSignals(QObject):
+    loaded = Signal(object, object)  # Columns, and SpcStats built from them
+    failed = Signal(str)  # Error message
+
+
+class SpcLoader(StoreJob):
+    def __init__(self, open_store, writer=None):
+        super().__init__(open_store, writer)
+        self.signals = SpcLoaderSignals()
+
+    def run(self):
+        try:
+            columns = self.read_store(load_columns)
+            stats = SpcStats.from_columns(columns)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.loaded.emit(columns, stats)
+
+
+def format_number(value, spec=".3f"):
+    return "" if value is None or math.isnan(value) else format(value, spec)
+
+
+class ControlChart(QWidget):
+    """An X-bar chart above its R chart, with centre lines and control limits."""
+
+    LEFT = 70  # Pixels kept for the limit values
+
+    def __init__(self):
+        super().__init__()
+        self.chart = None  # spc.XbarR, or None with too few readings
+        self.setMinimumHeight(280)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+
+    def set_chart(self, chart):
+        self.chart = chart
+        self.update()
+
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), BACKGROUND)
+        chart = self.chart
+        if chart is None:
+            painter.setPen(TEXT_COLOR)
+            painter.drawText(self.rect(), Qt.AlignCenter, "Not enough readings for a chart yet")
+        else:
+            half = self.height() / 2
+            self.paint_series(painter, QRectF(0, 0, self.width(), half), "X-bar", chart.means[-CHART_SUBGROUPS:],
+                              chart.center, chart.lower, chart.upper)
+            self.paint_series(painter, QRectF(0, half, self.width(), half), "R", chart.ranges[-CHART_SUBGROUPS:],
+                              chart.range_center, chart.range_lower, chart.range_upper)
+        painter.end()
+
+    def paint_series(self, painter, area, name, values, center, lower, upper):
+        """Plot ``values`` in ``area``, points outside the limits marked."""
+        area = area.adjusted(self.LEFT, 12, -12, -12)
+        low, high = min(float(values.min()), lower), max(float(values.max()), upper)
+        spread = max(high - low, 1e-9)
+        low, high = low - spread * MARGIN, high + spread * MARGIN
+
+        def y(value):
+            return area.bottom() - (value - low) / (high - low) * area.height()
+
+        for value, color, style in ((lower, LIMIT_COLOR, Qt.DashLine), (upper, LIMIT_COLOR, Qt.DashLine),
+                                    (center, CENTER_COLOR, Qt.SolidLine)):
+            painter.setPen(QPen(color, 1, style))
+            painter.drawLine(QPointF(area.left(), y(value)), QPointF(area.right(), y(value)))
+            painter.setPen(TEXT_COLOR)
+            painter.drawText(QPointF(4, y(value) + 4), f"{value:.3f}")
+        painter.drawText(QPointF(area.left() + 4, area.top()), name)
+        step = area.width() / max(len(values) - 1, 1)
+        points = [QPointF(area.left() + i * step, y(value)) for i, value in enumerate(values.tolist())]
+        painter.setPen(QPen(SERIES_COLOR, 1))
+        painter.drawPolyline(points)
+        painter.setPen(Qt.NoPen)
+        painter.setBrush(LIMIT_COLOR)
+        for i in np.flatnonzero((values < lower) | (values > upper)).tolist():
+            painter.drawEllipse(points[i], 3, 3)
+
+
+class SpcScreen(Page):
+    """Statistics of a measurement per operator or per day, and its control chart."""
+
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.setWindowTitle("Statistical Process Control")
+
+        layout = self.layout
+        title = QLabel("Statistical Process Control")
+        title.setObjectName("screenTitle")
+        title.setAlignment(Qt.AlignCenter)
+        layout.addWidget(title)
+
+        choice_row = QHBoxLayout()
+        self.measurement = QComboBox()
+        self.measurement.addItems(list(METRICS.values()))
+        self.grouping = QComboBox()
+        self.grouping.addItems([label for label, _ in GROUPINGS])
+        self.status_label = QLabel()
+        self.status_label.setObjectName("fieldLabel")
+        for widget in (self.measurement, self.grouping, self.status_label):
+            choice_row.addWidget(widget)
+        layout.addLayout(choice_row)
+
+        self.table = QTableWidget(0, len(HEADER) + 1)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        layout.addWidget(self.table)
+        self.chart = ControlChart()
+        layout.addWidget(self.chart)
+
+        self.measurement.currentIndexChanged.connect(self.refresh)
+        self.grouping.currentIndexChanged.connect(self.refresh)
+
+    def showEvent(self, event):
+        super().showEvent(event)
+        self.refresh()
+        self.parent.load_spc()  # Catch the charts up with what was saved since
+
+    def refresh(self):
+        """Show the window's current statistics and columns."""
+        slot = list(METRICS)[self.measurement.currentIndex()]
+        self.fill_table(slot)
+        columns = self.parent.spc_columns
+        self.chart.set_chart(None if columns is None else xbar_r(columns[slot]))
+        if self.parent.spc is None:
+            self.status_label.setText("Loading...")
+        else:
+            self.status_label.setText(f"{self.parent.spc.group(*SpcStats.ALL).sessions:,} sessions")
+
+    def fill_table(self, slot):
+        label, by = GROUPINGS[self.grouping.currentIndex()]
+        stats = self.parent.spc
+        self.table.setHorizontalHeaderLabels([label, *HEADER])
+        if stats is None:
+            self.table.setRowCount(0)
+            return
+        if by == "day":
+            keys = sorted(stats.keys(by), reverse=True)[:DAY_ROWS]
+            names = [from_day(day).isoformat() for day in keys]
+        else:
+            keys = sorted(stats.keys(by))
+            names = [name or "(none)" for name in keys]
+        self.table.setRowCount(len(keys))
+        for row, (key, name) in enumerate(zip(keys, names)):
+            group = stats.group(by, key)
+            metric = group.metrics[slot]
+            cells = (name, str(group.sessions), format_number(group.pass_rate, ".1%"), str(metric.count),
+                     format_number(metric.mean if metric.count else math.nan), format_number(metric.std),
+                     format_number(group.cpk(slot), ".2f"))
+            for column, text in enumerate(cells):
+                self.table.setItem(row, column, QTableWidgetItem(text))
@@ -0,0 +1,227 @@
+"""SQLite session store.
+
+Sessions live in one table with the full record as JSON plus indexed copies of
+``device_sn``, ``operator`` and ``date``. The database runs in WAL mode so the
+report can read while a station is writing, and every statement is a constant,
+parameterized string so sqlite3's statement cache reuses the prepared plan.
+
+Stations sharing the database are serialized by SQLite's own locking (a
+writer waits up to ``BUSY_TIMEOUT`` seconds for another to commit), and each
+row counts its writes in ``version`` for optimistic updates. SQLite's locks
+are unreliable on network file systems, so stations on a shared drive should
+share the ``log`` backend instead.
+"""
+import json
+import sqlite3
+import uuid
+
+from storage import ConflictError, StorageBackend
+
+DB_PATH = "user_details.db"
+BUSY_TIMEOUT = 30.0  # Seconds a write waits for other stations' transactions
+
+INDEXED_COLUMNS = ("device_sn", "operator", "date")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL UNIQUE,
+    device_sn TEXT,
+    operator TEXT,
+    date TEXT,
+    data TEXT NOT NULL,
+    changed INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 1
+);
+CREATE INDEX IF NOT EXISTS sessions_device_sn ON sessions(device_sn);
+CREATE INDEX IF NOT EXISTS sessions_operator ON sessions(operator);
+CREATE INDEX IF NOT EXISTS sessions_date ON sessions(date);
+CREATE TABLE IF NOT EXISTS fields (
+    name TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+"""
+
+# Every write transaction bumps the store version and stamps the rows it
+# touches with it, so readers can ask for "rows changed since version N".
+CHANGED_INDEX_SQL = "CREATE INDEX IF NOT EXISTS sessions_changed ON sessions(changed)"
+BUMP_VERSION_SQL = "UPDATE meta SET value = value + 1 WHERE key = 'version'"
+VERSION_SQL = "SELECT value FROM meta WHERE key = 'version'"
+CURRENT_VERSION = "(SELECT value FROM meta WHERE key = 'version')"
+
+INSERT_SQL = ("INSERT INTO sessions (session_id, device_sn, operator, date, data, changed) "
+              "VALUES (?, ?, ?, ?, ?, " + CURRENT_VERSION + ")")
+GET_SQL = "SELECT data FROM sessions WHERE session_id = ?"
+SESSION_VERSION_SQL = "SELECT version FROM sessions WHERE session_id = ?"
+LAST_SQL = "SELECT session_id FROM sessions ORDER BY seq DESC LIMIT 1"
+COUNT_SQL = "SELECT count(*) FROM sessions"
+CHANGES_SQL = "SELECT session_id FROM sessions WHERE changed > ? ORDER BY seq"
+SEQ_SQL = "SELECT seq FROM sessions ORDER BY seq"
+RANGE_SQL = "SELECT session_id, data FROM sessions WHERE seq BETWEEN ? AND ? ORDER BY seq"
+FIELDS_SQL = "SELECT name FROM fields ORDER BY rowid"
+ADD_FIELD_SQL = "INSERT OR IGNORE INTO fields (name) VALUES (?)"
+
+
+class SqliteBackend(StorageBackend):
+    def __init__(self, path=DB_PATH):
+        self.path = path
+        # The background writer uses the connection from its own thread
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT, cached_statements=256,
+                                    check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(sessions)")}
+        if "changed" not in columns:
+            # Databases created before change tracking
+            self.conn.execute("ALTER TABLE sessions ADD COLUMN changed INTEGER NOT NULL DEFAULT 0")
+        if "version" not in columns:
+            # Databases created before session versions
+            self.conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 1")
+        self.conn.execute(CHANGED_INDEX_SQL)
+        self.known_fields = {name for (name,) in self.conn.execute(FIELDS_SQL)}
+
+    def _add_fields(self, record):
+        """Remember any record keys not seen before (the report header)."""
+        for key in record:
+            if key not in self.known_fields:
+                self.conn.execute(ADD_FIELD_SQL, (key,))
+                self.known_fields.add(key)
+
+    def _row(self, record, session_id):
+        self._add_fields(record)
+        return (session_id, record.get("device_sn"), record.get("operator"),
+                record.get("date"), json.dumps(record))
+
+    def create_session(self, record, session_id=None):
+        session_id = session_id or uuid.uuid4().hex
+        with self.conn:
+            self.conn.execute(BUMP_VERSION_SQL)
+            self.conn.execute(INSERT_SQL, self._row(record, session_id))
+        return session_id
+
+    def create_sessions(self, records):
+        with self.conn:
+            self.conn.execute(BUMP_VERSION_SQL)
+            self.conn.executemany(
+                INSERT_SQL, (self._row(record, uuid.uuid4().hex) for record in records))
+
+    def update_session(self, session_id, data, expected_version=None):
+        with self.conn:
+            self.conn.execute(BUMP_VERSION_SQL)
+            self._update(session_id, data, expected_version)
+
+    def session_version(self, session_id):
+        row = self.conn.execute(SESSION_VERSION_SQL, (session_id,)).fetchone()
+        if row is None:
+            raise KeyError(session_id)
+        return row[0]
+
+    def write_batch(self, operations):
+        """Apply a batch of creates and updates in one transaction."""
+        with self.conn:
+            self.conn.execute(BUMP_VERSION_SQL)
+            for op, session_id, data in operations:
+                if op == "create":
+                    self.conn.execute(INSERT_SQL, self._row(data, session_id))
+                else:
+                    self._update(session_id, data)
+
+    def _update(self, session_id, data, expected_version=None):
+        """Merge ``data`` into one row with a single UPDATE.
+
+        ``json_set`` keeps existing key order and appends new keys, matching
+        ``dict.update`` on the legacy records. The SQL text only depends on
+        which keys are updated, so each setup screen reuses one prepared plan.
+        """
+        self._add_fields(data)
+        keys = list(data)
+        assignments = ["data = json_set(data" + ", ?, json(?)" * len(keys) + ")",
+                       "changed = " + CURRENT_VERSION, "version = version + 1"]
+        params = []
+        for key in keys:
+            params.append('$."%s"' % key.replace('"', '\\"'))
+            params.append(json.dumps(data[key]))
+        for column in INDEXED_COLUMNS:
+            if column in data:
+                assignments.append(f"{column} = ?")
+                params.append(data[column])
+        params.append(session_id)
+        where = " WHERE session_id = ?"
+        if expected_version is not None:
+            where += " AND version = ?"
+            params.append(expected_version)
+        cursor = self.conn.execute("UPDATE sessions SET " + ", ".join(assignments) + where, params)
+        if cursor.rowcount != 1:
+            if expected_version is not None:
+                # Same transaction, so the version read here is the one that failed the check
+                raise ConflictError(session_id, expected_version, self.session_version(session_id))
+            raise KeyError(session_id)
+
+    def get_session(self, session_id):
+        row = self.conn.execute(GET_SQL, (session_id,)).fetchone()
+        if row is None:
+            raise KeyError(session_id)
+        return json.loads(row[0])
+
+    def last_session_id(self):
+        row = self.conn.execute(LAST_SQL).fetchone()
+        return row[0] if row else None
+
+    def count(self):
+        return self.conn.execute(COUNT_SQL).fetchone()[0]
+
+    def field_names(self):
+        return [name for (name,) in self.conn.execute(FIELDS_SQL)]
+
+    def partition(self, chunk_rows):
+        """Chunk sessions into ``seq`` ranges, for ``read_seq_range``."""
+        bounds = []
+        first = last = None
+        for row, (seq,) in enumerate(self.conn.execute(SEQ_SQL)):
+            if row % chunk_rows == 0:
+                if first is not None:
+                    bounds.append((first, last))
+                first = seq
+            last = seq
+        if first is not None:
+            bounds.append((first, last))
+        return ((read_seq_range, (self.path, first, last)) for first, last in bounds)
+
+    def change_token(self):
+        return self.conn.execute(VERSION_SQL).fetchone()[0]
+
+    def changes_since(self, token):
+        if not isinstance(token, int):
+            return None
+        return [session_id for (session_id,) in self.conn.execute(CHANGES_SQL, (token,))]
+
+    def iter_sessions(self, device_sn=None, operator=None, date=None):
+        """Stream sessions in creation order; filters use the column indexes."""
+        clauses, params = [], []
+        for column, value in zip(INDEXED_COLUMNS, (device_sn, operator, date)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        sql = "SELECT session_id, data FROM sessions"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        for session_id, data in self.conn.execute(sql + " ORDER BY seq", params):
+            yield session_id, json.loads(data)
+
+    def close(self):
+        self.conn.close()
+
+
+def read_seq_range(path, first, last):
+    """Yield ``(session_id, record)`` for sessions with ``first <= seq <= last``."""
+    conn = sqlite3.connect(path)
+    try:
+        for session_id, data in conn.execute(RANGE_SQL, (first, last)):
+            yield session_id, json.loads(data)
+    finally:
+        conn.close()
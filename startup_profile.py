@@ -0,0 +1,103 @@
+"""Start-up profiling for ``python main.py --profile-startup[=PATH]``.
+
+Import this module before anything else so the imports that follow can be
+timed. With the flag given, ``mark`` records a point in time and ``section``
+the span of a ``with`` block; ``write`` saves them as a Chrome trace event
+JSON file (open it in chrome://tracing or ui.perfetto.dev, or read the
+``traceEvents`` list directly), with times in microseconds from interpreter
+start. Without the flag both are no-ops.
+"""
+import os
+import sys
+import threading
+import time
+
+FLAG = "--profile-startup"
+DEFAULT_PATH = "startup_profile.json"
+
+
+def _requested_path(argv):
+    """Return the trace path asked for on the command line, or None."""
+    for arg in argv[1:]:
+        if arg == FLAG:
+            return DEFAULT_PATH
+        if arg.startswith(FLAG + "="):
+            return arg[len(FLAG) + 1:]
+    return None
+
+
+def _process_started(now):
+    """``time.perf_counter()`` value at which this process started, if the OS says."""
+    try:
+        with open("/proc/self/stat") as f:
+            start_ticks = int(f.read().rpartition(")")[2].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return None  # Not Linux; time from this module's import instead
+    return now - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+
+
+path = _requested_path(sys.argv)
+enabled = path is not None
+_imported = time.perf_counter()
+_origin = _process_started(_imported) if enabled else None
+if _origin is None:
+    _origin = _imported
+events = []
+_written = False
+
+
+def _micros(perf_time):
+    return round((perf_time - _origin) * 1e6)
+
+
+def _event(name, phase, start, **fields):
+    events.append(dict(name=name, ph=phase, ts=_micros(start), pid=os.getpid(),
+                       tid=threading.get_ident(), **fields))
+
+
+if enabled:
+    if _origin != _imported:
+        _event("interpreter start", "i", _origin, s="p")
+    _event("startup_profile imported", "i", _imported, s="p")
+
+
+def mark(name):
+    """Record that start-up reached ``name``."""
+    if enabled:
+        _event(name, "i", time.perf_counter(), s="p")
+
+
+class section:
+    """Record how long the ``with`` block takes."""
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        if enabled:
+            self.start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        if enabled:
+            _event(self.name, "X", self.start, dur=round((time.perf_counter() - self.start) * 1e6))
+
+
+def strip_flag(argv):
+    """Return ``argv`` without the profiling flag (for QApplication)."""
+    return [arg for arg in argv if arg != FLAG and not arg.startswith(FLAG + "=")]
+
+
+def write():
+    """Save the trace to the requested path (again, if more was recorded since)."""
+    global _written
+    if not enabled:
+        return
+    import json  # Only needed when profiling, so not at start-up
+    with open(path, "w") as f:
+        json.dump({"traceEvents": sorted(events, key=lambda event: event["ts"]), "displayTimeUnit": "ms"},
+                  f, indent=1)
+    if not _written:
+        print(f"Start-up profile written to {path}")
+        _written = True
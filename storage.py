@@ -0,0 +1,304 @@
+"""Session storage backends.
+
+All screens save through a ``StorageBackend`` so the on-disk format can be
+swapped without touching the UI. Four backends ship with the app:
+
+* ``json``     - the original ``user_details.json`` list (kept for compatibility)
+* ``log``      - the append-only record log in ``record_log.py`` (default)
+* ``sqlite``   - an indexed SQLite database in ``sqlite_store.py``
+* ``segments`` - the record log split into daily, sealed and compacted
+  segments in ``segment_store.py``
+
+The backend is picked with the ``PPT_STORE_BACKEND`` environment variable.
+
+Several stations may share one store (e.g. on a shared drive): the file
+backends take an advisory lock (``locking.py``) around every write, and every
+backend keeps a version per session so a writer can ask for its update to be
+applied only if nobody else has written to the session since it looked.
+"""
+import json
+import os
+import sys
+
+from locking import FileLock
+
+LEGACY_PATH = "user_details.json"
+DEFAULT_BACKEND = "log"
+
+
+class ConflictError(Exception):
+    """Raised when a session changed since the version an update was based on."""
+
+    def __init__(self, session_id, expected_version, version):
+        super().__init__(f"session {session_id} is at version {version}, not {expected_version}")
+        self.session_id = session_id
+        self.expected_version = expected_version
+        self.version = version
+
+
+class StorageBackend:
+    """Interface shared by all session stores."""
+
+    keeps_ids = True  # Whether ids given to create_session still find the session after a restart
+
+    def create_session(self, record, session_id=None):
+        """Store a new session record and return its id."""
+        raise NotImplementedError
+
+    def create_sessions(self, records):
+        """Store many session records at once (used by the importer)."""
+        for record in records:
+            self.create_session(record)
+
+    def update_session(self, session_id, data, expected_version=None):
+        """Merge ``data`` (e.g. one setup's results) into a session.
+
+        With ``expected_version`` (from ``session_version``), raise
+        ``ConflictError`` instead if the session has been written since. A
+        backend that keeps no versions (``json``) raises ``ValueError`` if
+        given one, rather than apply the update unchecked.
+        """
+        raise NotImplementedError
+
+    def session_version(self, session_id):
+        """Return how many writes a session has had (``KeyError`` if unknown)."""
+        raise NotImplementedError
+
+    def write_batch(self, operations):
+        """Apply ``("create" | "update", session_id, data)`` operations in order."""
+        for op, session_id, data in operations:
+            if op == "create":
+                self.create_session(data, session_id)
+            else:
+                self.update_session(session_id, data)
+
+    def get_session(self, session_id):
+        """Return one session record by id (``KeyError`` if unknown)."""
+        raise NotImplementedError
+
+    def last_session_id(self):
+        """Return the id of the most recently created session."""
+        raise NotImplementedError
+
+    def count(self):
+        """Return the number of stored sessions."""
+        raise NotImplementedError
+
+    def iter_sessions(self, device_sn=None, operator=None, date=None):
+        """Yield ``(session_id, record)`` in creation order, optionally filtered."""
+        raise NotImplementedError
+
+    def iter_records(self, device_sn=None, operator=None, date=None):
+        """Yield session records in creation order, optionally filtered."""
+        for _, record in self.iter_sessions(device_sn, operator, date):
+            yield record
+
+    def change_token(self):
+        """Return a cheap value that changes whenever any session changes."""
+        raise NotImplementedError
+
+    def changes_since(self, token):
+        """Return ids of sessions changed since ``token`` in creation order.
+
+        Returns None if the backend cannot tell, in which case callers have
+        to compare every session themselves.
+        """
+        return None
+
+    def field_names(self):
+        """Return every record key in first-seen order, or None if not tracked."""
+        return None
+
+    def partition(self, chunk_rows):
+        """Split the sessions into chunks other processes can read on their own.
+
+        Returns an iterable of ``(reader, args)`` in creation order, where the
+        module-level function ``reader(*args)`` yields that chunk's
+        ``(session_id, record)`` pairs, or None if the backend cannot be read
+        from another process.
+        """
+        return None
+
+    def close(self):
+        """Release any open handles."""
+
+    def __len__(self):
+        return self.count()
+
+
+def matches(record, device_sn=None, operator=None, date=None):
+    """Return True if a record passes the optional equality filters."""
+    return ((device_sn is None or record.get("device_sn") == device_sn)
+            and (operator is None or record.get("operator") == operator)
+            and (date is None or record.get("date") == date))
+
+
+def changes_to_sync(store, source, token):
+    """What a cache built from ``store`` has to read to catch up with it.
+
+    ``source`` and ``token`` are the backend name and change token the cache
+    recorded when it last synced (None if never). Returns ``(source, token,
+    changed)``: the pair to record once caught up, and an empty list if
+    nothing has changed, the ids of the sessions changed since, or None if
+    every session has to be read again. The token is read before the
+    sessions, so changes made meanwhile are caught next time.
+    """
+    current, latest = type(store).__name__, store.change_token()
+    if current != source:
+        return current, latest, None
+    if latest == token and token is not None:
+        return current, latest, []
+    return current, latest, store.changes_since(token)
+
+
+class JsonFileBackend(StorageBackend):
+    """The original whole-file ``user_details.json`` format.
+
+    Every write reads and rewrites the full list, so this backend is only meant
+    for compatibility with tools that read the file directly. Session ids are
+    list positions; ids chosen by the caller (e.g. by the background writer)
+    are mapped to positions for the life of the process.
+
+    Writes hold ``<path>.lock`` from the read to the rewrite, so stations
+    sharing the file no longer lose each other's sessions, and the new list
+    replaces the file in one rename, so readers never see it half-written.
+    The file has nowhere to keep session versions, nor the ids chosen by the
+    caller, so the session in progress is not picked up after a crash.
+    """
+
+    keeps_ids = False
+
+    def __init__(self, path=LEGACY_PATH):
+        self.path = path
+        self.lock = FileLock(path + ".lock")
+        self.positions = {}
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path, "r") as f:
+            return json.load(f)
+
+    def _save(self, records):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(records, f, indent=4)
+        os.replace(tmp_path, self.path)
+
+    def create_session(self, record, session_id=None):
+        with self.lock:
+            records = self._load()
+            records.append(record)
+            self._save(records)
+        position = str(len(records) - 1)
+        if session_id is not None:
+            self.positions[session_id] = position
+        return position
+
+    def create_sessions(self, records):
+        with self.lock:
+            existing = self._load()
+            existing.extend(records)
+            self._save(existing)
+
+    def update_session(self, session_id, data, expected_version=None):
+        if expected_version is not None:
+            raise ValueError("the JSON file keeps no session versions; use the log, segments or sqlite backend")
+        with self.lock:
+            records = self._load()
+            records[int(self.positions.get(session_id, session_id))].update(data)
+            self._save(records)
+
+    def write_batch(self, operations):
+        with self.lock:
+            records = self._load()
+            for op, session_id, data in operations:
+                if op == "create":
+                    records.append(data)
+                    self.positions[session_id] = str(len(records) - 1)
+                else:
+                    records[int(self.positions.get(session_id, session_id))].update(data)
+            self._save(records)
+
+    def get_session(self, session_id):
+        records = self._load()
+        try:
+            return records[int(self.positions.get(session_id, session_id))]
+        except (ValueError, IndexError):
+            raise KeyError(session_id)
+
+    def last_session_id(self):
+        records = self._load()
+        return str(len(records) - 1) if records else None
+
+    def count(self):
+        return sum(1 for _ in self.iter_sessions())
+
+    def iter_sessions(self, device_sn=None, operator=None, date=None):
+        if not os.path.exists(self.path):
+            return
+        from reports import iter_json_array
+        for position, record in enumerate(iter_json_array(self.path)):
+            if matches(record, device_sn, operator, date):
+                yield str(position), record
+
+    def change_token(self):
+        if not os.path.exists(self.path):
+            return None
+        stat = os.stat(self.path)
+        return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def open_store(backend=None, legacy_path=LEGACY_PATH):
+    """Open ``backend`` (by default ``PPT_STORE_BACKEND``), importing the legacy JSON file on first use."""
+    backend = backend or os.environ.get("PPT_STORE_BACKEND", DEFAULT_BACKEND)
+    if backend == "json":
+        return JsonFileBackend(legacy_path)
+    if backend == "log":
+        from record_log import RecordLog, LOG_PATH
+        first_use = not os.path.exists(LOG_PATH)
+        store = RecordLog()
+    elif backend == "sqlite":
+        from sqlite_store import SqliteBackend, DB_PATH
+        first_use = not os.path.exists(DB_PATH)
+        store = SqliteBackend()
+    elif backend == "segments":
+        from segment_store import SegmentStore, SEGMENTS_DIR
+        first_use = not os.path.exists(SEGMENTS_DIR)
+        store = SegmentStore()
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    if first_use and os.path.exists(legacy_path):
+        import_json(legacy_path, store)
+    return store
+
+
+def import_json(path, store):
+    """One-shot import of a legacy ``user_details.json`` list into ``store``."""
+    with open(path, "r") as f:
+        records = json.load(f)
+    store.create_sessions(records)
+    return len(records)
+
+
+def export_json(store, path=LEGACY_PATH):
+    """Write every session from ``store`` as a legacy ``user_details.json`` list."""
+    with open(path, "w") as f:
+        json.dump(list(store.iter_records()), f, indent=4)
+
+
+if __name__ == "__main__":
+    # python storage.py import [user_details.json] [backend]
+    # python storage.py export [user_details.json] [backend]
+    command = sys.argv[1] if len(sys.argv) > 1 else "export"
+    path = sys.argv[2] if len(sys.argv) > 2 else LEGACY_PATH
+    name = sys.argv[3] if len(sys.argv) > 3 else None
+    if command == "import":
+        if (name or os.environ.get("PPT_STORE_BACKEND", DEFAULT_BACKEND)) == "json":
+            sys.exit(f"{path} is in the json format already; import it into log, segments or sqlite")
+        target = open_store(name, legacy_path="")
+        print(f"Imported {import_json(path, target)} sessions")
+    elif command == "export":
+        export_json(open_store(name), path)
+    else:
+        sys.exit(f"Unknown command: {command}")
@@ -0,0 +1,29 @@
+"""Reading the store on a ``QThreadPool`` thread.
+
+``StoreJob`` is the ``QRunnable`` behind the report, the history index, the
+SPC statistics and the history and dashboard tables. ``open_store`` is
+called on the worker thread, so each job reads through a store handle of
+its own (SQLite connections stay on the thread that made them), and the
+window's ``StoreWriter``, if given, is flushed first so the job sees every
+save queued before it started. Subclasses add a ``signals`` object and a
+``run`` that reads through ``read_store``.
+"""
+from PySide6.QtCore import QRunnable
+
+
+class StoreJob(QRunnable):
+    def __init__(self, open_store, writer=None):
+        super().__init__()
+        self.setAutoDelete(False)  # Whoever starts the job keeps it until it reports back
+        self.open_store = open_store
+        self.writer = writer
+
+    def read_store(self, read):
+        """Return ``read(store)`` for a store handle opened (and closed) on this thread."""
+        if self.writer is not None:
+            self.writer.flush()
+        store = self.open_store()
+        try:
+            return read(store)
+        finally:
+            store.close()
@@ -0,0 +1,29 @@
+"""Application-wide style sheet handling.
+
+Widgets are styled by one style sheet set on the ``QApplication`` once at
+start-up, instead of ``setStyleSheet`` calls on individual widgets (each of
+which makes Qt parse CSS and re-polish the widget and its children). Widgets
+are matched by object name, and states are matched by the built-in
+``:enabled``/``:disabled`` pseudo-states or by dynamic properties such as
+``[completed="true"]``, which ``set_state`` changes with a re-polish of just
+that widget.
+"""
+from PySide6.QtWidgets import QApplication
+
+
+def apply_style_sheet(style_sheet):
+    """Set ``style_sheet`` on the application unless it is already in place."""
+    app = QApplication.instance()
+    if app.styleSheet() != style_sheet:
+        app.setStyleSheet(style_sheet)
+
+
+def set_state(widget, name, value):
+    """Set a dynamic property used by the style sheet and restyle only ``widget``."""
+    if widget.property(name) == value:
+        return
+    widget.setProperty(name, value)
+    style = widget.style()
+    style.unpolish(widget)
+    style.polish(widget)
+    widget.update()
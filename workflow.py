@@ -0,0 +1,125 @@
+"""The test workflow's records and checks, without any widgets.
+
+``MainWindow.submit_details`` and the setup screens' submit methods build the
+data they save with these functions, and ``headless.py`` runs sessions on the
+automated line through the same ones, so a session saved from either looks
+the same and is checked the same way.
+"""
+import datetime
+import math
+
+MARKER_CHOICES = ("No", "Yes")  # Answers to "Unit Reach Marker"; the screens add a "---" placeholder
+MARKER_SETUPS = (2, 3)  # Setups that record a reach marker and, if missed, the measured height
+MOTION_SETUPS = (6, 8)  # Setups that record a trace of the lift's motion
+COMPLETED_KEY = "Completed Setups"  # Setups submitted on the screens; only the main screen reads it back
+
+# QDate.toString() gives the date as "Wed May 1 2024" with English names
+# whatever the locale; spelled out here so no Qt is needed to match it
+DAY_NAMES = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+MONTH_NAMES = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+
+class ValidationError(ValueError):
+    """Raised when a session or setup result is missing data or has a bad value."""
+
+
+def format_date(date):
+    """Return ``date`` (a ``datetime.date`` or ISO ``YYYY-MM-DD`` string) as sessions store it."""
+    if isinstance(date, str):
+        try:
+            date = datetime.date.fromisoformat(date)
+        except ValueError:
+            raise ValidationError(f"date must be YYYY-MM-DD, not {date!r}") from None
+    elif not isinstance(date, datetime.date):
+        raise ValidationError(f"date must be YYYY-MM-DD, not {date!r}")
+    return f"{DAY_NAMES[date.weekday()]} {MONTH_NAMES[date.month - 1]} {date.day} {date.year}"
+
+
+def details_complete(device_sn, operator, date):
+    """Whether the details form has everything a session needs."""
+    return bool(device_sn and operator and date)
+
+
+def new_session(device_sn, operator, date):
+    """Return the record of a new session, with every setup still to be done."""
+    if not details_complete(device_sn, operator, date):
+        raise ValidationError("device_sn, operator and date are all required")
+    if not isinstance(device_sn, str) or not isinstance(operator, str):
+        raise ValidationError("device_sn and operator must be text")
+    return {
+        "device_sn": device_sn,
+        "operator": operator,
+        "date": format_date(date),
+        "Setup2 - Unit Reach Marker": None,
+        "Setup2 - Measured Max Height": None,
+        "Setup3 - Unit Reach Marker": None,
+        "Setup3 - Measured Max Height": None,
+        "Setup4 - Click to Zero Vertical Position Dial": False,
+        "Setup4 - Click to record vertical deflection": False,
+        "Setup4 - Peak Vertical Deflection": None,
+    }
+
+
+def marker_result(setup, marker, measured_max_height=""):
+    """Return Setup #2 or #3's results; the height only counts when the marker was missed."""
+    if setup not in MARKER_SETUPS:
+        raise ValidationError(f"Setup #{setup} has no reach marker")
+    if marker not in MARKER_CHOICES:
+        raise ValidationError(f"Setup{setup} marker must be one of {', '.join(MARKER_CHOICES)}, not {marker!r}")
+    return {
+        f"Setup{setup} - Unit Reach Marker": marker,
+        f"Setup{setup} - Measured Max Height": None if marker == "Yes" else measured_max_height,
+    }
+
+
+def deflection_result(zero=None, peak=None, settled=None):
+    """Return Setup #4's results once every step has been confirmed.
+
+    When the dial was read (see ``acquisition.py``), its zero reading and the
+    settled deflection are saved in place of each step's "Yes", and the peak
+    deflection with them, all in mm; a reading not taken stays "Yes".
+    """
+    for name, value in (("zero", zero), ("peak", peak), ("settled", settled)):
+        if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))
+                                  or not math.isfinite(value)):
+            raise ValidationError(f"Setup4 {name} must be a number of mm, not {value!r}")
+    return {
+        "Setup4 - Click to Zero Vertical Position Dial": "Yes" if zero is None else zero,
+        "Setup4 - Click to record vertical deflection": "Yes" if settled is None else settled,
+        "Setup4 - Peak Vertical Deflection": peak,
+    }
+
+
+def motion_result(setup, trace, rate):
+    """Return Setup #6 or #8's results: the recorded trace file (see ``motion.py``) and its readings per second."""
+    if setup not in MOTION_SETUPS:
+        raise ValidationError(f"Setup #{setup} records no motion trace")
+    if not trace or not isinstance(trace, str):
+        raise ValidationError(f"Setup{setup} trace must be the path of the recorded trace, not {trace!r}")
+    if isinstance(rate, bool) or not isinstance(rate, (int, float)) or not rate > 0:
+        raise ValidationError(f"Setup{setup} sample rate must be a positive number, not {rate!r}")
+    return {
+        f"Setup{setup} - Motion Trace": trace,
+        f"Setup{setup} - Motion Sample Rate": rate,
+    }
+
+
+def setup_number(setup_text):
+    """The number of a setup from its button text: 4 for "Test Setup #4:Deflection, vertical"."""
+    try:
+        return int(setup_text.split("#", 1)[1].split(":", 1)[0])
+    except (IndexError, ValueError):
+        raise ValidationError(f"not a test setup: {setup_text!r}") from None
+
+
+def completed_result(setups):
+    """Return the setups marked completed so far (their numbers) as sessions store them: "2, 4"."""
+    return {COMPLETED_KEY: ", ".join(str(setup) for setup in sorted(setups))}
+
+
+def completed_setups(record):
+    """The numbers of the setups a stored record was marked completed for (none for older records)."""
+    value = record.get(COMPLETED_KEY)
+    if not value or not isinstance(value, str):
+        return set()
+    return {int(part) for part in value.split(",") if part.strip().isdigit()}
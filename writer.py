@@ -0,0 +1,203 @@
+"""Write-behind queue that keeps persistence off the Qt UI thread.
+
+Button handlers hand their data to ``StoreWriter`` and return immediately. A
+dedicated thread collects the pending operations for a short window, merges
+repeated updates to the same session (a double-click just merges into the
+queued update) and writes them to the store as one batch. An ``after_write`` callable, if
+given, is called on that thread with the store and each batch once it is
+written (``aggregates.AggregateUpdater`` counts it for the dashboard); its
+errors are reported but do not fail the batch. ``close`` says whether
+everything made it to the store, so the caller knows whether to keep the
+session's journal.
+
+A batch the store fails to write is put back and retried every
+``RETRY_DELAY``, unless the store refuses it for good (``PERMANENT_ERRORS``:
+an update for a session it does not know, a version conflict): then each
+operation is written on its own, and those refused are appended to
+``user_details.dropped.ndjson`` and reported once, so they never hold up
+the saves queued with them.
+
+``restore_session`` queues a session picked up from ``journal.py`` after a
+crash: the writer thread checks whether its create reached the store and
+writes it as a create or an update, so the check never holds up start-up.
+"""
+import json
+import threading
+import time
+
+from PySide6.QtCore import QObject, Signal
+
+from storage import ConflictError
+
+FLUSH_DELAY = 0.05  # Seconds to wait for more work before writing a batch
+RETRY_DELAY = 1.0  # Seconds to wait before retrying a failed batch
+PERMANENT_ERRORS = (KeyError, ValueError, ConflictError)  # Raised again however often a write is retried
+DROPPED_PATH = "user_details.dropped.ndjson"  # Operations the store refused, one JSON line each
+
+
+class StoreWriter(QObject):
+    flushed = Signal(int)  # Number of operations written in a batch
+    failed = Signal(str)  # Error message of a batch that could not be written, or an operation dropped
+
+    def __init__(self, store, after_write=None, dropped_path=DROPPED_PATH):
+        super().__init__()
+        self.store = store
+        self.after_write = after_write  # Called with (store, batch) after each batch is written
+        self.dropped_path = dropped_path
+        self.dropped = 0  # Operations refused by the store
+        self.pending = {}  # session_id -> [op, data], kept in arrival order
+        self.writing = False
+        self.stopping = False
+        self.failures = 0
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, name="StoreWriter", daemon=True)
+        self.thread.start()
+
+    def create_session(self, record):
+        """Queue a new session and return its id straight away."""
+        import uuid  # Not needed until the first session, so kept off start-up
+
+        session_id = uuid.uuid4().hex
+        with self.condition:
+            self.pending[session_id] = ["create", dict(record)]
+            self.condition.notify()
+        return session_id
+
+    def restore_session(self, session_id, record):
+        """Queue a session whose saves may have been lost, to be created or updated in full."""
+        with self.condition:
+            self.pending[session_id] = ["restore", dict(record)]
+            self.condition.notify()
+
+    def update_session(self, session_id, data):
+        """Queue an update, merging it into any pending write for the same session."""
+        with self.condition:
+            if session_id in self.pending:
+                self.pending[session_id][1].update(data)
+            else:
+                self.pending[session_id] = ["update", dict(data)]
+            self.condition.notify()
+
+    def flush(self):
+        """Block until everything queued so far has been written (or failed)."""
+        with self.condition:
+            failures = self.failures
+            while ((self.pending or self.writing) and self.failures == failures
+                   and self.thread.is_alive()):
+                self.condition.wait(0.1)
+
+    def close(self):
+        """Flush outstanding writes and stop the writer thread; return whether everything was written."""
+        with self.condition:
+            self.stopping = True
+            self.condition.notify()
+        self.thread.join()
+        with self.condition:
+            return not self.pending and not self.dropped
+
+    def _take_batch(self):
+        """Wait for work and return the pending operations, or None to stop."""
+        with self.condition:
+            while not self.pending and not self.stopping:
+                self.condition.wait()
+            if not self.pending:
+                return None
+            # Give a burst of clicks a moment to coalesce into one batch
+            deadline = time.monotonic() + FLUSH_DELAY
+            while not self.stopping and time.monotonic() < deadline:
+                self.condition.wait(deadline - time.monotonic())
+            batch = [(op, session_id, data) for session_id, (op, data) in self.pending.items()]
+            self.pending = {}
+            self.writing = True
+            return batch
+
+    def _requeue(self, batch):
+        """Put a failed batch back in front of anything queued since."""
+        with self.condition:
+            pending = {session_id: [op, data] for op, session_id, data in batch}
+            for session_id, (op, data) in self.pending.items():
+                if session_id in pending:
+                    pending[session_id][1].update(data)
+                else:
+                    pending[session_id] = [op, data]
+            self.pending = pending
+
+    def _resolve(self, batch):
+        """Turn restored sessions into creates or updates, depending on whether the store has them."""
+        resolved = []
+        for op, session_id, data in batch:
+            if op == "restore":
+                try:
+                    op = "update" if self.store.get_session(session_id) else "create"
+                except KeyError:
+                    op = "create"
+            resolved.append((op, session_id, data))
+        return resolved
+
+    def _write(self, batch):
+        """Write ``batch``; return ``(written, unwritten, error)``.
+
+        Operations the store refuses for good are dropped (see ``_drop``) and
+        the rest written one by one. ``unwritten`` is what is left to retry
+        after a transient ``error``, which is None if there was none.
+        """
+        try:
+            batch = self._resolve(batch)
+            self.store.write_batch(batch)
+            return batch, [], None
+        except PERMANENT_ERRORS:
+            pass  # Find the operations at fault
+        except Exception as e:
+            return [], batch, e
+        written = []
+        for position, operation in enumerate(batch):
+            try:
+                self.store.write_batch([operation])
+            except PERMANENT_ERRORS as e:
+                self._drop(operation, e)
+            except Exception as e:
+                return written, batch[position:], e
+            else:
+                written.append(operation)
+        return written, [], None
+
+    def _drop(self, operation, error):
+        """Set aside an operation the store refuses, and report it once."""
+        op, session_id, data = operation
+        with open(self.dropped_path, "a") as f:
+            f.write(json.dumps({"op": op, "id": session_id, "data": data, "error": repr(error)}) + "\n")
+        with self.condition:
+            self.dropped += 1
+        self.failed.emit(f"the store refused the {op} of session {session_id} ({error!r}); "
+                         f"it was set aside in {self.dropped_path}")
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            written, unwritten, error = self._write(batch)
+            if written and self.after_write is not None:
+                try:
+                    self.after_write(self.store, written)
+                except Exception as e:  # Saved all the same; aggregates.sync or check catch up later
+                    print(f"After-write hook failed: {e}")
+            if error is None:
+                with self.condition:
+                    self.writing = False
+                    self.condition.notify_all()
+                self.flushed.emit(len(written))
+                continue
+            with self.condition:
+                self.failures += 1
+                self.condition.notify_all()
+            self.failed.emit(str(error))
+            self._requeue(unwritten)
+            if self.stopping:
+                with self.condition:
+                    self.writing = False
+                    self.condition.notify_all()
+                return  # Already reported; left pending so close() says it was not written
+            with self.condition:
+                self.writing = False
+                self.condition.wait(RETRY_DELAY)